@@ -6,16 +6,21 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import streamlit as st
-import cv2
-import tempfile
 import time
 import pandas as pd
 import numpy as np
 import base64
-from datetime import datetime
 
 # Now this will work even though app.py is inside /backend
-from core.detection.vehicle_detector import VehicleDetector
+from core.density.density_calculator import DensityCalculator
+from core.metrics.registry import REGISTRY, STAGE_SECONDS
+from core.pipeline.engine import FramePipeline
+from core.render.preview import ChangeFilter, PreviewEncoder
+from core.scheduling.motion_gate import MotionGate
+from core.timeseries.ring_buffer import TimeSeriesRing, frame_row
+from config import settings
+from utils.helpers import (TREND_WINDOWS, finish_recorder, ingest_upload, load_analytics, load_server,
+                           render_trend, start_recorder)
 
 # -------------------------------------------------
 # 1. PAGE CONFIG & UI STYLING (RESTORED)
@@ -23,10 +28,10 @@ from core.detection.vehicle_detector import VehicleDetector
 st.set_page_config(page_title="Traffic AI Pro", layout="wide", page_icon="🚦")
 
 
-def apply_global_glow(color_hex, is_emergency=False):
+def apply_global_glow(color_hex, is_emergency=False, target=st):
     """Restored past glow logic with an added pulse for emergency priority."""
     animation = "pulse 0.4s infinite" if is_emergency else "none"
-    st.markdown(f"""
+    target.markdown(f"""
         <style>
         @keyframes pulse {{
             0% {{ background-color: rgba(255, 0, 0, 0.05); }}
@@ -44,20 +49,11 @@ def apply_global_glow(color_hex, is_emergency=False):
     """, unsafe_allow_html=True)
 
 
-# -------------------------------------------------
-# SAFE CSV PATH (CLOUD + LOCAL)
-# -------------------------------------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CSV_FILE = os.path.join(BASE_DIR, "analytics", "vehicles.csv")
-os.makedirs(os.path.dirname(CSV_FILE), exist_ok=True)
-
+server = load_server()
 
-@st.cache_resource
-def load_assets():
-    return VehicleDetector()
 
+SIGNAL_COLORS = {"emergency": "#FF0000", "red": "#e74c3c", "yellow": "#f1c40f", "green": "#2ecc71"}
 
-detector = load_assets()
 
 # -------------------- 2. LOGIN LOGIC (SAME AS PAST) --------------------
 if "logged_in" not in st.session_state:
@@ -82,6 +78,14 @@ if "run" not in st.session_state: st.session_state.run = False
 # Essential for cumulative counting
 if "ids" not in st.session_state: st.session_state.ids = set()
 if "signal_color" not in st.session_state: st.session_state.signal_color = "#2ecc71"
+if "pipeline" not in st.session_state: st.session_state.pipeline = None
+
+
+def stop_pipeline():
+    if st.session_state.pipeline is not None:
+        st.session_state.pipeline.stop()
+        st.session_state.pipeline = None
+        st.session_state.client.close()
 
 # -------------------------------------------------
 # 4. MAIN INTERFACE (RESTORED PAST UI)
@@ -93,15 +97,33 @@ if st.sidebar.button("🚪 Logout"):
 
 conf_val = st.sidebar.slider("AI Confidence", 0.1, 1.0, 0.35)
 frame_skip = st.sidebar.slider("Frame Skip", 1, 10, 2)
+adaptive_skip = st.sidebar.checkbox("Motion-adaptive skipping", value=settings.ADAPTIVE_SKIP,
+                                    help="Applies from the next Start")
 clearance_rate = st.sidebar.number_input("Sec/Vehicle", value=2.5)
 
 uploaded_file = st.sidebar.file_uploader("Upload Traffic Video", type=["mp4", "avi", "mov"])
 
 st.title("🚦 Traffic Density Analysis & Adaptive Signal Control")
-apply_global_glow(st.session_state.signal_color)
+# One slot for the style block: updates replace it instead of stacking new <style> elements
+glow_box = st.empty()
+apply_global_glow(st.session_state.signal_color, target=glow_box)
 
 tab1, tab2, tab3 = st.tabs(["🚥 Live Traffic", "📊 Analytics", "🧠 System Info"])
 
+# Created before the live loop so it can be refreshed while the loop runs
+with tab3:
+    metrics_box = st.empty()
+
+
+def render_live_metrics():
+    rows = REGISTRY.snapshot()
+    if rows:
+        metrics_box.dataframe(pd.DataFrame(rows, columns=["Metric", "Labels", "Value"]),
+                              use_container_width=True, hide_index=True)
+    else:
+        metrics_box.info("No metrics recorded yet. Start an analysis to populate them.")
+
+
 # ======================================================
 # TAB 1: LIVE TRAFFIC
 # ======================================================
@@ -115,126 +137,148 @@ with tab1:
             video_placeholder = st.empty()
             c1, c2 = st.columns(2)
             if c1.button("▶ Start Analysis", use_container_width=True):
+                stop_pipeline()
+                # A run still going is saved before its counts are cleared
+                finish_recorder(round(len(st.session_state.ids) * clearance_rate, 2))
                 st.session_state.run = True
                 st.session_state.ids = set()  # Clear previous run counts
 
             if c2.button("⏹ Stop & Save", use_container_width=True):
                 st.session_state.run = False
+                stop_pipeline()
                 total_unique = len(st.session_state.ids)
+                signal_time = round(total_unique * clearance_rate, 2)
 
-                log_entry = {
-                    "Date": datetime.now().strftime("%Y-%m-%d"),
-                    "Time": datetime.now().strftime("%H:%M:%S"),
-                    "Total_Vehicles": total_unique,
-                    "Signal_Time_Sec": round(total_unique * clearance_rate, 2)
-                }
-                pd.DataFrame([log_entry]).to_csv(
-                    CSV_FILE,
-                    mode='a',
-                    index=False,
-                    header=not os.path.exists(CSV_FILE)
-                )
+                if not finish_recorder(signal_time):
+                    run_id = load_analytics().start_run(uploaded_file.name)
+                    load_analytics().finish_run(run_id, total_unique, signal_time)
                 st.success(f"✅ Data Logged! Total Unique Vehicles: {total_unique}")
 
         with col_metrics:
             st.subheader("📌 Live Metrics")
             dens_m = st.empty()
             total_m = st.empty()
+            occ_m = st.empty()
             status_box = st.empty()
 
-        if st.session_state.run:
-            # ---------------- SAFE TEMP VIDEO HANDLING ----------------
-            with tempfile.NamedTemporaryFile(delete=False) as tfile:
-                tfile.write(uploaded_file.read())
-                video_path = tfile.name
-
-            cap = cv2.VideoCapture(video_path)
-            frame_counter = 0
-
-            while cap.isOpened() and st.session_state.run:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                frame_counter += 1
-
-                if frame_counter % frame_skip == 0:
-                    detections, is_emergency = detector.process_frame(frame, conf_val)
-
-                    norm_count = 0
-                    for d in detections:
-                        if d["type"] == "normal":
-                            norm_count += 1
-                            st.session_state.ids.add(d["id"])
-
-                    if is_emergency:
-                        st.session_state.signal_color = "#FF0000"
-                        status_box.error("🚨 EMERGENCY VEHICLE DETECTED")
-                    else:
-                        if norm_count > 15:
-                            st.session_state.signal_color = "#e74c3c"
-                        elif norm_count > 5:
-                            st.session_state.signal_color = "#f1c40f"
-                        else:
-                            st.session_state.signal_color = "#2ecc71"
+        trend_window = st.radio("📈 Trend", list(TREND_WINDOWS), horizontal=True)
+        trend_box = st.empty()
+        if st.session_state.get("trend") is not None:
+            render_trend(trend_box, st.session_state.trend, trend_window)
 
-                        if norm_count > 15:
+        if st.session_state.run:
+            pipeline = st.session_state.get("pipeline")
+            if pipeline is None:
+                video_path = ingest_upload(uploaded_file)
+                run_ids = st.session_state.ids
+                recorder = start_recorder(uploaded_file.name)
+                st.session_state.density_calc = DensityCalculator(lanes=settings.LANE_POLYGONS)
+                st.session_state.trend = TimeSeriesRing()
+
+                def on_inference(packet):
+                    run_ids.update(packet.detections.normal_ids().tolist())
+                    recorder.observe(packet.detections)
+
+                # One server batches every session's frames into shared model calls;
+                # tracks and cascade state stay per client
+                if st.session_state.get("client") is not None:
+                    st.session_state.client.close()  # left over from a run that ended without Stop
+                client = server.client(video_path=video_path)
+                st.session_state.client = client
+
+                pipeline = FramePipeline(
+                    video_path,
+                    client.process_frame,
+                    on_inference=on_inference,
+                    batch_fn=client.process_batch,
+                    batch_size=settings.INFERENCE_BATCH_SIZE,
+                    display_size=settings.PREVIEW_SIZE,
+                    render_fn=PreviewEncoder(settings.PREVIEW_FORMAT, settings.PREVIEW_QUALITY),
+                    display_fps=settings.PREVIEW_FPS,
+                    idle_timeout=settings.PIPELINE_IDLE_TIMEOUT_S,
+                    scheduler=MotionGate(max_interval=settings.MAX_SKIP_INTERVAL,
+                                         low_motion=settings.MOTION_LOW,
+                                         high_motion=settings.MOTION_HIGH,
+                                         probe_interval=settings.MOTION_PROBE_INTERVAL) if adaptive_skip else None,
+                ).start()
+                st.session_state.pipeline = pipeline
+
+            # Slider changes apply to the running pipeline without restarting the video
+            pipeline.conf = conf_val
+            pipeline.frame_skip = frame_skip
+
+            # The script thread only consumes rendered frames; decode, inference and
+            # rendering overlap on the pipeline's own threads. Styles and metrics are
+            # only pushed to the browser when their value actually changes.
+            ui = ChangeFilter()
+            next_metrics = 0.0
+            while st.session_state.run and not pipeline.finished:
+                packet = pipeline.read(timeout=1.0)
+                if packet is None:
+                    continue
+
+                if packet.inferred:
+                    detections, is_emergency = packet.detections, packet.is_emergency
+                    norm_count = detections.normal_count
+
+                    signal = ("emergency" if is_emergency else "red" if norm_count > 15
+                              else "yellow" if norm_count > 5 else "green")
+                    st.session_state.signal_color = SIGNAL_COLORS[signal]
+                    if ui.changed("signal", signal):
+                        if signal == "emergency":
+                            status_box.error("🚨 EMERGENCY VEHICLE DETECTED")
+                        elif signal == "red":
                             status_box.error("🔴 RED – High Density")
-                        elif norm_count > 5:
+                        elif signal == "yellow":
                             status_box.warning("🟡 YELLOW – Medium Density")
                         else:
                             status_box.success("🟢 GREEN – Low Density")
+                        apply_global_glow(st.session_state.signal_color, is_emergency, glow_box)
+
+                    if ui.changed("density", norm_count):
+                        dens_m.metric("🚗 Frame Density", norm_count)
+                    if ui.changed("total", len(st.session_state.ids)):
+                        total_m.metric("📈 Cumulative Total", len(st.session_state.ids))
+                    _, occupancy, _ = st.session_state.density_calc.calculate_occupancy(detections, packet.shape)
+                    if ui.changed("occupancy", f"{occupancy:.0%}"):
+                        occ_m.metric("📐 Lane Occupancy", f"{occupancy:.0%}")
 
-                    apply_global_glow(st.session_state.signal_color, is_emergency)
-
-                    dens_m.metric("🚗 Frame Density", norm_count)
-                    total_m.metric("📈 Cumulative Total", len(st.session_state.ids))
-                    st.session_state.last_detections = detections
-                else:
-                    detections = st.session_state.get("last_detections", [])
-
-                display_frame = cv2.resize(frame, (854, 480))
-                scale_x = 854 / frame.shape[1]
-                scale_y = 480 / frame.shape[0]
-
-                for d in detections:
-                    x1, y1, x2, y2 = d["box"]
-                    color = (0, 0, 255) if d["type"] == "emergency" else (0, 255, 0)
-                    cv2.rectangle(
-                        display_frame,
-                        (int(x1 * scale_x), int(y1 * scale_y)),
-                        (int(x2 * scale_x), int(y2 * scale_y)),
-                        color,
-                        2
-                    )
-
-                video_placeholder.image(
-                    cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB),
-                    use_container_width=True
-                )
-                time.sleep(0.01)
-
-            cap.release()
+                    st.session_state.trend.append(time.time(), frame_row(detections, occupancy, signal))
+
+                # Encoded, rate-limited previews only; analysed frames between them carry display=None
+                if packet.display is not None:
+                    with STAGE_SECONDS.labels(stage="display").time():
+                        video_placeholder.image(packet.display, use_container_width=True)
+
+                if time.monotonic() >= next_metrics:
+                    render_live_metrics()
+                    render_trend(trend_box, st.session_state.trend, trend_window)
+                    next_metrics = time.monotonic() + 1.0
+
+            if pipeline.error is not None:
+                st.error(f"Analysis stopped: {pipeline.error}")
 
 # ======================================================
 # TAB 2: ANALYTICS (FIXED FOR PARSERERROR)
 # ======================================================
 with tab2:
     st.subheader("📊 Historical Traffic Comparison")
-    if os.path.exists(CSV_FILE):
-        try:
-            df = pd.read_csv(CSV_FILE, on_bad_lines='skip')
-            if not df.empty:
-                df['Execution'] = df['Date'] + " " + df['Time']
-                st.write("### Total Vehicles Per Execution Cycle")
-                st.bar_chart(df.set_index("Execution")["Total_Vehicles"])
-
-                st.divider()
-                st.write("### 📜 Raw Execution History")
-                st.dataframe(df, use_container_width=True)
-            else:
-                st.info("No data in CSV yet.")
-        except Exception as e:
-            st.error(f"Error reading history: {e}")
+    analytics = load_analytics()
+    df = analytics.runs()
+    if not df.empty:
+        df['Execution'] = df['Date'] + " " + df['Time']
+        st.write("### Total Vehicles Per Execution Cycle")
+        st.bar_chart(df.set_index("Execution")["total_vehicles"])
+
+        period = st.radio("Rollup", ["hour", "day"], horizontal=True)
+        rollup = analytics.rollup(period)
+        if not rollup.empty:
+            st.write(f"### New Vehicles per {period.title()}")
+            st.bar_chart(rollup.pivot_table(index="bucket", columns="approach", values="vehicles", aggfunc="sum"))
+
+        st.divider()
+        st.write("### 📜 Raw Execution History")
+        st.dataframe(df.drop(columns=["started_at", "ended_at"]), use_container_width=True)
     else:
         st.info("No data available. Complete an analysis run to see charts.")
 
@@ -242,9 +286,10 @@ with tab2:
 # TAB 3: SYSTEM INFO
 # ======================================================
 with tab3:
-    st.markdown("""
-    **Accuracy & Logic:**
-    * **ID Persistence:** Uses ByteTrack IDs to ensure a vehicle is only counted once for the entire video run.
-    * **Dynamic Scaling:** Bounding boxes are scaled from original video resolution to UI display resolution.
-    * **Error Resiliency:** The CSV loader skips corrupt lines to ensure the Analytics tab always works.
-    """)
+    render_live_metrics()
+    if settings.METRICS_PORT:
+        st.caption(f"Prometheus endpoint: http://127.0.0.1:{settings.METRICS_PORT}/metrics")
+
+    st.write("### 🚑 Emergency Detection")
+    client = st.session_state.get("client")
+    st.json(client.emergency_report() if client is not None else server.detector.emergency_report())
@@ -0,0 +1,84 @@
+import sys
+import os
+
+# Same path fix as app.py: make 'core' importable when run from backend/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+
+from config import settings
+from core.batch.archive import ArchiveProcessor, find_videos
+from core.detection.backends import export_model
+from core.detection.vehicle_detector import EMERGENCY_WEIGHTS, TRAFFIC_WEIGHTS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyse recorded videos without the dashboard: segments run across a process pool, "
+                    "results go to per-video CSV / JSON files, and an interrupted job resumes where it stopped.")
+    parser.add_argument("inputs", nargs="+", help="video files and/or directories of videos")
+    parser.add_argument("--out", default=settings.BATCH_OUTPUT_DIR, help="output and checkpoint directory")
+    parser.add_argument("--conf", type=float, default=settings.CONFIDENCE_THRESHOLD)
+    parser.add_argument("--frame-skip", type=int, default=1)
+    parser.add_argument("--segment-seconds", type=float, default=settings.BATCH_SEGMENT_SECONDS)
+    parser.add_argument("--overlap", type=int, default=settings.BATCH_OVERLAP_FRAMES,
+                        help="frames shared by neighbouring segments, used to stitch track IDs")
+    parser.add_argument("--interval", type=float, default=settings.ANALYTICS_INTERVAL_S,
+                        help="seconds of video per output row")
+    parser.add_argument("--workers", type=int, default=None, help="default: cores / threads-per-worker")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=settings.INFERENCE_BATCH_SIZE)
+    parser.add_argument("--annotate", action="store_true", help="also write annotated clips per segment")
+    args = parser.parse_args()
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        parser.error("no videos found")
+
+    # Export once up front so the workers do not all race to build the same artifact
+    for weights in (TRAFFIC_WEIGHTS, EMERGENCY_WEIGHTS):
+        export_model(weights, settings.INFERENCE_BACKEND, settings.INFERENCE_INT8,
+                     settings.INFERENCE_CALIBRATION_VIDEO)
+    processor = ArchiveProcessor(
+        args.out,
+        detector_kwargs={
+            "batch_size": args.batch_size,  # archives: throughput over latency
+            "tracker": settings.TRACKER,
+            "emergency_mode": settings.EMERGENCY_MODE,
+            "sweep_interval": settings.EMERGENCY_SWEEP_INTERVAL,
+            "recheck_interval": settings.EMERGENCY_RECHECK_INTERVAL,
+            "backend": settings.INFERENCE_BACKEND,
+            "int8": settings.INFERENCE_INT8,
+            "calibration_video": settings.INFERENCE_CALIBRATION_VIDEO,
+            "roi": settings.INFERENCE_ROI,
+            "inference_sizes": settings.INFERENCE_SIZES,
+            "cache_dir": settings.DETECTION_CACHE_DIR or None,
+            "cache_quota_mb": settings.DETECTION_CACHE_QUOTA_MB,
+            "cache_min_conf": settings.DETECTION_CACHE_MIN_CONF,
+        },
+        conf=args.conf,
+        frame_skip=args.frame_skip,
+        segment_s=args.segment_seconds,
+        overlap=args.overlap,
+        interval_s=args.interval,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        annotate=args.annotate,
+    )
+    print(f"{len(videos)} video(s), {processor.workers} worker(s) x {processor.threads_per_worker} thread(s)")
+
+    t0 = time.perf_counter()
+    try:
+        summaries = processor.run(videos)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume")
+        return
+    for video, summary in summaries.items():
+        print(f"{video}: {summary['unique_vehicles']} vehicles over {summary['duration_s']:.0f}s of video "
+              f"({summary['segments']} segment(s), {summary['stitched_tracks']} track(s) stitched)")
+    print(f"Finished in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,122 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 VIDEO_PATH = os.getenv("VIDEO_PATH", "data/raw/traffic_video.mp4")
 MODEL_PATH = "models/yolov8n.pt"
 
 CONFIDENCE_THRESHOLD = 0.5
 DETECTION_CLASSES = [2, 3, 5, 7]
 
+# Frames per stacked model call (VehicleDetector.process_batch / offline analysis)
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", 8))
+
+# Inference runtime: "torch" (eager PyTorch, CUDA when available), or the CPU-optimized
+# "onnx" / "openvino" exports, built next to the weights on first use. INT8 quantization
+# is calibrated on frames from INFERENCE_CALIBRATION_VIDEO (by default VIDEO_PATH, under
+# BASE_DIR unless absolute, so it does not depend on the working directory).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "0") == "1"
+INFERENCE_CALIBRATION_VIDEO = os.getenv("INFERENCE_CALIBRATION_VIDEO", os.path.join(BASE_DIR, VIDEO_PATH))
+
+# Region of interest the models see, as INFERENCE_ROI: unset (whole frame), a JSON box
+# "[x1, y1, x2, y2]", a JSON polygon "[[x, y], ...]" or a mask image path (white = road).
+# Boxes are mapped back to full-frame pixels.
+def _parse_roi(value):
+    if not value:
+        return None
+    if not value.lstrip().startswith("["):
+        return value  # mask image path
+    points = json.loads(value)
+    if all(isinstance(v, (int, float)) for v in points):
+        return tuple(points)
+    return [tuple(p) for p in points]
+
+
+INFERENCE_ROI = _parse_roi(os.getenv("INFERENCE_ROI"))
+# Inference sizes, e.g. INFERENCE_SIZES="480,640". One size by default; with several, the
+# size follows the smoothed vehicle count (opt-in: the smaller size sees fewer small or
+# distant vehicles, which keeps the count, and so the size, low)
+INFERENCE_SIZES = tuple(int(s) for s in os.getenv("INFERENCE_SIZES", "640").split(","))
+
+# Cross-session micro-batching (core.serving): the dashboards queue every session's frames
+# into shared model calls of up to SERVING_MAX_BATCH frames, holding a batch at most
+# SERVING_MAX_WAIT_MS for other sessions to join; a session may queue SERVING_MAX_PENDING requests
+SERVING_MAX_BATCH = int(os.getenv("SERVING_MAX_BATCH", 16))
+SERVING_MAX_WAIT_MS = float(os.getenv("SERVING_MAX_WAIT_MS", 10))
+SERVING_MAX_PENDING = 2
+# A session's pipeline stops once its page has read nothing for PIPELINE_IDLE_TIMEOUT_S
+# (tab closed mid-run); its inference client is closed after as long without requests
+PIPELINE_IDLE_TIMEOUT_S = 30
+
+# Multi-object tracker: "iou" (vectorised NumPy, per-stream state) or "bytetrack" (ultralytics)
+TRACKER = os.getenv("TRACKER", "iou")
+
+# Motion-gated frame skipping: the Frame Skip slider becomes the base interval, static
+# or empty scenes drop to one analysed frame per MAX_SKIP_INTERVAL, busy scenes to every frame
+ADAPTIVE_SKIP = os.getenv("ADAPTIVE_SKIP", "1") == "1"
+MAX_SKIP_INTERVAL = 15
+MOTION_LOW = 0.002    # fraction of changed probe pixels below which a scene counts as static
+MOTION_HIGH = 0.02    # ... and above which every frame is analysed
+# While the scene is calm only every MOTION_PROBE_INTERVAL-th frame is decoded (to probe
+# motion); the rest are grabbed. Motion is then measured over that gap, so it reads a
+# little high, which errs on the side of analysing more. 1 decodes every frame.
+MOTION_PROBE_INTERVAL = int(os.getenv("MOTION_PROBE_INTERVAL", 3))
+
+# Live preview sent to the browser: encoded once on the render thread ("jpeg" or "webp"),
+# and capped at PREVIEW_FPS whatever the analysis rate (lower both for weak links)
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "jpeg")
+PREVIEW_QUALITY = int(os.getenv("PREVIEW_QUALITY", 70))
+PREVIEW_SIZE = (854, 480)
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", 12))
+
+# Lane polygons in source-video pixels for occupancy, e.g. {"lane_1": [(x, y), ...]}.
+# Empty: the whole frame is one lane.
+LANE_POLYGONS = {}
+
 MIN_GREEN_TIME = 10
 MAX_GREEN_TIME = 60
-VEHICLE_UNIT_TIME = 2
\ No newline at end of file
+VEHICLE_UNIT_TIME = 2
+
+# Emergency-vehicle detection: "full" runs the emergency model on every frame; opt in to
+# "cascade" to run it only on new/stale car-bus-truck crops plus a full-frame sweep every
+# EMERGENCY_SWEEP_INTERVAL frames (emergency vehicles outside those crops are seen late)
+EMERGENCY_MODE = os.getenv("EMERGENCY_MODE", "full")
+EMERGENCY_SWEEP_INTERVAL = 30     # frames between full-frame sweeps
+EMERGENCY_RECHECK_INTERVAL = 15   # frames before a track's crop is checked again
+
+# Raw detections per (video hash, frame, model), recorded at DETECTION_CACHE_MIN_CONF so
+# replays and any higher confidence threshold skip inference. Opt-in: off while
+# DETECTION_CACHE_DIR is empty (e.g. set it to backend/data/detection_cache); every
+# analysed frame is then written to disk, LRU-evicted past DETECTION_CACHE_QUOTA_MB
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "")
+DETECTION_CACHE_QUOTA_MB = int(os.getenv("DETECTION_CACHE_QUOTA_MB", 512))
+DETECTION_CACHE_MIN_CONF = 0.1
+
+# Content-addressed store for uploaded videos (LRU-evicted past the quota)
+VIDEO_STORE_DIR = os.getenv("VIDEO_STORE_DIR", os.path.join(BASE_DIR, "data", "uploads"))
+VIDEO_STORE_QUOTA_MB = int(os.getenv("VIDEO_STORE_QUOTA_MB", 2048))
+
+# Run history and per-interval counts (SQLite). The CSVs the pages used to append to
+# are imported once on startup; app.py wrote backend/analytics/, main.py the working dir.
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", os.path.join(BASE_DIR, "analytics", "traffic.db"))
+ANALYTICS_INTERVAL_S = 60
+LEGACY_CSV_PATHS = [
+    os.path.join(BASE_DIR, "analytics", "vehicles.csv"),
+    os.path.join(BASE_DIR, "vehicles.csv"),
+    os.path.join(os.path.dirname(BASE_DIR), "vehicles.csv"),
+]
+
+# Headless archive processing (batch_process.py): videos are cut into segments that run
+# in parallel; neighbouring segments share BATCH_OVERLAP_FRAMES frames to stitch track IDs
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", os.path.join(BASE_DIR, "analytics", "batch"))
+BATCH_SEGMENT_SECONDS = 300
+BATCH_OVERLAP_FRAMES = 30
+
+# Local Prometheus-format metrics endpoint (0 disables) and optional periodic text dump
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
@@ -1,13 +1,17 @@
 import streamlit as st
-import cv2
-import tempfile
 import time
 import pandas as pd
-import os
 import matplotlib.pyplot as plt
-from datetime import datetime
-from core.detection import VehicleDetector
+from core.density.density_calculator import DensityCalculator
+from core.metrics.registry import REGISTRY, STAGE_SECONDS
+from core.pipeline.engine import FramePipeline
+from core.render.preview import ChangeFilter, PreviewEncoder
+from core.scheduling.motion_gate import MotionGate
+from core.timeseries.ring_buffer import TimeSeriesRing, frame_row
 from signal_control.signal_logic import SignalController
+from config import settings
+from utils.helpers import (TREND_WINDOWS, finish_recorder, ingest_upload, load_analytics, load_server,
+                           render_trend, start_recorder)
 
 # -------------------------------------------------
 # 1. PAGE CONFIG & ASSET LOADING
@@ -18,16 +22,13 @@ st.set_page_config(
     page_icon="🚦"
 )
 
-CSV_FILE = "vehicles.csv"
-os.makedirs("analytics", exist_ok=True)
-
 
 @st.cache_resource
-def load_assets():
-    return VehicleDetector(), SignalController()
+def load_controller():
+    return SignalController()
 
 
-detector, controller = load_assets()
+server, controller = load_server(), load_controller()
 
 
 # -------------------------------------------------
@@ -62,6 +63,16 @@ if "execution_data" not in st.session_state:
     st.session_state.execution_data = {"all_vehicle_ids": set()}
 if "frame_count" not in st.session_state:
     st.session_state.frame_count = 0
+if "pipeline" not in st.session_state:
+    st.session_state.pipeline = None
+
+
+def stop_pipeline():
+    if st.session_state.pipeline is not None:
+        st.session_state.pipeline.stop()
+        st.session_state.pipeline = None
+        st.session_state.client.close()
+
 
 # -------------------------------------------------
 # 4. SIDEBAR CONTROLS
@@ -74,6 +85,8 @@ if st.sidebar.button("🚪 Logout"):
 st.sidebar.divider()
 conf_val = st.sidebar.slider("AI Confidence Threshold", 0.1, 1.0, 0.35)
 frame_skip = st.sidebar.slider("Frame Skip", 1, 10, 2)
+adaptive_skip = st.sidebar.checkbox("Motion-adaptive skipping", value=settings.ADAPTIVE_SKIP,
+                                    help="Applies from the next Start")
 clearance_rate = st.sidebar.number_input("Seconds per Vehicle", value=2.5)
 
 uploaded_file = st.sidebar.file_uploader("Upload Traffic Video", type=["mp4", "avi", "mov"])
@@ -87,6 +100,21 @@ st.divider()
 
 tab1, tab2, tab3 = st.tabs(["🚘 Live Traffic", "📊 Analytics", "🧠 System Info"])
 
+# Created before the live loop so it can be refreshed while the loop runs
+with tab3:
+    st.subheader("📈 Live Performance")
+    metrics_box = st.empty()
+
+
+def render_live_metrics():
+    rows = REGISTRY.snapshot()
+    if rows:
+        metrics_box.dataframe(pd.DataFrame(rows, columns=["Metric", "Labels", "Value"]),
+                              use_container_width=True, hide_index=True)
+    else:
+        metrics_box.info("No metrics recorded yet. Start an analysis to populate them.")
+
+
 # ======================================================
 # TAB 1: LIVE TRAFFIC
 # ======================================================
@@ -107,96 +135,148 @@ with tab1:
             st.subheader("📌 Live Metrics")
             dens_m = st.metric("🚗 Current Frame Density", "0")
             time_m = st.metric("⏱ Clearance Time", "0s")
+            occ_m = st.metric("📐 Lane Occupancy", "0%")
             signal_status = st.empty()
 
+        trend_window = st.radio("📈 Trend", list(TREND_WINDOWS), horizontal=True)
+        trend_box = st.empty()
+        if st.session_state.get("trend") is not None:
+            render_trend(trend_box, st.session_state.trend, trend_window)
+
         if start_btn:
+            stop_pipeline()
+            # A run still going is saved before its counts are cleared
+            finish_recorder(round(len(st.session_state.execution_data["all_vehicle_ids"]) * clearance_rate, 2))
             st.session_state.run = True
             st.session_state.execution_data["all_vehicle_ids"].clear()
             st.session_state.frame_count = 0
 
         if stop_btn:
             st.session_state.run = False
+            stop_pipeline()
             total_unique = len(st.session_state.execution_data["all_vehicle_ids"])
-            total_signal_time = total_unique * clearance_rate
-
-            log_entry = {
-                "Date": datetime.now().strftime("%Y-%m-%d"),
-                "Time": datetime.now().strftime("%H:%M:%S"),
-                "Total_Vehicles": total_unique,
-                "Signal_Time_Sec": round(total_signal_time, 2)
-            }
-            pd.DataFrame([log_entry]).to_csv(CSV_FILE, mode='a', index=False, header=not os.path.exists(CSV_FILE))
+            total_signal_time = round(total_unique * clearance_rate, 2)
+
+            if not finish_recorder(total_signal_time):
+                run_id = load_analytics().start_run(uploaded_file.name if uploaded_file else "")
+                load_analytics().finish_run(run_id, total_unique, total_signal_time)
             st.success(f"✅ Data Logged! Total Unique Vehicles: {total_unique}")
 
         if st.session_state.run:
-            tfile = tempfile.NamedTemporaryFile(delete=False)
-            tfile.write(uploaded_file.read())
-            cap = cv2.VideoCapture(tfile.name)
-
-            while cap.isOpened() and st.session_state.run:
-                ret, frame = cap.read()
-                if not ret: break
-
-                st.session_state.frame_count += 1
-
-                # DETECTION: Process raw frame for accuracy
-                if st.session_state.frame_count % frame_skip == 0:
-                    detections, _ = detector.process_frame(frame, conf_val)
-                    for det in detections:
-                        st.session_state.execution_data["all_vehicle_ids"].add(det["id"])
-
-                    cur_count = len(detections)
-                    dens_m.metric("🚗 Current Frame Density", cur_count)
-                    time_m.metric("⏱ Clearance Time", f"{round(cur_count * clearance_rate, 1)}s")
+            pipeline = st.session_state.get("pipeline")
+            if pipeline is None:
+                video_path = ingest_upload(uploaded_file)
+                run_ids = st.session_state.execution_data["all_vehicle_ids"]
+                recorder = start_recorder(uploaded_file.name)
+                st.session_state.density_calc = DensityCalculator(lanes=settings.LANE_POLYGONS)
+                st.session_state.trend = TimeSeriesRing()
+
+                def on_inference(packet):
+                    run_ids.update(packet.detections.normal_ids().tolist())
+                    recorder.observe(packet.detections)
+
+                # One server batches every session's frames into shared model calls;
+                # tracks and cascade state stay per client
+                if st.session_state.get("client") is not None:
+                    st.session_state.client.close()  # left over from a run that ended without Stop
+                client = server.client(video_path=video_path)
+                st.session_state.client = client
+
+                pipeline = FramePipeline(
+                    video_path,
+                    client.process_frame,
+                    on_inference=on_inference,
+                    batch_fn=client.process_batch,
+                    batch_size=settings.INFERENCE_BATCH_SIZE,
+                    display_size=settings.PREVIEW_SIZE,
+                    render_fn=PreviewEncoder(settings.PREVIEW_FORMAT, settings.PREVIEW_QUALITY),
+                    display_fps=settings.PREVIEW_FPS,
+                    idle_timeout=settings.PIPELINE_IDLE_TIMEOUT_S,
+                    scheduler=MotionGate(max_interval=settings.MAX_SKIP_INTERVAL,
+                                         low_motion=settings.MOTION_LOW,
+                                         high_motion=settings.MOTION_HIGH,
+                                         probe_interval=settings.MOTION_PROBE_INTERVAL) if adaptive_skip else None,
+                ).start()
+                st.session_state.pipeline = pipeline
+
+            pipeline.conf = conf_val
+            pipeline.frame_skip = frame_skip
+
+            ui = ChangeFilter()  # only push metrics whose value changed
+            next_metrics = 0.0
+            while st.session_state.run and not pipeline.finished:
+                packet = pipeline.read(timeout=1.0)
+                if packet is None:
+                    continue
+
+                st.session_state.frame_count = packet.index
+
+                if packet.inferred:
+                    cur_count = len(packet.detections)
+                    if ui.changed("density", cur_count):
+                        dens_m.metric("🚗 Current Frame Density", cur_count)
+                        time_m.metric("⏱ Clearance Time", f"{round(cur_count * clearance_rate, 1)}s")
+                    _, occupancy, _ = st.session_state.density_calc.calculate_occupancy(packet.detections, packet.shape)
+                    if ui.changed("occupancy", f"{occupancy:.0%}"):
+                        occ_m.metric("📐 Lane Occupancy", f"{occupancy:.0%}")
 
                     # Signal Visual Status
-                    if cur_count > 15:
-                        signal_status.error("🔴 RED – High Density")
-                    elif cur_count > 5:
-                        signal_status.warning("🟡 YELLOW – Medium Density")
-                    else:
-                        signal_status.success("🟢 GREEN – Low Density")
-
-                    st.session_state.last_detections = detections
-                else:
-                    detections = st.session_state.get("last_detections", [])
-
-                # Resize ONLY for UI display
-                display_frame = cv2.resize(frame, (854, 480))
-                for d in detections:
-                    x1, y1, x2, y2 = map(int, d["box"])
-                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                video_placeholder.image(cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB), use_container_width=True)
-                time.sleep(0.01)
-            cap.release()
+                    signal = "red" if cur_count > 15 else "yellow" if cur_count > 5 else "green"
+                    if ui.changed("signal", signal):
+                        if signal == "red":
+                            signal_status.error("🔴 RED – High Density")
+                        elif signal == "yellow":
+                            signal_status.warning("🟡 YELLOW – Medium Density")
+                        else:
+                            signal_status.success("🟢 GREEN – Low Density")
+
+                    st.session_state.trend.append(time.time(), frame_row(packet.detections, occupancy, signal))
+
+                # Boxes are already scaled to the display resolution by the render stage, which
+                # also encodes the preview and caps its rate; other analysed frames carry None
+                if packet.display is not None:
+                    with STAGE_SECONDS.labels(stage="display").time():
+                        video_placeholder.image(packet.display, use_container_width=True)
+
+                if time.monotonic() >= next_metrics:
+                    render_live_metrics()
+                    render_trend(trend_box, st.session_state.trend, trend_window)
+                    next_metrics = time.monotonic() + 1.0
 
 # ======================================================
 # TAB 2: ANALYTICS
 # ======================================================
 with tab2:
     st.subheader("📊 Traffic Data Visualizations")
-    if os.path.exists(CSV_FILE):
-        df = pd.read_csv(CSV_FILE)
-
+    analytics = load_analytics()
+    df = analytics.runs()
+    if not df.empty:
         col1, col2 = st.columns(2)
         with col1:
             st.write("🚗 Total Vehicle Count Per Run")
-            # Correcting column name mapping from your CSV structure
-            st.line_chart(df.set_index("Time")["Total_Vehicles"])
+            st.line_chart(df.set_index("Time")["total_vehicles"])
 
         with col2:
             st.write("📊 Traffic Volume Distribution")
+            # Served from the daily rollup instead of summing every run on each rerun
+            daily = analytics.rollup("day")
             fig, ax = plt.subplots()
-            # Simple aggregation for pie chart
-            labels = ['Processed Vehicles']
-            sizes = [df['Total_Vehicles'].sum()]
-            ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
+            if not daily.empty:
+                by_approach = daily.groupby("approach")["vehicles"].sum()
+                ax.pie(by_approach.values, labels=by_approach.index, autopct='%1.1f%%', startangle=90)
+            else:
+                ax.pie([df['total_vehicles'].sum()], labels=['Processed Vehicles'], autopct='%1.1f%%', startangle=90)
             st.pyplot(fig)
+            plt.close(fig)
+
+        hourly = analytics.rollup("hour")
+        if not hourly.empty:
+            st.write("⏱ Vehicles per Hour")
+            st.line_chart(hourly.pivot_table(index="bucket", columns="approach", values="vehicles", aggfunc="sum"))
 
         st.divider()
         st.write("### 📜 Execution History")
-        st.dataframe(df, use_container_width=True)
+        st.dataframe(df.drop(columns=["started_at", "ended_at"]), use_container_width=True)
     else:
         st.info("No analytics data available yet. Run an analysis to generate reports.")
 
@@ -204,6 +284,8 @@ with tab2:
 # TAB 3: SYSTEM INFO
 # ======================================================
 with tab3:
+    render_live_metrics()
+
     st.subheader("🏗 System Architecture")
 
     st.markdown("""
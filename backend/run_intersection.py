@@ -0,0 +1,94 @@
+import sys
+import os
+
+# Same path fix as app.py: make 'core' importable when run from backend/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+
+from config import settings
+from core.detection.backends import export_model
+from core.detection.vehicle_detector import EMERGENCY_WEIGHTS, TRAFFIC_WEIGHTS
+from core.streams.worker_pool import StreamPool
+from core.video.frame_ring import BLOCK, OVERWRITE
+from signal_control.intersection import IntersectionCoordinator
+
+
+def parse_sources(values):
+    # "north=data/raw/north.mp4" -> {"north": "data/raw/north.mp4"}; bare paths get numbered names
+    sources = {}
+    for i, value in enumerate(values):
+        name, sep, path = value.partition("=")
+        if not sep:
+            name, path = f"approach_{i + 1}", value
+        sources[name] = path
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one detector process per approach and plan signal cycles.")
+    parser.add_argument("sources", nargs="+", help="approach=video_path (or just video_path)")
+    parser.add_argument("--conf", type=float, default=settings.CONFIDENCE_THRESHOLD)
+    parser.add_argument("--frame-skip", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--loop", action="store_true", help="replay files forever as stand-in camera feeds")
+    parser.add_argument("--plan-every", type=float, default=5.0, help="seconds between signal plans")
+    parser.add_argument("--decode-process", action="store_true",
+                        help="decode each feed in its own process, handing frames over in shared memory")
+    parser.add_argument("--ring-policy", choices=(BLOCK, OVERWRITE), default=BLOCK,
+                        help="when the detector falls behind the decoder: wait for it, or drop the oldest frame")
+    args = parser.parse_args()
+
+    sources = parse_sources(args.sources)
+    # Export once up front so the workers do not all race to build the same artifact
+    for weights in (TRAFFIC_WEIGHTS, EMERGENCY_WEIGHTS):
+        export_model(weights, settings.INFERENCE_BACKEND, settings.INFERENCE_INT8,
+                     settings.INFERENCE_CALIBRATION_VIDEO)
+    pool = StreamPool(
+        sources,
+        conf=args.conf,
+        frame_skip=args.frame_skip,
+        threads_per_worker=args.threads_per_worker,
+        loop=args.loop,
+        decode_process=args.decode_process,
+        ring_policy=args.ring_policy,
+        detector_kwargs={
+            "batch_size": 1,  # live feeds: latency over throughput
+            "tracker": settings.TRACKER,
+            "emergency_mode": settings.EMERGENCY_MODE,
+            "sweep_interval": settings.EMERGENCY_SWEEP_INTERVAL,
+            "recheck_interval": settings.EMERGENCY_RECHECK_INTERVAL,
+            "backend": settings.INFERENCE_BACKEND,
+            "int8": settings.INFERENCE_INT8,
+            "calibration_video": settings.INFERENCE_CALIBRATION_VIDEO,
+            "roi": settings.INFERENCE_ROI,
+            "inference_sizes": settings.INFERENCE_SIZES,
+        },
+    ).start()
+    coordinator = IntersectionCoordinator(sources)
+    print(f"Started {len(sources)} workers, {pool.threads_per_worker} torch thread(s) each")
+
+    next_plan = time.monotonic() + args.plan_every
+    try:
+        while not pool.done:
+            update = pool.poll(timeout=0.5)
+            if update is not None:
+                approach, _, count, is_emergency = update
+                coordinator.update(approach, count, is_emergency)
+
+            if time.monotonic() >= next_plan:
+                next_plan += args.plan_every
+                plan = ", ".join(f"{a}: {t}s" for a, t in coordinator.plan())
+                print(f"[{time.strftime('%H:%M:%S')}] densities={coordinator.densities} plan=[{plan}]")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+    for approach, error in pool.errors.items():
+        print(f"Worker '{approach}' failed: {error}")
+
+
+if __name__ == "__main__":
+    main()
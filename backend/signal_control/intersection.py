@@ -0,0 +1,26 @@
+import time
+
+from signal_control.signal_logic import SignalController
+
+
+class IntersectionCoordinator:
+    """Collects the latest per-approach densities from the stream workers and plans signal cycles."""
+
+    def __init__(self, approaches, controller=None, smoothing=0.3):
+        self.controller = controller or SignalController()
+        self.smoothing = smoothing
+        self.densities = {a: 0.0 for a in approaches}
+        self.emergency = {a: False for a in approaches}
+        self.last_update = {a: None for a in approaches}
+
+    def update(self, approach, count, is_emergency):
+        # Exponential smoothing so a single noisy frame doesn't swing the green time
+        prev = self.densities[approach]
+        self.densities[approach] = prev + self.smoothing * (count - prev)
+        self.emergency[approach] = is_emergency
+        self.last_update[approach] = time.time()
+
+    def plan(self):
+        emergency = [a for a, flag in self.emergency.items() if flag]
+        densities = {a: round(d, 1) for a, d in self.densities.items()}
+        return self.controller.get_phase_plan(densities, emergency)
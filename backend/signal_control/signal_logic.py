@@ -7,4 +7,19 @@ class SignalController:
         calc_time = settings.MIN_GREEN_TIME + (current_density * settings.VEHICLE_UNIT_TIME)
 
         final_time = max(settings.MIN_GREEN_TIME, min(calc_time, settings.MAX_GREEN_TIME))
-        return final_time
\ No newline at end of file
+        return final_time
+
+    def get_phase_plan(self, densities, emergency_approaches=()):
+        """
+        One signal cycle for a multi-approach junction: [(approach, green_time), ...].
+
+        Approaches keep their configured order, except that any approach with an
+        emergency vehicle is served first and gets the maximum green time.
+        """
+        plan = []
+        for approach, density in densities.items():
+            if approach in emergency_approaches:
+                plan.insert(0, (approach, settings.MAX_GREEN_TIME))
+            else:
+                plan.append((approach, self.get_adaptive_timing(density)))
+        return plan
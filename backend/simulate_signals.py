@@ -0,0 +1,66 @@
+import sys
+import os
+
+# Same path fix as app.py: make 'core' importable when run from backend/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+
+import numpy as np
+
+from config import settings
+from core.simulation import signal_simulator as sim
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep signal-timing policies over a day of arrivals.")
+    parser.add_argument("--counts", help="CSV of per-interval vehicle counts, one column per approach "
+                                         "(header row optional); synthetic traffic if omitted")
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds per row in --counts")
+    parser.add_argument("--hours", type=float, default=24.0, help="synthetic traffic length")
+    parser.add_argument("--approaches", type=int, default=4, help="synthetic approaches")
+    parser.add_argument("--dt", type=float, default=2.0, help="simulation step in seconds")
+    parser.add_argument("--saturation-flow", type=float, default=0.5, help="veh/s discharged on green")
+    parser.add_argument("--lost-time", type=float, default=4.0, help="all-red seconds per phase change")
+    parser.add_argument("--metric", default="avg_delay", choices=["avg_delay", "mean_queue", "max_queue"])
+    args = parser.parse_args()
+
+    if args.counts:
+        counts = np.genfromtxt(args.counts, delimiter=",", skip_header=0)
+        counts = counts[~np.isnan(counts).any(axis=1)] if counts.ndim == 2 else counts[~np.isnan(counts), None]
+        arrivals = sim.arrivals_from_counts(counts, args.interval, args.dt)
+    else:
+        arrivals = sim.synthetic_arrivals(args.hours, args.approaches, args.dt)
+
+    grid = {
+        "min_green": np.arange(5, 31, 1),
+        "max_green": np.arange(30, 121, 5),
+        "unit_time": np.arange(0.5, 5.01, 0.5),
+    }
+    kwargs = {"dt": args.dt, "saturation_flow": args.saturation_flow, "lost_time": args.lost_time}
+
+    t0 = time.perf_counter()
+    results = sim.sweep(arrivals, grid, **kwargs)
+    elapsed = time.perf_counter() - t0
+    n = sum(len(r["valid"]) for r in results.values())
+    hours = arrivals.shape[0] * args.dt / 3600
+    print(f"Simulated {n} controllers x {hours:.1f} h of traffic ({arrivals.shape[1]} approaches) in {elapsed:.1f}s\n")
+
+    current = sim.simulate(arrivals, "linear", {
+        "min_green": [settings.MIN_GREEN_TIME],
+        "max_green": [settings.MAX_GREEN_TIME],
+        "unit_time": [settings.VEHICLE_UNIT_TIME],
+    }, **kwargs)
+    print(f"{'current settings':<16} {args.metric}={current[args.metric][0]:.2f} "
+          f"(MIN_GREEN_TIME={settings.MIN_GREEN_TIME}, MAX_GREEN_TIME={settings.MAX_GREEN_TIME}, "
+          f"VEHICLE_UNIT_TIME={settings.VEHICLE_UNIT_TIME})")
+    for policy, result in results.items():
+        i, params = sim.best(result, args.metric)
+        shown = ", ".join(f"{k}={v:g}" for k, v in params.items())
+        print(f"{'best ' + policy:<16} {args.metric}={result[args.metric][i]:.2f} "
+              f"mean_queue={result['mean_queue'][i]:.1f} max_queue={result['max_queue'][i]:.0f} ({shown})")
+
+
+if __name__ == "__main__":
+    main()
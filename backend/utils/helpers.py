@@ -0,0 +1,105 @@
+import os
+import time
+
+import pandas as pd
+import streamlit as st
+
+from config import settings
+from core.analytics.store import AnalyticsStore, IntervalRecorder
+from core.detection.vehicle_detector import VehicleDetector
+from core.ingest.video_store import VideoStore
+from core.metrics.server import start_metrics_dumper, start_metrics_server
+from core.serving.inference_server import InferenceServer
+
+# Shared by app.py and main.py
+
+TREND_WINDOWS = {"Last 5 min": 300, "Whole run": None}
+
+
+@st.cache_resource
+def load_server():
+    if settings.METRICS_PORT:
+        start_metrics_server(settings.METRICS_PORT)
+    if settings.METRICS_DUMP_PATH:
+        start_metrics_dumper(settings.METRICS_DUMP_PATH)
+    detector = VehicleDetector(
+        batch_size=settings.INFERENCE_BATCH_SIZE,
+        tracker=settings.TRACKER,
+        emergency_mode=settings.EMERGENCY_MODE,
+        sweep_interval=settings.EMERGENCY_SWEEP_INTERVAL,
+        recheck_interval=settings.EMERGENCY_RECHECK_INTERVAL,
+        backend=settings.INFERENCE_BACKEND,
+        int8=settings.INFERENCE_INT8,
+        calibration_video=settings.INFERENCE_CALIBRATION_VIDEO,
+        roi=settings.INFERENCE_ROI,
+        inference_sizes=settings.INFERENCE_SIZES,
+        cache_dir=settings.DETECTION_CACHE_DIR or None,
+        cache_quota_mb=settings.DETECTION_CACHE_QUOTA_MB,
+        cache_min_conf=settings.DETECTION_CACHE_MIN_CONF,
+    )
+    # One server batches every session's frames into shared model calls
+    return InferenceServer(detector, max_batch=settings.SERVING_MAX_BATCH,
+                           max_wait=settings.SERVING_MAX_WAIT_MS / 1000,
+                           max_pending=settings.SERVING_MAX_PENDING,
+                           close_idle_after=settings.PIPELINE_IDLE_TIMEOUT_S).start()
+
+
+@st.cache_resource
+def load_video_store():
+    return VideoStore(settings.VIDEO_STORE_DIR, settings.VIDEO_STORE_QUOTA_MB * 1024 * 1024)
+
+
+@st.cache_resource
+def load_analytics():
+    # Run history from the old per-page CSVs is imported once
+    store = AnalyticsStore(settings.ANALYTICS_DB)
+    for path in settings.LEGACY_CSV_PATHS:
+        store.import_csv(path)
+    return store
+
+
+def ingest_upload(uploaded_file):
+    # Stream the upload into the content-addressed store once per distinct upload;
+    # reruns and repeat runs reuse the stored file instead of writing a new temp copy.
+    # The session leases the file while it keeps the upload, so other sessions'
+    # uploads cannot evict a video this one is still reading.
+    store = load_video_store()
+    key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    cached = st.session_state.get("ingested")
+    if cached and cached[0] == key and os.path.exists(cached[1]):
+        store.touch(cached[1])
+        return cached[1]
+    if cached:
+        cached[2].release()
+    suffix = os.path.splitext(uploaded_file.name)[1] or ".mp4"
+    path, lease = store.ingest(uploaded_file, suffix=suffix, lease=True)
+    st.session_state.ingested = (key, path, lease)
+    return path
+
+
+def start_recorder(source):
+    """A new IntervalRecorder for this session's run; a run still open is finished first."""
+    finish_recorder()
+    recorder = IntervalRecorder(load_analytics(), source=source, interval_s=settings.ANALYTICS_INTERVAL_S)
+    st.session_state.recorder = recorder
+    return recorder
+
+
+def finish_recorder(signal_time_sec=0.0):
+    """Finish the session's open run in the analytics store; False if there was none."""
+    recorder = st.session_state.pop("recorder", None)
+    if recorder is None:
+        return False
+    recorder.close(signal_time_sec)
+    return True
+
+
+def render_trend(box, ring, window):
+    # Bounded ring + LTTB: the redraw costs the same however long the run has been going
+    seconds = TREND_WINDOWS[window]
+    ts, values = ring.series(("vehicles", "car", "motorcycle", "bus", "truck", "occupancy"),
+                             since=None if seconds is None else time.time() - seconds)
+    if len(ts):
+        values["occupancy"] = values["occupancy"] * 100
+        box.line_chart(pd.DataFrame(values, index=pd.to_datetime(ts, unit="s")).rename(
+            columns={"occupancy": "occupancy_%"}))
@@ -0,0 +1,352 @@
+"""
+Concurrent-session load test of the dashboard's detection path, without a browser.
+
+    python benchmarks/load_test.py --sessions 1 2 4 8 --duration 30
+    python benchmarks/load_test.py --video a.mp4 b.mp4 --mode direct --out load.json
+
+Each simulated session is what one dashboard tab runs: a FramePipeline (decode, motion
+gate, inference, preview encoding) on its own InferenceServer client, with a consumer
+thread standing in for the page's script loop. Sessions replay their video (round-robin
+over --video) for as long as the test runs; concurrency ramps through --sessions, and
+sessions from one level stay on for the next.
+
+Per level: analysed and preview FPS per session, how fast each session moves through
+its video compared with real time, decode-to-page latency of analysed frames, process
+CPU and RSS, and (served mode) the mean model batch. The box is saturated at the first
+level where a session falls behind real time, p95 latency passes --max-latency-ms, or
+adding sessions stops adding analysed frames per second.
+
+Run from the repository root (models are loaded from models/). Settings come from
+backend/config/settings.py like the dashboards'; the detection cache is off so every
+replay is really inferred. --mode direct calls one shared detector from every session
+instead of going through the server, for comparison.
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "backend"))
+
+import argparse
+import json
+import platform
+import resource
+import threading
+import time
+
+import numpy as np
+import torch
+
+from config import settings
+from core.detection.vehicle_detector import VehicleDetector
+from core.pipeline.engine import FramePipeline
+from core.render.preview import PreviewEncoder
+from core.scheduling.motion_gate import MotionGate
+from core.serving.inference_server import InferenceServer
+from core.video.frame_source import FrameSource
+
+DEFAULT_VIDEO = os.path.join(ROOT, "backend", "data", "raw", "traffic_video.mp4")
+
+
+def percentiles(samples_ms):
+    if not len(samples_ms):
+        return {"mean": None, "p50": None, "p95": None, "p99": None}
+    a = np.asarray(samples_ms)
+    return {
+        "mean": round(float(a.mean()), 1),
+        "p50": round(float(np.percentile(a, 50)), 1),
+        "p95": round(float(np.percentile(a, 95)), 1),
+        "p99": round(float(np.percentile(a, 99)), 1),
+    }
+
+
+def rss_mb():
+    # Current RSS where /proc has it, else the peak (ru_maxrss: KiB on Linux, bytes on macOS)
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system
+
+
+class DirectClient:
+    """A session calling the shared detector itself (its lock serialises the sessions), as before core.serving."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.stream = detector.new_stream()
+
+    def process_batch(self, frames, conf_threshold, positions=None):
+        return self.detector.process_batch(frames, conf_threshold, self.stream, positions)
+
+    def process_frame(self, frame, conf_threshold, position=None):
+        return self.detector.process_frame(frame, conf_threshold, self.stream, position)
+
+    def reset_tracker(self):
+        self.stream.reset()
+
+    def close(self):
+        pass
+
+
+class Session:
+    """One simulated dashboard tab: a pipeline on `client` and a consumer reading it like the page does."""
+
+    def __init__(self, name, video, client, args):
+        self.name = name
+        self.video = video
+        self.client = client
+        self.args = args
+        with FrameSource(video) as probe:
+            if not probe.opened:
+                raise SystemExit(f"Cannot open {video}")
+            self.video_fps = probe.fps
+        self.analysed = []  # (read time, decode-to-page seconds)
+        self.previews = []  # read times
+        self.error = None
+        self._replayed = 0  # video frames of finished replays
+        self._pipeline = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"session-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.client.close()
+
+    def frames(self):
+        """Video frames this session has moved through so far."""
+        with self._lock:
+            return self._replayed + (self._pipeline.frames_decoded if self._pipeline is not None else 0)
+
+    def _pipeline_for(self):
+        args = self.args
+        return FramePipeline(
+            self.video,
+            self.client.process_frame,
+            conf=args.conf,
+            frame_skip=args.frame_skip,
+            batch_fn=self.client.process_batch,
+            batch_size=settings.INFERENCE_BATCH_SIZE,
+            display_size=settings.PREVIEW_SIZE,
+            render_fn=PreviewEncoder(settings.PREVIEW_FORMAT, settings.PREVIEW_QUALITY),
+            display_fps=settings.PREVIEW_FPS,
+            scheduler=MotionGate(max_interval=settings.MAX_SKIP_INTERVAL, low_motion=settings.MOTION_LOW,
+                                 high_motion=settings.MOTION_HIGH,
+                                 probe_interval=settings.MOTION_PROBE_INTERVAL) if args.adaptive_skip else None,
+        )
+
+    def _run(self):
+        while not self._stop.is_set():
+            pipeline = self._pipeline_for()
+            with self._lock:
+                self._pipeline = pipeline
+            pipeline.start()
+            while not self._stop.is_set() and not pipeline.finished:
+                packet = pipeline.read(timeout=1.0)
+                if packet is None:
+                    continue
+                now = time.perf_counter()
+                if packet.inferred:
+                    self.analysed.append((now, now - packet.t_decoded))
+                if packet.display is not None:
+                    self.previews.append(now)
+            pipeline.stop()
+            with self._lock:
+                self._replayed += pipeline.frames_decoded
+                self._pipeline = None
+            if pipeline.error is not None:
+                self.error = repr(pipeline.error)
+                return
+            self.client.reset_tracker()  # the next replay is a new run with fresh track IDs
+
+
+def build(args):
+    detector = VehicleDetector(
+        batch_size=settings.INFERENCE_BATCH_SIZE,
+        tracker=settings.TRACKER,
+        emergency_mode=settings.EMERGENCY_MODE,
+        sweep_interval=settings.EMERGENCY_SWEEP_INTERVAL,
+        recheck_interval=settings.EMERGENCY_RECHECK_INTERVAL,
+        backend=args.backend,
+        int8=settings.INFERENCE_INT8,
+        calibration_video=settings.INFERENCE_CALIBRATION_VIDEO,
+        roi=settings.INFERENCE_ROI,
+        inference_sizes=settings.INFERENCE_SIZES,
+        background_load=False,
+    )
+    if args.mode == "direct":
+        return detector, None
+    server = InferenceServer(detector, max_batch=settings.SERVING_MAX_BATCH,
+                             max_wait=settings.SERVING_MAX_WAIT_MS / 1000,
+                             max_pending=settings.SERVING_MAX_PENDING).start()
+    return detector, server
+
+
+def measure(sessions, server, args):
+    """Run the current sessions for --warmup then --duration seconds and summarise the measured window."""
+    time.sleep(args.warmup)
+    t0, cpu0, frames0 = time.perf_counter(), cpu_seconds(), [s.frames() for s in sessions]
+    batches0, served0 = (server.batches, server.frames) if server is not None else (0, 0)
+    time.sleep(args.duration)
+    t1, cpu1, frames1 = time.perf_counter(), cpu_seconds(), [s.frames() for s in sessions]
+    elapsed = t1 - t0
+
+    per_session, latencies = [], []
+    for s, f0, f1 in zip(sessions, frames0, frames1):
+        window = [lat for t, lat in list(s.analysed) if t0 <= t < t1]
+        latencies.extend(window)
+        per_session.append({
+            "session": s.name,
+            "analysed_fps": round(len(window) / elapsed, 2),
+            "preview_fps": round(sum(1 for t in list(s.previews) if t0 <= t < t1) / elapsed, 2),
+            "video_fps": round((f1 - f0) / elapsed, 2),
+            "realtime": round((f1 - f0) / elapsed / s.video_fps, 2),
+            "error": s.error,
+        })
+
+    analysed = [p["analysed_fps"] for p in per_session]
+    realtime = [p["realtime"] for p in per_session]
+    level = {
+        "sessions": len(sessions),
+        "analysed_fps": {"total": round(sum(analysed), 2), "mean": round(float(np.mean(analysed)), 2),
+                         "min": min(analysed)},
+        "preview_fps_mean": round(float(np.mean([p["preview_fps"] for p in per_session])), 2),
+        "realtime_min": min(realtime),
+        "latency_ms": percentiles(np.asarray(latencies) * 1000),
+        "cpu_cores": round((cpu1 - cpu0) / elapsed, 2),
+        "cpu_percent": round(100 * (cpu1 - cpu0) / elapsed / (os.cpu_count() or 1), 1),
+        "rss_mb": rss_mb(),
+        "per_session": per_session,
+    }
+    if server is not None:
+        batches = server.batches - batches0
+        level["mean_batch"] = round((server.frames - served0) / batches, 2) if batches else None
+    return level
+
+
+def saturation(levels, max_latency_ms, min_gain):
+    """(sessions, reason) at the first saturated level, or (None, None) if every level kept up."""
+    previous = None
+    for level in levels:
+        if any(p["error"] for p in level["per_session"]):
+            return level["sessions"], "a session failed"
+        if level["realtime_min"] < 1.0:
+            return level["sessions"], "a session fell behind real time"
+        p95 = level["latency_ms"]["p95"]
+        if p95 is not None and p95 > max_latency_ms:
+            return level["sessions"], f"p95 latency {p95:.0f} ms > {max_latency_ms:.0f} ms"
+        if previous is not None and level["analysed_fps"]["total"] < previous["analysed_fps"]["total"] * (1 + min_gain):
+            return level["sessions"], "more sessions no longer add analysed frames per second"
+        previous = level
+    return None, None
+
+
+def report(level):
+    lat = level["latency_ms"]
+    batch = f"  batch {level['mean_batch']}" if level.get("mean_batch") is not None else ""
+    print(f"{level['sessions']:>3} session(s): analysed {level['analysed_fps']['mean']:6.1f} fps/session "
+          f"(min {level['analysed_fps']['min']:.1f}, total {level['analysed_fps']['total']:.1f})  "
+          f"previews {level['preview_fps_mean']:4.1f}/s  realtime x{level['realtime_min']:.2f}  "
+          f"latency p50/p95/p99 {lat['p50']}/{lat['p95']}/{lat['p99']} ms  "
+          f"cpu {level['cpu_cores']:.1f} cores ({level['cpu_percent']:.0f}%)  rss {level['rss_mb']:.0f} MB{batch}",
+          flush=True)
+
+
+def run(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    detector, server = build(args)
+    sessions, levels = [], []
+    try:
+        for n in sorted(set(args.sessions)):
+            while len(sessions) < n:
+                i = len(sessions)
+                client = DirectClient(detector) if server is None else server.client(name=f"session-{i + 1}")
+                sessions.append(Session(f"session-{i + 1}", args.video[i % len(args.video)], client, args).start())
+            level = measure(sessions, server, args)
+            levels.append(level)
+            report(level)
+            if args.stop_at_saturation and saturation(levels, args.max_latency_ms, args.min_gain)[0] is not None:
+                break
+    finally:
+        for s in sessions:
+            s.stop()
+        if server is not None:
+            server.stop()
+
+    saturated, reason = saturation(levels, args.max_latency_ms, args.min_gain)
+    kept_up = [lvl["sessions"] for lvl in levels if saturated is None or lvl["sessions"] < saturated]
+    return {
+        "meta": {
+            "videos": args.video,
+            "mode": args.mode,
+            "conf": args.conf,
+            "frame_skip": args.frame_skip,
+            "adaptive_skip": args.adaptive_skip,
+            "warmup_s": args.warmup,
+            "duration_s": args.duration,
+            "backend": args.backend + ("-int8" if settings.INFERENCE_INT8 else ""),
+            "batch_size": settings.INFERENCE_BATCH_SIZE,
+            "serving_max_batch": settings.SERVING_MAX_BATCH,
+            "emergency_mode": settings.EMERGENCY_MODE,
+            "threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "cuda": torch.cuda.is_available(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu": platform.processor() or platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "levels": levels,
+        "capacity_sessions": max(kept_up) if kept_up else 0,
+        "saturated_at": saturated,
+        "saturation_reason": reason,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", nargs="+", default=[DEFAULT_VIDEO], help="sessions take these in turn")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrency levels")
+    parser.add_argument("--warmup", type=float, default=10.0, help="unmeasured seconds after each ramp step")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per level")
+    parser.add_argument("--mode", default="served", choices=["served", "direct"])
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--frame-skip", type=int, default=2, help="the dashboards' Frame Skip slider")
+    parser.add_argument("--adaptive-skip", action=argparse.BooleanOptionalAction, default=settings.ADAPTIVE_SKIP)
+    parser.add_argument("--backend", default=settings.INFERENCE_BACKEND)
+    parser.add_argument("--threads", type=int, default=None, help="torch threads (default: torch's own)")
+    parser.add_argument("--max-latency-ms", type=float, default=1000.0, help="p95 decode-to-page latency limit")
+    parser.add_argument("--min-gain", type=float, default=0.05,
+                        help="relative analysed-FPS gain below which another level counts as saturated")
+    parser.add_argument("--stop-at-saturation", action="store_true",
+                        help="skip the levels after the first saturated one")
+    parser.add_argument("--out", help="write the JSON result here")
+    args = parser.parse_args()
+
+    result = run(args)
+    if result["saturated_at"] is None:
+        print(f"\nNo saturation up to {result['levels'][-1]['sessions']} session(s)")
+    else:
+        print(f"\nSaturated at {result['saturated_at']} session(s): {result['saturation_reason']}; "
+              f"capacity {result['capacity_sessions']} session(s)")
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Headless, CPU-only, stage-by-stage benchmark of the detection path.
+
+    python benchmarks/stage_benchmark.py --out before.json
+    python benchmarks/stage_benchmark.py --baseline before.json
+
+Run from the repository root (models are loaded from models/). Frames go through the
+same public path as the dashboards (FrameSource, VehicleDetector.prepare/run_prepared);
+the time of each stage is read off the STAGE_SECONDS / MODEL_SECONDS metrics that path
+records, so the breakdown cannot drift from what actually runs. Baselines are machine
+specific: record one with --out on the machine you compare on. Exits with status 1 when
+--baseline is given and any tracked number regresses beyond --tolerance.
+"""
+import os
+import sys
+
+# CPU only, even on a machine that has a GPU; must be set before torch is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "backend"))
+
+import argparse
+import json
+import platform
+import resource
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from core.density.density_calculator import DensityCalculator
+from core.detection.backends import BACKENDS
+from core.detection.vehicle_detector import VehicleDetector
+from core.metrics.registry import MODEL_SECONDS, STAGE_SECONDS
+from core.pipeline.engine import draw_detections
+from core.tracking.trackers import TRACKERS
+from core.video.frame_source import FrameSource
+from signal_control.signal_logic import SignalController
+
+# Stages timed by the metrics the detection path records itself
+METERED = {
+    "decode": STAGE_SECONDS.labels(stage="decode"),
+    "preprocess": STAGE_SECONDS.labels(stage="preprocess"),
+    "traffic_model": MODEL_SECONDS.labels(model="traffic"),
+    "emergency_model": MODEL_SECONDS.labels(model="emergency"),
+    "emergency_crops": MODEL_SECONDS.labels(model="emergency_crops"),
+    "track": STAGE_SECONDS.labels(stage="track"),
+    "parse": STAGE_SECONDS.labels(stage="parse"),
+}
+# detector_other: the rest of prepare() + run_prepared() (box conversion, cascade bookkeeping)
+STAGES = (*METERED, "detector_other", "density_signal", "render")
+DEFAULT_VIDEO = os.path.join(ROOT, "backend", "data", "raw", "traffic_video.mp4")
+
+
+def percentiles(samples_ms):
+    a = np.asarray(samples_ms)
+    return {
+        "mean": round(float(a.mean()), 3),
+        "p50": round(float(np.percentile(a, 50)), 3),
+        "p95": round(float(np.percentile(a, 95)), 3),
+        "p99": round(float(np.percentile(a, 99)), 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run(args):
+    torch.set_num_threads(args.threads)
+    cv2.setNumThreads(args.threads)
+
+    detector = VehicleDetector(batch_size=1, tracker=args.tracker, emergency_mode=args.emergency_mode,
+                               backend=args.backend, int8=args.int8, calibration_video=args.video, roi=args.roi,
+                               inference_sizes=args.sizes, background_load=False)
+    density = DensityCalculator()
+    controller = SignalController()
+    source = FrameSource(args.video)
+    if not source.opened:
+        raise SystemExit(f"Cannot open {args.video}")
+
+    timings = {stage: [] for stage in STAGES}
+    frame_ms = []
+    frames = 0
+    clock = time.perf_counter
+
+    while frames < args.warmup + args.frames:
+        before = {stage: child.sum for stage, child in METERED.items()}
+        t0 = clock()
+        frame = source.read()
+        if frame is None:
+            if args.loop and frames:
+                source.release()
+                source = FrameSource(args.video)
+                continue
+            break
+        t1 = clock()
+
+        prepared = detector.prepare([frame], args.conf)
+        detections, _ = detector.run_prepared([prepared])[0][0]
+        t2 = clock()
+
+        _, count = density.calculate_density(detections)
+        density.calculate_occupancy(detections, frame.shape)
+        controller.get_adaptive_timing(count)
+        t3 = clock()
+
+        draw_detections(frame, detections)
+        t4 = clock()
+
+        frames += 1
+        if frames <= args.warmup:
+            continue
+        spent = {stage: (child.sum - before[stage]) * 1000 for stage, child in METERED.items()}
+        spent["detector_other"] = max(0.0, (t2 - t1) * 1000 - sum(v for k, v in spent.items() if k != "decode"))
+        spent["density_signal"] = (t3 - t2) * 1000
+        spent["render"] = (t4 - t3) * 1000
+        for stage in STAGES:
+            timings[stage].append(spent[stage])
+        frame_ms.append((t4 - t0) * 1000)
+
+    source.release()
+    measured = len(frame_ms)
+    if measured == 0:
+        raise SystemExit("No frames measured; use --loop or lower --warmup")
+
+    return {
+        "meta": {
+            "video": os.path.relpath(args.video, ROOT),
+            "frames": measured,
+            "warmup": args.warmup,
+            "conf": args.conf,
+            "emergency_mode": args.emergency_mode,
+            "tracker": args.tracker,
+            "backend": args.backend + ("-int8" if args.int8 else ""),
+            "roi": args.roi,
+            "sizes": args.sizes,
+            "threads": args.threads,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu": platform.processor() or platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "fps": round(1000.0 * measured / sum(frame_ms), 2),
+        "frame_ms": percentiles(frame_ms),
+        "stages_ms": {stage: percentiles(v) for stage, v in timings.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """List of human-readable regressions (higher latency / lower FPS than baseline)."""
+    regressions = []
+
+    def check(name, new, old, higher_is_worse=True):
+        if not old:
+            return
+        change = (new - old) / old
+        if (change if higher_is_worse else -change) > tolerance:
+            regressions.append(f"{name}: {old} -> {new} ({change:+.1%})")
+
+    check("fps", result["fps"], baseline.get("fps"), higher_is_worse=False)
+    for key in ("p50", "p95", "p99"):
+        check(f"frame_ms.{key}", result["frame_ms"][key], baseline.get("frame_ms", {}).get(key))
+    for stage, stats in result["stages_ms"].items():
+        old = baseline.get("stages_ms", {}).get(stage, {})
+        for key in ("p50", "p95"):
+            check(f"{stage}.{key}", stats[key], old.get(key))
+    check("peak_rss_mb", result["peak_rss_mb"], baseline.get("peak_rss_mb"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=DEFAULT_VIDEO)
+    parser.add_argument("--frames", type=int, default=150, help="measured frames")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured frames first")
+    parser.add_argument("--loop", action="store_true", help="rewind the video until --frames are measured")
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--emergency-mode", default="full", choices=["full", "cascade"])
+    parser.add_argument("--backend", default="torch", choices=BACKENDS)
+    parser.add_argument("--tracker", default="iou", choices=sorted(TRACKERS))
+    parser.add_argument("--int8", action="store_true", help="INT8 export calibrated on --video (onnx/openvino)")
+    parser.add_argument("--roi", help="ROI mask image for the inference crop (default: whole frame)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[640], help="adaptive inference sizes")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", help="write the JSON result here")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+        print("\nNo regressions vs baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    source TEXT NOT NULL DEFAULT '',
+    approach TEXT NOT NULL DEFAULT 'main',
+    total_vehicles INTEGER,
+    signal_time_sec REAL,
+    UNIQUE (source, approach, started_at)
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+
+CREATE TABLE IF NOT EXISTS interval_counts (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    approach TEXT NOT NULL,
+    bucket_start REAL NOT NULL,
+    vehicles INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    density_sum REAL NOT NULL,
+    density_max INTEGER NOT NULL,
+    PRIMARY KEY (run_id, approach, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS interval_counts_bucket ON interval_counts (bucket_start);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    approach TEXT NOT NULL,
+    bucket_start REAL NOT NULL,
+    vehicles INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    density_sum REAL NOT NULL,
+    density_max INTEGER NOT NULL,
+    PRIMARY KEY (period, approach, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('revision', 0);
+"""
+
+PERIODS = {"hour": 3600, "day": 86400}
+
+
+class AnalyticsStore:
+    """
+    Embedded SQLite store for run history and per-interval vehicle counts.
+
+    runs            - one row per analysis run (what vehicles.csv used to hold)
+    interval_counts - new unique vehicles and density per run, approach and interval
+    rollups         - hourly / daily totals per approach, updated in the same
+                      transaction as each interval, so charts never scan raw intervals
+
+    Appends are single-row transactions. Every write bumps a revision counter; query
+    results are memoised per revision, so page reruns without new data cost nothing.
+    Bucket boundaries are local time, matching the Date / Time the pages display.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._cache = {}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------- writes ----------------
+    def start_run(self, source="", approach="main", started_at=None):
+        with self._write() as cur:
+            cur.execute("INSERT INTO runs (started_at, source, approach) VALUES (?, ?, ?)",
+                        (started_at or time.time(), source, approach))
+            return cur.lastrowid
+
+    def finish_run(self, run_id, total_vehicles, signal_time_sec, ended_at=None):
+        with self._write() as cur:
+            cur.execute("UPDATE runs SET ended_at = ?, total_vehicles = ?, signal_time_sec = ? WHERE id = ?",
+                        (ended_at or time.time(), int(total_vehicles), float(signal_time_sec), run_id))
+
+    def record_interval(self, run_id, bucket_start, vehicles, frames, density_sum, density_max, approach="main"):
+        """Add one interval's counts (re-recording the same bucket accumulates into it)."""
+        row = (int(vehicles), int(frames), float(density_sum), int(density_max))
+        with self._write() as cur:
+            cur.execute(
+                "INSERT INTO interval_counts VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, approach, bucket_start) DO UPDATE SET "
+                "vehicles = vehicles + excluded.vehicles, frames = frames + excluded.frames, "
+                "density_sum = density_sum + excluded.density_sum, "
+                "density_max = max(density_max, excluded.density_max)",
+                (run_id, approach, bucket_start) + row)
+            for period in PERIODS:
+                cur.execute(
+                    "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (period, approach, bucket_start) DO UPDATE SET "
+                    "vehicles = vehicles + excluded.vehicles, frames = frames + excluded.frames, "
+                    "density_sum = density_sum + excluded.density_sum, "
+                    "density_max = max(density_max, excluded.density_max)",
+                    (period, approach, _floor(bucket_start, period)) + row)
+
+    def import_csv(self, path):
+        """Import a legacy vehicles.csv (Date, Time, Total_Vehicles, Signal_Time_Sec); returns rows added."""
+        if not os.path.exists(path):
+            return 0
+        rows = []
+        with open(path, newline="") as f:
+            for rec in csv.DictReader(f):
+                try:
+                    started = datetime.strptime(f"{rec['Date']} {rec['Time']}", "%Y-%m-%d %H:%M:%S").timestamp()
+                    rows.append((started, started, "vehicles.csv", "main",
+                                 int(float(rec["Total_Vehicles"])), float(rec.get("Signal_Time_Sec") or 0)))
+                except (KeyError, TypeError, ValueError):
+                    continue  # same tolerance as the old on_bad_lines='skip'
+        with self._write() as cur:
+            before = self._conn.total_changes
+            cur.executemany("INSERT OR IGNORE INTO runs (started_at, ended_at, source, approach, "
+                            "total_vehicles, signal_time_sec) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            return self._conn.total_changes - before
+
+    # ---------------- reads ----------------
+    def revision(self):
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def runs(self, limit=500):
+        """Most recent finished runs, oldest first, with Date / Time columns for the pages."""
+        df = self._query(
+            "SELECT * FROM (SELECT id, started_at, ended_at, source, approach, total_vehicles, signal_time_sec "
+            "FROM runs WHERE total_vehicles IS NOT NULL ORDER BY started_at DESC LIMIT ?) ORDER BY started_at",
+            (limit,))
+        stamp = pd.to_datetime(df["started_at"], unit="s", utc=True).dt.tz_convert(_local_tz()).dt.tz_localize(None)
+        df.insert(1, "Date", stamp.dt.strftime("%Y-%m-%d"))
+        df.insert(2, "Time", stamp.dt.strftime("%H:%M:%S"))
+        return df
+
+    def rollup(self, period="hour", approach=None, since=None):
+        """Pre-aggregated vehicles / density per `period` bucket (and approach)."""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        sql = ("SELECT approach, bucket_start, vehicles, frames, density_sum / max(frames, 1) AS mean_density, "
+               "density_max FROM rollups WHERE period = ?")
+        params = [period]
+        if approach is not None:
+            sql += " AND approach = ?"
+            params.append(approach)
+        if since is not None:
+            sql += " AND bucket_start >= ?"
+            params.append(since)
+        df = self._query(sql + " ORDER BY bucket_start", tuple(params))
+        df.insert(1, "bucket", pd.to_datetime(df["bucket_start"], unit="s", utc=True)
+                  .dt.tz_convert(_local_tz()).dt.tz_localize(None))
+        return df
+
+    def _query(self, sql, params=()):
+        # Memoised per revision: reruns that find no new writes reuse the previous frame
+        key = (sql, params)
+        revision = self.revision()
+        hit = self._cache.get(key)
+        if hit is None or hit[0] != revision:
+            with self._lock:
+                df = pd.read_sql_query(sql, self._conn, params=params)
+            hit = self._cache[key] = (revision, df)
+        return hit[1].copy()
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                yield cur
+                cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+
+class IntervalRecorder:
+    """
+    Accumulates one live run into per-interval rows of an AnalyticsStore.
+
+    observe() is called for every analysed frame (e.g. from FramePipeline's on_inference
+    hook); a row is written whenever the wall-clock interval rolls over, and close()
+    writes the final partial interval and finishes the run.
+    """
+
+    def __init__(self, store, source="", approach="main", interval_s=60):
+        self.store = store
+        self.approach = approach
+        self.interval_s = interval_s
+        self.run_id = store.start_run(source, approach)
+        self.seen = set()
+        self._bucket = None
+        self._reset_counts()
+
+    def _reset_counts(self):
+        self._vehicles = 0
+        self._frames = 0
+        self._density_sum = 0.0
+        self._density_max = 0
+
+    def observe(self, detections, now=None):
+        bucket = _floor(now or time.time(), self.interval_s)
+        if self._bucket is not None and bucket != self._bucket:
+            self.flush()
+        self._bucket = bucket
+
+        ids = detections.normal_ids()
+        new = {i for i in ids.tolist() if i >= 0} - self.seen
+        self.seen.update(new)
+        count = detections.normal_count
+        self._vehicles += len(new)
+        self._frames += 1
+        self._density_sum += count
+        self._density_max = max(self._density_max, count)
+
+    def flush(self):
+        if self._bucket is not None and self._frames:
+            self.store.record_interval(self.run_id, self._bucket, self._vehicles, self._frames,
+                                       self._density_sum, self._density_max, self.approach)
+        self._reset_counts()
+
+    def close(self, signal_time_sec=0.0):
+        self.flush()
+        self.store.finish_run(self.run_id, len(self.seen), signal_time_sec)
+        return len(self.seen)
+
+
+def _floor(ts, seconds):
+    # Interval / hour / day boundaries in local time (as shown on the pages)
+    seconds = PERIODS.get(seconds, seconds)
+    offset = datetime.fromtimestamp(ts).astimezone().utcoffset().total_seconds()
+    return (ts + offset) // seconds * seconds - offset
+
+
+def _local_tz():
+    return datetime.now().astimezone().tzinfo
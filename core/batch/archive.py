@@ -0,0 +1,426 @@
+import csv
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+
+from core.timeseries.ring_buffer import CLASS_COLUMNS
+from core.tracking.iou_tracker import box_iou
+from core.video.frame_source import FrameSource
+
+VIDEO_SUFFIXES = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+INTERVAL_COLUMNS = ("interval_start_s", "interval_end_s", "vehicles", *CLASS_COLUMNS,
+                    "frames", "mean_density", "max_density", "emergency_frames")
+
+_WORKER = {}  # pool-process state: the detector built once by _init_worker
+
+
+def find_videos(inputs):
+    """Video files from a mix of file and directory paths (directories are walked, sorted)."""
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                videos.extend(os.path.join(root, f) for f in sorted(files)
+                              if f.lower().endswith(VIDEO_SUFFIXES))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            raise FileNotFoundError(path)
+    return videos
+
+
+def plan_segments(frame_count, fps, segment_s=300.0, overlap=30):
+    """
+    Split a video into segments of about `segment_s` seconds.
+
+    A segment owns [start, end) but decodes from head_start = start - overlap, so its
+    tracker is warmed up by the time it reaches its own frames. Those head frames are
+    the previous segment's last frames (its tail), which is where tracks are stitched.
+    The last segment has end None and reads to the end of the file, since containers
+    do not always report an exact frame count.
+    """
+    length = max(1, int(round(segment_s * fps)))
+    starts = list(range(0, max(1, int(frame_count)), length))
+    return [{"index": k, "start": start, "end": starts[k + 1] if k + 1 < len(starts) else None,
+             "head_start": max(0, start - overlap)}
+            for k, start in enumerate(starts)]
+
+
+def _init_worker(detector_kwargs, threads):
+    # Same pinning as core.streams.worker_pool: N processes share the cores
+    # instead of each spawning one thread per core
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already initialised in this process
+    cv2.setNumThreads(1)
+
+    from core.detection.vehicle_detector import VehicleDetector
+    _WORKER["detector"] = VehicleDetector(**detector_kwargs)
+
+
+def process_segment(task):
+    """
+    Analyse one segment in a pool process with a fresh tracker.
+
+    Returns a JSON-serialisable dict: every track's (first frame, last frame, class),
+    per-interval frame stats for the segment's own frames, the (frame, [[id, x1, y1,
+    x2, y2], ...]) rows of the head and tail overlap frames for stitching, and the
+    path of the annotated clip when one was requested.
+    """
+    from core.detection.detections import Detections
+    from core.pipeline.engine import annotate
+
+    detector = _WORKER["detector"]
+    detector.reset_tracker()
+    detector.attach_cache(task["video"])
+    seg = task["segment"]
+    start, end, head_start = seg["start"], seg["end"], seg["head_start"]
+    tail_start = None if end is None else end - task["overlap"]
+    frame_skip, bucket_frames = task["frame_skip"], task["bucket_frames"]
+
+    tracks, head, tail, buckets = {}, [], [], {}
+    pending, held = [], []  # analysed frames awaiting inference / own frames awaiting annotation
+    state = {"last": Detections.empty(), "writer": None}
+    clip = task.get("annotate")
+    partial = None if clip is None else clip[:-4] + ".partial.mp4"
+
+    def flush():
+        by_no = {}
+        results = detector.process_batch([frame for _, frame in pending], task["conf"],
+                                         positions=[no for no, _ in pending])
+        for (no, _), (detections, is_emergency) in zip(pending, results):
+            by_no[no] = detections
+            normal = detections.normal()
+            for obj_id, cls in zip(normal.ids.tolist(), normal.classes.tolist()):
+                if obj_id < 0:
+                    continue
+                track = tracks.setdefault(str(obj_id), [no, no, cls])
+                track[1] = no
+            rows = np.column_stack((normal.ids, normal.boxes)).round(1).tolist()
+            if no < start:
+                head.append([no, rows])
+                continue
+            if tail_start is not None and no >= tail_start:
+                tail.append([no, rows])
+            stats = buckets.setdefault(str(no // bucket_frames), [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += len(normal)
+            stats[2] = max(stats[2], len(normal))
+            stats[3] += int(is_emergency)
+        pending.clear()
+
+        for no, frame in held:
+            state["last"] = by_no.get(no, state["last"])
+            if state["writer"] is None:
+                h, w = frame.shape[:2]
+                state["writer"] = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*"mp4v"), task["fps"], (w, h))
+            state["writer"].write(annotate(frame, state["last"], (frame.shape[1], frame.shape[0])))
+        held.clear()
+
+    t0 = time.perf_counter()
+    # Annotated clips need every frame of the segment; otherwise only every frame_skip-th
+    # frame is decoded, on a prefetch thread, and the rest are grabbed or seeked over
+    stride = 1 if clip is not None else frame_skip
+    source = FrameSource(task["video"], start=head_start + (-head_start) % stride)
+    try:
+        for frame_no, frame in source.frames(stride, end, prefetch=detector.batch_size):
+            if frame_no % frame_skip == 0:
+                pending.append((frame_no, frame))
+            if clip is not None and frame_no >= start:
+                held.append((frame_no, frame))
+            if len(pending) >= detector.batch_size:
+                flush()
+        if pending or held:
+            flush()
+    finally:
+        source.release()
+        if state["writer"] is not None:
+            state["writer"].release()
+    if state["writer"] is not None:
+        os.replace(partial, clip)
+
+    frame_no = source.position if end is None else min(source.position, end)
+    return {"index": seg["index"], "start": start, "end": frame_no, "tracks": tracks, "head": head,
+            "tail": tail, "buckets": buckets, "seconds": round(time.perf_counter() - t0, 3),
+            "annotated": clip if state["writer"] is not None else None}
+
+
+def stitch_tracks(tail, head, min_iou=0.5):
+    """
+    Map the later segment's track ids to the earlier one's over their shared frames.
+
+    Both segments analysed the same overlap frames with independent trackers; a pair
+    of tracks is the same vehicle when their boxes agree across those frames. The score
+    is the summed per-frame IoU over the frames either track is present in, so briefly
+    co-located tracks do not match. Pairs are taken greedily, best score first.
+    """
+    earlier = {no: np.asarray(rows, dtype=np.float64).reshape(-1, 5) for no, rows in tail}
+    iou_sum, present = {}, {}
+    for no, rows in head:
+        later = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+        for obj_id in later[:, 0].astype(int).tolist():
+            present[("b", obj_id)] = present.get(("b", obj_id), 0) + 1
+        prev = earlier.get(no)
+        if prev is None:
+            continue
+        for obj_id in prev[:, 0].astype(int).tolist():
+            present[("a", obj_id)] = present.get(("a", obj_id), 0) + 1
+        if not len(prev) or not len(later):
+            continue
+        iou = box_iou(prev[:, 1:], later[:, 1:])
+        for i, j in zip(*np.nonzero(iou > 0)):
+            key = (int(prev[i, 0]), int(later[j, 0]))
+            iou_sum[key] = iou_sum.get(key, 0.0) + float(iou[i, j])
+
+    scored = []
+    for (a, b), total in iou_sum.items():
+        span = max(present.get(("a", a), 0), present.get(("b", b), 0))
+        scored.append((total / max(1, span), a, b))
+    links, used = {}, set()
+    for score, a, b in sorted(scored, reverse=True):
+        if score < min_iou:
+            break
+        if b in links or a in used:
+            continue
+        links[b] = a
+        used.add(a)
+    return links
+
+
+def merge_segments(results, min_iou=0.5):
+    """
+    Global vehicle list from per-segment results (in segment order).
+
+    A track linked to one in the previous segment keeps that vehicle; otherwise it is
+    a new vehicle, unless it only appeared in the head overlap, whose frames belong to
+    the previous segment. A new vehicle first seen in the head overlap is dated from the
+    segment's start, since the previous segment did not count it. Returns ({vehicle:
+    (first frame, class)}, links made).
+    """
+    vehicles, previous, linked = {}, {}, 0
+    for k, res in enumerate(results):
+        links = stitch_tracks(results[k - 1]["tail"], res["head"], min_iou) if k else {}
+        current = {}
+        for local, (first, last, cls) in res["tracks"].items():
+            prev_local = links.get(int(local))
+            if prev_local is not None and str(prev_local) in previous:
+                current[local] = previous[str(prev_local)]
+                linked += 1
+            elif last >= res["start"]:
+                current[local] = len(vehicles)
+                vehicles[current[local]] = (max(first, res["start"]), cls)
+        previous = current
+    return vehicles, linked
+
+
+def interval_rows(results, vehicles, fps, interval_s, bucket_frames):
+    """INTERVAL_COLUMNS rows: new vehicles (by class) and density per interval of video time."""
+    stats = {}
+    for res in results:
+        for bucket, (frames, density_sum, density_max, emergency) in res["buckets"].items():
+            s = stats.setdefault(int(bucket), [0, 0, 0, 0])
+            s[0] += frames
+            s[1] += density_sum
+            s[2] = max(s[2], density_max)
+            s[3] += emergency
+    new = {}
+    class_names = {cls: name for name, cls in CLASS_COLUMNS.items()}
+    for first, cls in vehicles.values():
+        counts = new.setdefault(first // bucket_frames, {})
+        counts[cls] = counts.get(cls, 0) + 1
+
+    duration = max((res["end"] for res in results), default=0) / fps
+    rows = []
+    for bucket in sorted(set(stats) | set(new)):
+        frames, density_sum, density_max, emergency = stats.get(bucket, (0, 0, 0, 0))
+        counts = new.get(bucket, {})
+        row = {"interval_start_s": round(bucket * interval_s, 3),
+               "interval_end_s": round(min((bucket + 1) * interval_s, duration), 3),
+               "vehicles": sum(counts.values())}
+        row.update({name: counts.get(cls, 0) for cls, name in class_names.items()})
+        row.update({"frames": frames, "mean_density": round(density_sum / max(1, frames), 3),
+                    "max_density": density_max, "emergency_frames": emergency})
+        rows.append(row)
+    return rows
+
+
+class ArchiveProcessor:
+    """
+    Headless analysis of recorded footage across a process pool.
+
+    Every video is cut into segments (plan_segments) and all pending segments of all
+    videos share one pool of detector processes, so a single long video still uses
+    every core. Tracks are stitched across segment boundaries before counting, and
+    each video gets <stem>_intervals.csv and <stem>_summary.json in `out_dir`.
+
+    Progress is checkpointed per video (<stem>.checkpoint.json) after every finished
+    segment; running the same job again skips finished videos and segments. A
+    checkpoint made with different parameters, or for a file that changed, is discarded.
+    """
+
+    def __init__(self, out_dir, detector_kwargs=None, conf=0.5, frame_skip=1, segment_s=300.0,
+                 overlap=30, interval_s=60, workers=None, threads_per_worker=1, annotate=False,
+                 min_iou=0.5):
+        self.out_dir = out_dir
+        self.detector_kwargs = detector_kwargs or {}
+        self.conf = conf
+        self.frame_skip = max(1, int(frame_skip))
+        self.segment_s = segment_s
+        self.overlap = max(0, int(overlap))
+        self.interval_s = interval_s
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.workers = workers
+        self.annotate = annotate
+        self.min_iou = min_iou
+        os.makedirs(out_dir, exist_ok=True)
+
+    def run(self, videos, log=print):
+        """Process `videos`; returns {video: summary dict} for every video that finished."""
+        jobs, tasks = {}, []
+        for video in videos:
+            job = self._load_job(video, log)
+            if job.get("summary"):
+                log(f"{video}: already done")
+                continue
+            jobs[video] = job
+            pending = [s for s in job["segments"] if str(s["index"]) not in job["results"]]
+            log(f"{video}: {len(pending)}/{len(job['segments'])} segment(s) to process")
+            tasks.extend(self._task(video, job, seg) for seg in pending)
+
+        summaries = {}
+        for video, job in jobs.items():
+            if len(job["results"]) == len(job["segments"]):
+                summaries[video] = self._finish(video, job)
+        if not tasks:
+            return summaries
+
+        ctx = mp.get_context("spawn")
+        pool = ctx.Pool(min(self.workers, len(tasks)), initializer=_init_worker,
+                        initargs=(self.detector_kwargs, self.threads_per_worker))
+        try:
+            for video, result in pool.imap_unordered(_run_task, tasks):
+                job = jobs[video]
+                job["results"][str(result["index"])] = result
+                self._save_checkpoint(video, job)
+                log(f"{video}: segment {result['index'] + 1}/{len(job['segments'])} "
+                    f"done in {result['seconds']:.1f}s")
+                if len(job["results"]) == len(job["segments"]):
+                    summaries[video] = self._finish(video, job)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return summaries
+
+    def _task(self, video, job, seg):
+        meta = job["video"]
+        clip = None
+        if self.annotate:
+            clip_dir = os.path.join(self.out_dir, f"{self._stem(video)}_annotated")
+            os.makedirs(clip_dir, exist_ok=True)
+            clip = os.path.join(clip_dir, f"segment_{seg['index']:04d}.mp4")
+        return {"video": video, "segment": seg, "conf": self.conf, "frame_skip": self.frame_skip,
+                "overlap": self.overlap, "fps": meta["fps"],
+                "bucket_frames": self._bucket_frames(meta["fps"]), "annotate": clip}
+
+    def _finish(self, video, job):
+        fps = job["video"]["fps"]
+        bucket_frames = self._bucket_frames(fps)
+        results = [job["results"][str(s["index"])] for s in job["segments"]]
+        vehicles, linked = merge_segments(results, self.min_iou)
+        rows = interval_rows(results, vehicles, fps, self.interval_s, bucket_frames)
+
+        stem = os.path.join(self.out_dir, self._stem(video))
+        with open(stem + "_intervals.csv.tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=INTERVAL_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(stem + "_intervals.csv.tmp", stem + "_intervals.csv")
+
+        frames = sum(r["frames"] for r in rows)
+        summary = {
+            "video": os.path.abspath(video),
+            "fps": fps,
+            "duration_s": round(max(r["end"] for r in results) / fps, 3),
+            "segments": len(results),
+            "unique_vehicles": len(vehicles),
+            "stitched_tracks": linked,
+            "frames_analysed": frames,
+            "mean_density": round(sum(r["mean_density"] * r["frames"] for r in rows) / max(1, frames), 3),
+            "emergency_frames": sum(r["emergency_frames"] for r in rows),
+            "worker_seconds": round(sum(r["seconds"] for r in results), 3),
+            "annotated": [r["annotated"] for r in results if r["annotated"]],
+        }
+        _write_json(stem + "_summary.json", summary)
+        job["summary"] = summary
+        self._save_checkpoint(video, job)
+        return summary
+
+    # ---------------- checkpoints ----------------
+    def _params(self):
+        kwargs = {k: v for k, v in self.detector_kwargs.items() if k != "batch_size"}
+        return json.loads(json.dumps({
+            "conf": self.conf, "frame_skip": self.frame_skip, "segment_s": self.segment_s,
+            "overlap": self.overlap, "interval_s": self.interval_s, "annotate": self.annotate,
+            "detector": kwargs,
+        }, default=str))
+
+    def _load_job(self, video, log=print):
+        stat = os.stat(video)
+        identity = {"size": stat.st_size, "mtime": stat.st_mtime}
+        path = self._checkpoint_path(video)
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+                if job["identity"] == identity and job["params"] == self._params():
+                    return job
+            except (OSError, ValueError, KeyError):
+                pass
+            log(f"{video}: checkpoint does not match this file or these settings, starting over")
+
+        cap = cv2.VideoCapture(video)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {video}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        job = {"identity": identity, "params": self._params(),
+               "video": {"fps": fps, "frame_count": frame_count},
+               "segments": plan_segments(frame_count, fps, self.segment_s, self.overlap),
+               "results": {}, "summary": None}
+        self._save_checkpoint(video, job)
+        return job
+
+    def _save_checkpoint(self, video, job):
+        _write_json(self._checkpoint_path(video), job)
+
+    def _checkpoint_path(self, video):
+        return os.path.join(self.out_dir, f"{self._stem(video)}.checkpoint.json")
+
+    def _bucket_frames(self, fps):
+        return max(1, int(round(self.interval_s * fps)))
+
+    @staticmethod
+    def _stem(video):
+        return os.path.splitext(os.path.basename(video))[0]
+
+
+def _run_task(task):
+    return task["video"], process_segment(task)
+
+
+def _write_json(path, data):
+    # Write-then-rename: an interrupted job never leaves a truncated checkpoint behind
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,176 @@
+import cv2
+import numpy as np
+
+
+class CountingLine:
+    def __init__(self, name, p1, p2):
+        self.name = name
+        self.p1 = np.asarray(p1, dtype=np.float32)
+        self.p2 = np.asarray(p2, dtype=np.float32)
+        self.counted = set()  # O(1) "already counted" checks
+        self.counts = {"in": 0, "out": 0}
+
+    @property
+    def total(self):
+        return self.counts["in"] + self.counts["out"]
+
+
+class CountingZone:
+    def __init__(self, name, polygon):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+        self.counted = set()
+
+    @property
+    def total(self):
+        return len(self.counted)
+
+
+class LineCrossingCounter:
+    """
+    Unique-vehicle flow counts from tracker output (a Detections object).
+
+    Lines count a track when its centroid moves across the segment between two
+    observations; "in" / "out" is which side it ends up on (left / right of p1->p2).
+    Zones count a track the first time its centroid is inside the polygon. Zone
+    polygons and the optional ROI mask are rasterised once, so per-frame work is a
+    handful of vectorised array operations and a pixel lookup per centroid.
+    """
+
+    def __init__(self, lines=(), zones=(), frame_shape=None, roi_mask=None, max_age=30):
+        self.lines = [CountingLine(*line) for line in lines]
+        self.zones = [CountingZone(*zone) for zone in zones]
+        self.max_age = max_age
+
+        self.roi_mask = None
+        if roi_mask is not None:
+            mask = cv2.imread(roi_mask, cv2.IMREAD_GRAYSCALE) if isinstance(roi_mask, str) else roi_mask
+            if mask is None:
+                raise FileNotFoundError(f"ROI mask not found: {roi_mask}")
+            if mask.ndim == 3:
+                mask = mask.max(axis=2)
+            self.roi_mask = mask > 0
+
+        # Zone label map: 0 = outside, k = inside zone k (later zones win on overlap)
+        self.zone_map = None
+        if self.zones:
+            if frame_shape is None:
+                raise ValueError("frame_shape is required to rasterise counting zones")
+            self.zone_map = np.zeros(frame_shape[:2], dtype=np.uint8)
+            for k, zone in enumerate(self.zones, start=1):
+                cv2.fillPoly(self.zone_map, [zone.polygon], k)
+
+        self._frame = 0
+        self._prev_ids = np.empty(0, dtype=np.int64)
+        self._prev_pts = np.empty((0, 2), dtype=np.float32)
+        self._prev_seen = np.empty(0, dtype=np.int64)
+
+    def reset(self):
+        for item in self.lines + self.zones:
+            item.counted.clear()
+        for line in self.lines:
+            line.counts = {"in": 0, "out": 0}
+        self._frame = 0
+        self._prev_ids = np.empty(0, dtype=np.int64)
+        self._prev_pts = np.empty((0, 2), dtype=np.float32)
+        self._prev_seen = np.empty(0, dtype=np.int64)
+
+    def update(self, detections):
+        """Feed one frame of tracks; returns the IDs newly counted per line/zone name."""
+        self._frame += 1
+        tracks = detections.normal()
+        keep = tracks.ids >= 0
+        ids, pts = tracks.ids[keep], tracks.centroids()[keep]
+
+        if self.roi_mask is not None and len(ids):
+            inside = self._lookup(self.roi_mask, pts)
+            ids, pts = ids[inside], pts[inside]
+
+        new = {item.name: [] for item in self.lines + self.zones}
+        if self.lines and len(ids):
+            _, cur_idx, prev_idx = np.intersect1d(ids, self._prev_ids, assume_unique=True, return_indices=True)
+            moved_ids = ids[cur_idx]
+            start, end = self._prev_pts[prev_idx], pts[cur_idx]
+            for line in self.lines:
+                crossed, side = _crossings(start, end, line.p1, line.p2)
+                for obj_id, direction in zip(moved_ids[crossed].tolist(), side[crossed].tolist()):
+                    if obj_id not in line.counted:
+                        line.counted.add(obj_id)
+                        line.counts["in" if direction else "out"] += 1
+                        new[line.name].append(obj_id)
+
+        if self.zones and len(ids):
+            labels = self._lookup(self.zone_map, pts)
+            for k, zone in enumerate(self.zones, start=1):
+                entered = [i for i in ids[labels == k].tolist() if i not in zone.counted]
+                zone.counted.update(entered)
+                new[zone.name] = entered
+
+        self._remember(ids, pts)
+        return new
+
+    def totals(self):
+        totals = {line.name: dict(line.counts, total=line.total) for line in self.lines}
+        totals.update({zone.name: {"total": zone.total} for zone in self.zones})
+        return totals
+
+    def draw(self, frame):
+        for line in self.lines:
+            cv2.line(frame, tuple(map(int, line.p1)), tuple(map(int, line.p2)), (0, 0, 255), 5)
+        for zone in self.zones:
+            cv2.polylines(frame, [zone.polygon], True, (255, 0, 255), 2)
+        return frame
+
+    @staticmethod
+    def _lookup(raster, pts):
+        h, w = raster.shape[:2]
+        xs = np.clip(pts[:, 0].astype(np.int64), 0, w - 1)
+        ys = np.clip(pts[:, 1].astype(np.int64), 0, h - 1)
+        return raster[ys, xs]
+
+    def _remember(self, ids, pts):
+        # Keep the last known centroid of every track seen in the past `max_age` frames,
+        # so a track that drops out for a few frames still registers its crossing.
+        alive = (self._frame - self._prev_seen) <= self.max_age
+        alive &= ~np.isin(self._prev_ids, ids)
+        self._prev_ids = np.concatenate([self._prev_ids[alive], ids])
+        self._prev_pts = np.concatenate([self._prev_pts[alive], pts.astype(np.float32)])
+        self._prev_seen = np.concatenate([self._prev_seen[alive], np.full(len(ids), self._frame)])
+
+
+def _crossings(start, end, p1, p2):
+    # Vectorised segment-segment intersection of movements start->end with the line p1->p2
+    d = p2 - p1
+    side_start = d[0] * (start[:, 1] - p1[1]) - d[1] * (start[:, 0] - p1[0])
+    side_end = d[0] * (end[:, 1] - p1[1]) - d[1] * (end[:, 0] - p1[0])
+    m = end - start
+    s1 = m[:, 0] * (p1[1] - start[:, 1]) - m[:, 1] * (p1[0] - start[:, 0])
+    s2 = m[:, 0] * (p2[1] - start[:, 1]) - m[:, 1] * (p2[0] - start[:, 0])
+    crossed = ((side_start > 0) != (side_end > 0)) & (side_end != 0) & (s1 * s2 <= 0)
+    return crossed, side_end > 0
+
+
+class OverlayAsset:
+    """A BGRA overlay (e.g. graphics.png) decoded once, with its alpha blend weights precomputed."""
+
+    def __init__(self, path, position=(0, 0)):
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise FileNotFoundError(f"Overlay not found: {path}")
+        if image.shape[2] == 3:
+            image = np.dstack([image, np.full(image.shape[:2], 255, dtype=np.uint8)])
+        self.position = position
+        alpha = image[:, :, 3:].astype(np.float32) / 255.0
+        self._color = image[:, :, :3].astype(np.float32) * alpha
+        self._inv_alpha = 1.0 - alpha
+
+    def apply(self, frame):
+        # Blend in place, touching only the overlay's footprint
+        x, y = self.position
+        h = min(self._color.shape[0], frame.shape[0] - y)
+        w = min(self._color.shape[1], frame.shape[1] - x)
+        if h <= 0 or w <= 0:
+            return frame
+        region = frame[y:y + h, x:x + w]
+        region[:] = (region * self._inv_alpha[:h, :w] + self._color[:h, :w]).astype(np.uint8)
+        return frame
@@ -1,15 +1,55 @@
+from core.density.occupancy import LaneOccupancy
+
+
 class DensityCalculator:
-    def __init__(self, lane_area_pixels=100000):
+    def __init__(self, lane_area_pixels=100000, lanes=None, cell=4):
         self.lane_area = lane_area_pixels
+        # Optional {lane_name: polygon points in frame pixels}; without lanes the whole
+        # frame is treated as a single lane for occupancy.
+        self.lanes = lanes or {}
+        self.cell = cell
+        self._occupancy = None
 
     def calculate_density(self, detections):
-        # Simple density: count of vehicles
-        # Advanced: sum of area of bounding boxes / total lane area
-        count = len(detections)
+        # Simple density: count of vehicles (a Detections object; emergency rows excluded)
+        # Advanced: see calculate_occupancy
+        count = detections.normal_count
 
         if count < 5:
             return "LOW", count
         elif 5 <= count < 15:
             return "MEDIUM", count
         else:
-            return "HIGH", count
\ No newline at end of file
+            return "HIGH", count
+
+    def calculate_occupancy(self, detections, frame_shape=None):
+        """
+        Advanced density: union of bounding-box area / lane area, per lane.
+
+        Returns (level, overall_occupancy, {lane: occupancy}). Without a frame shape
+        this falls back to summed box area over `lane_area_pixels`.
+        """
+        if frame_shape is None:
+            overall = min(1.0, float(detections.areas().sum()) / self.lane_area)
+            return self._level(overall), overall, {}
+
+        engine = self._engine(frame_shape)
+        per_lane = engine.compute(detections.boxes)
+        overall = float((per_lane * engine.lane_cells).sum() / engine.lane_cells.sum())
+        return self._level(overall), overall, dict(zip(engine.names, per_lane.tolist()))
+
+    def _engine(self, frame_shape):
+        if self._occupancy is None or self._occupancy.frame_shape != tuple(frame_shape[:2]):
+            h, w = frame_shape[:2]
+            lanes = self.lanes or {"frame": [(0, 0), (w, 0), (w, h), (0, h)]}
+            self._occupancy = LaneOccupancy(lanes, frame_shape, self.cell)
+        return self._occupancy
+
+    @staticmethod
+    def _level(occupancy):
+        if occupancy < 0.15:
+            return "LOW"
+        elif occupancy < 0.4:
+            return "MEDIUM"
+        else:
+            return "HIGH"
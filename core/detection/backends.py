@@ -0,0 +1,201 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from core.detection.model_loader import resolve_weights, weights_digest
+
+# "torch"    - eager PyTorch on the .pt weights (CUDA when available)
+# "onnx"     - ONNX Runtime on CPU
+# "openvino" - OpenVINO on CPU
+BACKENDS = ("torch", "onnx", "openvino")
+
+CALIBRATION_FRAMES = 300
+
+
+def load_model(weights, backend="torch", int8=False, calibration_video=None, imgsz=640):
+    """
+    YOLO model for `weights` on the requested runtime.
+
+    `weights` is resolved with resolve_weights(). Every backend loads from a cached
+    artifact keyed by the weights' content hash: the Conv+BN-fused model for torch,
+    the export for the others, so a restart skips fusing / exporting. Exports use
+    dynamic batch / image axes so batched frames and the emergency cascade's small
+    crops go through the same artifact. With int8=True the
+    model is post-training quantized, calibrated on frames sampled from
+    `calibration_video` (our own footage rather than COCO).
+    """
+    artifact = export_model(weights, backend, int8, calibration_video, imgsz)
+    return YOLO(str(artifact)) if backend == "torch" else YOLO(str(artifact), task="detect")
+
+
+def export_model(weights, backend="torch", int8=False, calibration_video=None, imgsz=640):
+    """Build (or reuse) the artifact for `backend` and return its path."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    weights = resolve_weights(weights)
+    if backend == "torch":
+        if int8:
+            raise ValueError("INT8 quantization needs the onnx or openvino backend")
+        return _fused_torch(weights)
+    if int8 and not calibration_video:
+        raise ValueError("INT8 quantization needs a calibration_video")
+    if backend == "onnx":
+        return _export_onnx(weights, int8, calibration_video, imgsz)
+    return _export_openvino(weights, int8, calibration_video, imgsz)
+
+
+def _fresh(artifact, weights, calibration=""):
+    # Content hash rather than mtime: copies (images, rsync) reset mtimes both ways
+    stamp = artifact.with_name(artifact.name + ".sha256")
+    return (artifact.exists() and stamp.exists()
+            and stamp.read_text().strip() == _stamp_text(weights, calibration))
+
+
+def _stamp(artifact, weights, calibration=""):
+    artifact.with_name(artifact.name + ".sha256").write_text(_stamp_text(weights, calibration))
+
+
+def _stamp_text(weights, calibration):
+    return f"{weights_digest(weights)} {calibration}".strip()
+
+
+def _calibration_key(video_path, imgsz):
+    # What an INT8 artifact was calibrated on. Size and mtime rather than a content hash:
+    # hashing a long video on every start is slow, and a false mismatch only recalibrates
+    st = os.stat(video_path)
+    return f"calibration={os.path.abspath(video_path)}:{st.st_size}:{st.st_mtime_ns} imgsz={imgsz}"
+
+
+def _fused_torch(weights):
+    # The predictor fuses Conv+BN on every start; cache the fused module instead.
+    # Loading it back the predictor sees an already-fused model and skips the work.
+    cache = weights.parent / ".cache" / f"{weights.stem}-{weights_digest(weights)}.fused.pt"
+    if cache.exists():
+        return cache
+    model = YOLO(str(weights))
+    model.model.fuse(verbose=False)
+    try:
+        cache.parent.mkdir(exist_ok=True)
+        for old in cache.parent.glob(f"{weights.stem}-*.fused.pt"):
+            old.unlink(missing_ok=True)  # artifacts of earlier versions of these weights
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.part")
+        torch.save({"model": model.model, "train_args": model.ckpt.get("train_args", {})}, tmp)
+        os.replace(tmp, cache)
+    except OSError:
+        return weights  # read-only models/: fall back to fusing at load time
+    return cache
+
+
+def _export_onnx(weights, int8, calibration_video, imgsz):
+    fp32 = weights.with_suffix(".onnx")
+    if not _fresh(fp32, weights):
+        YOLO(str(weights)).export(format="onnx", dynamic=True, imgsz=imgsz)
+        _stamp(fp32, weights)
+    if not int8:
+        return fp32
+
+    quantized = weights.with_name(f"{weights.stem}_int8.onnx")
+    calibration = _calibration_key(calibration_video, imgsz)
+    if not _fresh(quantized, weights, calibration):
+        _quantize_onnx(fp32, quantized, calibration_frames(calibration_video), imgsz)
+        _stamp(quantized, weights, calibration)
+    return quantized
+
+
+def _quantize_onnx(src, dst, frames, imgsz):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            return None if frame is None else {"images": _letterbox(frame, imgsz)}
+
+    # Only the convolutions are quantized; box decoding (Sigmoid / Mul / Sub in the
+    # head) stays in fp32, which is where int8 would cost the most accuracy.
+    tmp = dst.with_suffix(".part")
+    quantize_static(str(src), str(tmp), FrameReader(), quant_format=QuantFormat.QDQ,
+                    op_types_to_quantize=["Conv"], per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # AutoBackend reads names / stride / imgsz from the metadata of the exported model
+    model = onnx.load(str(tmp))
+    meta = {p.key: p.value for p in onnx.load(str(src), load_external_data=False).metadata_props}
+    del model.metadata_props[:]
+    for key, value in meta.items():
+        model.metadata_props.add(key=key, value=value)
+    onnx.save(model, str(tmp))
+    os.replace(tmp, dst)
+
+
+def _export_openvino(weights, int8, calibration_video, imgsz):
+    suffix = "_int8_openvino_model" if int8 else "_openvino_model"
+    artifact = weights.with_name(weights.stem + suffix)
+    xml = artifact / weights.with_suffix(".xml").name
+    calibration = _calibration_key(calibration_video, imgsz) if int8 else ""
+    if _fresh(xml, weights, calibration):
+        return artifact
+
+    data = _calibration_dataset(weights, calibration_video) if int8 else None
+    YOLO(str(weights)).export(format="openvino", dynamic=True, imgsz=imgsz, int8=int8, data=data)
+    _stamp(xml, weights, calibration)
+    return artifact
+
+
+def _calibration_dataset(weights, video_path):
+    # ultralytics' OpenVINO INT8 export calibrates from a YOLO data YAML; point it at
+    # frames from our footage (labels are not needed for calibration)
+    from ultralytics.utils import yaml_save
+
+    root = weights.with_name(f"{weights.stem}_calibration")
+    images = root / "images"
+    shutil.rmtree(root, ignore_errors=True)
+    images.mkdir(parents=True)
+    for i, frame in enumerate(calibration_frames(video_path)):
+        cv2.imwrite(str(images / f"{i:05d}.jpg"), frame)
+
+    names = YOLO(str(weights)).names
+    data = root / "data.yaml"
+    yaml_save(data, {"path": str(root), "train": "images", "val": "images", "names": names})
+    return str(data)
+
+
+def calibration_frames(video_path, count=CALIBRATION_FRAMES):
+    """Up to `count` frames spread evenly over the whole video."""
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+        wanted = set(np.linspace(0, total - 1, min(count, total)).astype(int).tolist())
+        frames = []
+        index = 0
+        while cap.isOpened() and len(frames) < len(wanted):
+            if not cap.grab():
+                break
+            if index in wanted:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames.append(frame)
+            index += 1
+    finally:
+        cap.release()
+    if not frames:
+        raise ValueError(f"No calibration frames could be read from {video_path}")
+    return frames
+
+
+def _letterbox(frame, imgsz):
+    # Same preprocessing as the ultralytics predictor: letterbox to a square, BGR->RGB, 0..1 NCHW
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(canvas[..., ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255.0
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class Detections:
+    """
+    Struct-of-arrays detection results for one frame.
+
+    boxes (N, 4) float32 xyxy, ids (N,) int64 (-1 when untracked), classes (N,) int64,
+    confidences (N,) float32 and emergency (N,) bool, which marks rows produced by the
+    emergency model rather than the traffic tracker.
+    """
+
+    __slots__ = ("boxes", "ids", "classes", "confidences", "emergency")
+
+    def __init__(self, boxes, ids=None, classes=None, confidences=None, emergency=False):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        n = len(self.boxes)
+        self.ids = _column(ids, n, -1, np.int64)
+        self.classes = _column(classes, n, -1, np.int64)
+        self.confidences = _column(confidences, n, 1.0, np.float32)
+        self.emergency = _column(emergency, n, False, bool)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 4), dtype=np.float32))
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            np.concatenate([p.boxes for p in parts]),
+            np.concatenate([p.ids for p in parts]),
+            np.concatenate([p.classes for p in parts]),
+            np.concatenate([p.confidences for p in parts]),
+            np.concatenate([p.emergency for p in parts]),
+        )
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, index):
+        # Boolean mask, integer array or slice -> a new Detections over the selected rows
+        return Detections(self.boxes[index], self.ids[index], self.classes[index],
+                          self.confidences[index], self.emergency[index])
+
+    def __repr__(self):
+        return f"Detections(n={len(self)}, emergency={int(self.emergency.sum())})"
+
+    @property
+    def is_emergency(self):
+        return bool(self.emergency.any())
+
+    @property
+    def normal_count(self):
+        return int(len(self) - self.emergency.sum())
+
+    def normal(self):
+        return self[~self.emergency]
+
+    def normal_ids(self):
+        return self.ids[~self.emergency]
+
+    def centroids(self):
+        return (self.boxes[:, :2] + self.boxes[:, 2:]) * 0.5
+
+    def areas(self):
+        wh = np.clip(self.boxes[:, 2:] - self.boxes[:, :2], 0, None)
+        return wh[:, 0] * wh[:, 1]
+
+    def scaled(self, sx, sy):
+        return Detections(self.boxes * np.array([sx, sy, sx, sy], dtype=np.float32),
+                          self.ids, self.classes, self.confidences, self.emergency)
+
+
+def _column(values, n, fill, dtype):
+    if values is None or np.isscalar(values):
+        return np.full(n, fill if values is None else values, dtype=dtype)
+    return np.asarray(values, dtype=dtype).reshape(n)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from core.preprocess.roi import PAD_VALUE
+
+# Repository root: models/ lives here, whatever directory the pages are started from
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+_digests = {}
+
+
+def resolve_weights(weights):
+    """
+    Absolute path of a weights file given as absolute, or relative to the working
+    directory, $MODELS_DIR or the repository root (in that order).
+    """
+    path = Path(weights)
+    candidates = [path] if path.is_absolute() else [Path.cwd() / path]
+    if not path.is_absolute():
+        if os.getenv("MODELS_DIR"):
+            candidates.append(Path(os.getenv("MODELS_DIR")) / path.name)
+        candidates.append(REPO_ROOT / path)
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate.resolve()
+    raise FileNotFoundError(f"Model weights {weights} not found; looked in: "
+                            + ", ".join(str(c) for c in candidates))
+
+
+def weights_digest(path):
+    """SHA-256 prefix of a weights file, memoised per (path, size, mtime)."""
+    stat = os.stat(path)
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = _digests[key] = h.hexdigest()[:16]
+    return digest
+
+
+def warmup_model(model, canvases, batch_sizes=(1,), **predict_kwargs):
+    """
+    Run the model once per canvas shape and batch size, so the predictor setup (and on
+    GPU the per-shape kernel selection) happens before the first real frame.
+    """
+    for canvas in canvases:
+        for n in batch_sizes:
+            model.predict([canvas] * n, imgsz=max(canvas.shape[:2]), verbose=False, **predict_kwargs)
+
+
+def blank_canvases(preprocessor, frame_shape):
+    """One letterboxed pad-colour canvas per inference size, shaped like real input."""
+    return [np.full((h, w, 3), PAD_VALUE, dtype=np.uint8) for h, w in preprocessor.canvas_shapes(frame_shape)]
+
+
+class ModelHandle:
+    """
+    A model that is loaded (and warmed up) by `loader` on a background thread.
+
+    get() waits for it and re-raises any loading error; `ready` tells whether it
+    would return immediately. With background=False the loader runs in place.
+    """
+
+    def __init__(self, loader, name="model", background=True):
+        self.name = name
+        self._model = None
+        self._error = None
+        self._done = threading.Event()
+        if background:
+            threading.Thread(target=self._load, args=(loader,), name=f"load-{name}", daemon=True).start()
+        else:
+            self._load(loader)
+
+    def _load(self, loader):
+        try:
+            self._model = loader()
+        except BaseException as e:  # surfaced to the caller of get()
+            self._error = e
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} still loading")
+        if self._error is not None:
+            raise self._error
+        return self._model
@@ -0,0 +1,188 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from core.detection.model_loader import weights_digest
+
+# One cached detection: box in letterboxed-canvas pixels, confidence, class
+ROW_DTYPE = np.dtype([("box", "<f4", 4), ("conf", "<f4"), ("cls", "u1")])
+
+_HEX64 = re.compile(r"[0-9a-f]{64}")
+
+
+def video_digest(path):
+    """Content hash of a video; files named by VideoStore already carry theirs."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _HEX64.fullmatch(stem):
+        return stem[:16]
+    return weights_digest(path)
+
+
+class CachedVideo:
+    """
+    Raw model detections of one video under one model configuration.
+
+    One table per inference size, each three memory-mapped .npy files indexed by
+    frame (0-based position in the file):
+      rows   (frames, slots) ROW_DTYPE - the frame's detections, most confident first
+      count  (frames,) int16           - rows stored + 1; 0 while the frame is not cached
+      floor  (frames,) float32         - lowest confidence threshold the rows are complete for
+    Files are created sparse, so only cached frames take disk space. A frame with more
+    than `slots` detections keeps the most confident ones and raises its floor above
+    the first one dropped; get() only serves thresholds at or above the floor.
+    """
+
+    def __init__(self, path, frame_count, min_conf, slots):
+        self.path = path
+        self.frame_count = frame_count
+        self.min_conf = min_conf
+        self.slots = slots
+        self.hits = 0
+        self.misses = 0
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, index, imgsz, conf):
+        """(n, 6) float32 x1, y1, x2, y2, conf, cls rows for a frame, or None if not cached for `conf`."""
+        table = self._table(imgsz, create=False)
+        if table is None or not 0 <= index < self.frame_count:
+            self.misses += 1
+            return None
+        rows, count, floor = table
+        n = int(count[index]) - 1
+        if n < 0 or conf < floor[index]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        stored = rows[index, :n]
+        return np.column_stack((stored["box"], stored["conf"], stored["cls"])).astype(np.float32)
+
+    def put(self, index, imgsz, data):
+        """Store a frame's (n, 6) detections, predicted at a threshold of at most min_conf."""
+        if not 0 <= index < self.frame_count:
+            return
+        rows, count, floor = self._table(imgsz, create=True)
+        data = data[np.argsort(-data[:, 4], kind="stable")]
+        kept = data[:self.slots]
+        row = rows[index]
+        row["box"][:len(kept)] = kept[:, :4]
+        row["conf"][:len(kept)] = kept[:, 4]
+        row["cls"][:len(kept)] = kept[:, 5]
+        floor[index] = self.min_conf if len(data) <= self.slots else np.nextafter(np.float32(data[self.slots, 4]),
+                                                                                  np.float32(np.inf))
+        count[index] = len(kept) + 1  # published last: readers never see a half-written frame
+
+    def _table(self, imgsz, create):
+        table = self._tables.get(imgsz)
+        if table is not None:
+            return table
+        with self._lock:
+            table = self._tables.get(imgsz)
+            if table is not None:
+                return table
+            directory = os.path.join(self.path, f"s{imgsz}")
+            if not os.path.isdir(directory):
+                if not create:
+                    return None
+                self._create(directory)
+            table = self._tables[imgsz] = tuple(
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r+") for name in ("rows", "count", "floor"))
+            return table
+
+    def _create(self, directory):
+        # Built in a scratch directory and renamed into place, so another process
+        # creating the same table at the same time cannot leave a half-made one
+        os.makedirs(self.path, exist_ok=True)
+        scratch = tempfile.mkdtemp(dir=self.path, prefix=".part-")
+        try:
+            for name, dtype, shape in (("rows", ROW_DTYPE, (self.frame_count, self.slots)),
+                                       ("count", np.int16, (self.frame_count,)),
+                                       ("floor", np.float32, (self.frame_count,))):
+                array = np.lib.format.open_memmap(os.path.join(scratch, f"{name}.npy"), mode="w+",
+                                                  dtype=dtype, shape=shape)
+                del array
+            os.rename(scratch, directory)
+        except OSError:
+            shutil.rmtree(scratch, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
+
+
+class DetectionCache:
+    """
+    Disk-backed cache of raw detections, so replays and threshold changes skip the model.
+
+    Entries are keyed by video content hash and a model key (weights hash plus everything
+    else that changes the raw output, see VehicleDetector.cache_key); inside an entry,
+    detections are stored per inference size and frame. They are recorded at `min_conf`,
+    so any higher threshold is served by filtering. Directory mtime doubles as the LRU
+    clock, like VideoStore; entries are evicted oldest first once the cache grows past
+    `quota_bytes` (allocated blocks, since the tables are sparse).
+    """
+
+    def __init__(self, root, quota_bytes=512 * 1024 ** 2, min_conf=0.1, slots=64):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.min_conf = min_conf
+        self.slots = slots
+        self._open = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def open(self, video_path, model_key):
+        """The CachedVideo for `video_path` under `model_key`, marked as recently used."""
+        path = os.path.join(self.root, f"{video_digest(video_path)}-{model_key}")
+        with self._lock:
+            entry = self._open.get(path)
+            if entry is None:
+                cap = cv2.VideoCapture(video_path)
+                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                cap.release()
+                entry = self._open[path] = CachedVideo(path, max(0, frame_count), self.min_conf, self.slots)
+            os.makedirs(path, exist_ok=True)
+            os.utime(path)
+            self.evict(keep=(path,))
+        return entry
+
+    def usage(self):
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, keep=()):
+        entries = sorted(self._entries(), key=lambda e: e[1])  # least recently used first
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.quota_bytes:
+                break
+            if path in keep:
+                continue
+            # Open memory maps stay valid after the files are unlinked; whoever still
+            # holds them just writes into an entry nobody will read again
+            self._open.pop(path, None)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            size = 0
+            for dirpath, _, files in os.walk(path):
+                for f in files:
+                    try:
+                        st = os.stat(os.path.join(dirpath, f))
+                    except FileNotFoundError:
+                        continue
+                    # Allocated size where the platform reports it; sparse tables are mostly holes
+                    size += st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+            try:
+                entries.append((path, os.stat(path).st_mtime, size))
+            except FileNotFoundError:
+                pass
+        return entries
@@ -0,0 +1,74 @@
+import time
+from collections import deque
+
+
+class DetectionStream:
+    """
+    Everything a VehicleDetector remembers about one video stream.
+
+    The detector itself only holds the models, so one detector can serve any number of
+    streams (browser sessions, approaches) at once; each stream brings its own tracker,
+    adaptive preprocessor and emergency-cascade bookkeeping, and never sees another
+    stream's track ids. Create one with VehicleDetector.new_stream().
+    """
+
+    def __init__(self, tracker, preprocessor):
+        self.tracker = tracker
+        self.preprocessor = preprocessor
+        self.cache = None  # {"traffic": CachedVideo, "emergency": CachedVideo} for the video being read
+        self.reset()
+
+    def reset(self):
+        self.tracker.reset()
+        self.preprocessor.density = 0.0
+        self.frame_no = 0
+        self.last_checked = {}    # track id -> frame_no of last emergency check
+        self.first_seen = {}      # track id -> (frame_no, wall time)
+        self.last_seen = {}       # track id -> frame_no
+        self.emergency_ids = {}   # track id -> emergency-model confidence
+        self.emergency_stats = {
+            "frames": 0,
+            "full_frame_runs": 0,
+            "crop_runs": 0,
+            "crops": 0,
+            "full_frame_seconds": 0.0,
+            "crop_seconds": 0.0,
+        }
+        self.alert_latencies = deque(maxlen=100)  # (frames, seconds) from first sighting to alert
+
+    def flag(self, obj_id, frame_no, now, conf):
+        if obj_id not in self.emergency_ids:
+            first_frame, first_time = self.first_seen.get(obj_id, (frame_no, now))
+            self.alert_latencies.append((frame_no - first_frame, time.perf_counter() - first_time))
+        self.emergency_ids[obj_id] = conf
+
+    def prune(self, frame_no, horizon=300):
+        # Forget tracks that have been gone for a while so the bookkeeping stays bounded
+        stale = [i for i, seen in self.last_seen.items() if frame_no - seen > horizon]
+        for obj_id in stale:
+            for d in (self.last_seen, self.first_seen, self.last_checked, self.emergency_ids):
+                d.pop(obj_id, None)
+
+
+class PreparedFrames:
+    """
+    Frames of one stream, letterboxed and numbered, waiting for VehicleDetector.run_prepared().
+
+    The images are views into the stream preprocessor's reused buffers, so a stream can
+    only have one PreparedFrames in flight at a time.
+    """
+
+    __slots__ = ("stream", "frames", "conf", "images", "transforms", "imgsz", "frame_nos", "positions")
+
+    def __init__(self, stream, frames, conf, images, transforms, imgsz, frame_nos, positions):
+        self.stream = stream
+        self.frames = frames
+        self.conf = conf
+        self.images = images
+        self.transforms = transforms
+        self.imgsz = imgsz
+        self.frame_nos = frame_nos
+        self.positions = positions  # index of each frame in its video file, or None
+
+    def __len__(self):
+        return len(self.frames)
@@ -1,49 +1,440 @@
+import hashlib
+import threading
+import time
+from itertools import accumulate
+
+import numpy as np
 import torch
-from ultralytics import YOLO
+
+from core.detection.backends import load_model
+from core.detection.detections import Detections
+from core.detection.model_loader import ModelHandle, blank_canvases, resolve_weights, warmup_model, weights_digest
+from core.detection.result_cache import DetectionCache
+from core.detection.stream import DetectionStream, PreparedFrames
+from core.metrics.registry import CACHE_LOOKUPS, MODEL_SECONDS, STAGE_SECONDS
+from core.preprocess.roi import PAD_VALUE, InferencePreprocessor
+from core.tracking.iou_tracker import box_iou
+from core.tracking.trackers import create_tracker
+from core.video.frame_source import FrameSource
+
+# car(2), motorcycle(3), bus(5), truck(7)
+VEHICLE_CLASSES = [2, 3, 5, 7]
+# Only these can be an ambulance / fire engine: car(2), bus(5), truck(7)
+EMERGENCY_CANDIDATE_CLASSES = [2, 5, 7]
+
+EMERGENCY_CONF = 0.75
+
+TRAFFIC_WEIGHTS = 'models/yolov8n.pt'
+EMERGENCY_WEIGHTS = 'models/emergency_best.pt'
+
 
 class VehicleDetector:
-    def __init__(self):
+    """
+    Traffic tracking plus emergency-vehicle detection.
+
+    emergency_mode:
+      "full"    - the emergency model runs on every whole frame (original behaviour)
+      "cascade" - the emergency model only runs on crops of car/bus/truck tracks that are
+                  new or have not been checked for `recheck_interval` frames, plus a
+                  full-frame sweep every `sweep_interval` frames to catch anything the
+                  traffic model missed. See emergency_report() for savings and latency.
+
+    backend selects the runtime ("torch", "onnx" or "openvino"); the exported CPU
+    backends can be INT8-quantized with frames from `calibration_video`. Every backend
+    returns the same detections and tracks.
+
+    roi and inference_sizes configure the InferencePreprocessor: both models only see
+    the road region, at a size chosen from the recent vehicle count, and every box is
+    mapped back to source-frame pixels before tracking.
+
+    Both models are loaded from cached artifacts and warmed up on canvases shaped like
+    `warmup_shape` frames on background threads, so construction returns at once and
+    the first real frame runs at steady-state speed. The first frame waits for the
+    traffic model; in cascade mode emergency checks simply start once that model is
+    ready, in full mode frames wait for it too.
+
+    Detection and tracking are separate: the detector only holds the models, and every
+    video stream owns a DetectionStream (new_stream()) with its own tracker, so one
+    detector can be shared between sessions. Calls without a stream use the detector's
+    default `stream`. Model calls are serialised, as ultralytics predictors keep
+    per-call state. `tracker` picks the implementation from core.tracking.trackers.
+    prepare() / run_prepared() let a caller such as core.serving put frames from several
+    streams through the same model calls.
+
+    With `cache_dir`, raw full-frame detections of both models go to a DetectionCache.
+    Streams opened on a video file (new_stream(video_path) / attach_cache()) look frames
+    up by their position in the file before running a model, so replays and threshold
+    changes on the same recording skip inference.
+    """
+
+    def __init__(self, batch_size=8, tracker="iou", tracker_cfg="bytetrack.yaml", emergency_mode="full",
+                 sweep_interval=30, recheck_interval=15, crop_imgsz=224, crop_padding=0.1,
+                 backend="torch", int8=False, calibration_video=None, roi=None, inference_sizes=(640,),
+                 warmup_shape=(720, 1280, 3), background_load=True, cache_dir=None, cache_quota_mb=512,
+                 cache_min_conf=0.1):
+        self.backend = backend
+        self.int8 = int8
+        self.batch_size = max(1, int(batch_size))
+        self.roi = roi
+        self.inference_sizes = inference_sizes
+        self.tracker_kind = tracker
+        self.tracker_cfg = tracker_cfg
+        self._lock = threading.Lock()
+
         # Load both models from the models/ directory
-        self.traffic_model = YOLO('models/yolov8n.pt')
-        self.emergency_model = YOLO('models/emergency_best.pt')
+        canvases = [] if warmup_shape is None else blank_canvases(InferencePreprocessor(roi, inference_sizes),
+                                                                   warmup_shape)
+        crops = [] if warmup_shape is None else [np.full((crop_imgsz, crop_imgsz, 3), PAD_VALUE, dtype=np.uint8)]
+        self._traffic = ModelHandle(
+            lambda: self._load(TRAFFIC_WEIGHTS, int8, calibration_video, canvases),
+            "traffic model", background_load)
+        self._emergency = ModelHandle(
+            lambda: self._load(EMERGENCY_WEIGHTS, int8, calibration_video, canvases, crops),
+            "emergency model", background_load)
+
+        if emergency_mode not in ("full", "cascade"):
+            raise ValueError(f"Unknown emergency_mode: {emergency_mode}")
+        self.emergency_mode = emergency_mode
+        self.sweep_interval = max(1, int(sweep_interval))
+        self.recheck_interval = max(1, int(recheck_interval))
+        self.crop_imgsz = crop_imgsz
+        self.crop_padding = crop_padding
+        self.cache = None if cache_dir is None else DetectionCache(cache_dir, cache_quota_mb * 1024 * 1024,
+                                                                   cache_min_conf)
+        self._cache_keys = {}
+        self.stream = self.new_stream()
+
+    @property
+    def traffic_model(self):
+        return self._traffic.get()
+
+    @property
+    def emergency_model(self):
+        return self._emergency.get()
+
+    def _load(self, weights, int8, calibration_video, canvases, crops=()):
+        model = load_model(weights, self.backend, int8, calibration_video)
+        batch_sizes = (1,)
+        if self.backend == "torch" and torch.cuda.is_available():
+            model.to("cuda")
+            batch_sizes = sorted({1, self.batch_size})  # cuDNN picks kernels per input shape
+        warmup_model(model, canvases, batch_sizes)
+        warmup_model(model, crops)
+        return model
+
+    def new_stream(self, video_path=None):
+        """Fresh per-stream state (tracker, preprocessor, cascade bookkeeping) for this detector."""
+        # The tracker lives with the stream rather than inside the ultralytics predictor:
+        # `model.track` keeps one tracker per batch slot on the shared model, so batched
+        # calls would split a video across trackers and sessions would share them
+        kwargs = {"cfg": self.tracker_cfg} if self.tracker_kind == "bytetrack" else {}
+        stream = DetectionStream(create_tracker(self.tracker_kind, **kwargs),
+                                 InferencePreprocessor(self.roi, self.inference_sizes))
+        if video_path is not None:
+            self.attach_cache(video_path, stream)
+        return stream
+
+    def attach_cache(self, video_path, stream=None):
+        """Serve `stream`'s frames of `video_path` from the detection cache (a no-op without one)."""
+        stream = stream or self.stream
+        if self.cache is None:
+            stream.cache = None
+            return
+        stream.cache = {"traffic": self.cache.open(video_path, self.cache_key(TRAFFIC_WEIGHTS)),
+                        "emergency": self.cache.open(video_path, self.cache_key(EMERGENCY_WEIGHTS))}
+
+    def cache_key(self, weights):
+        """Everything besides the frame and the inference size that changes a model's raw output."""
+        key = self._cache_keys.get(weights)
+        if key is None:
+            roi = self.roi
+            if isinstance(roi, str):
+                roi = weights_digest(roi)  # a mask image: its content, not its path
+            parts = [weights_digest(resolve_weights(weights)), self.backend + ("-int8" if self.int8 else ""),
+                     hashlib.sha256(repr(roi).encode()).hexdigest()[:8]]
+            key = self._cache_keys[weights] = "-".join(parts)
+        return key
+
+    def reset_tracker(self):
+        self.stream.reset()
+
+    def process_frame(self, frame, conf_threshold, stream=None, position=None):
+        return self.process_batch([frame], conf_threshold, stream, None if position is None else [position])[0]
+
+    def process_batch(self, frames, conf_threshold, stream=None, positions=None):
+        """
+        Run both models on stacked batches of frames; returns [(detections, is_emergency), ...]
+        in frame order. `positions` (0-based index of each frame in its video file) lets a
+        stream with an attached cache skip inference for frames it has seen before.
+        """
+        outputs = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = slice(start, start + self.batch_size)
+            prepared = self.prepare(frames[chunk], conf_threshold, stream,
+                                    None if positions is None else positions[chunk])
+            outputs.extend(self.run_prepared([prepared])[0])
+        return outputs
+
+    def prepare(self, frames, conf_threshold, stream=None, positions=None):
+        """Number and letterbox the next `frames` of a stream; run them with run_prepared()."""
+        stream = stream or self.stream
+        frames = list(frames)
+        positions = [None] * len(frames) if positions is None else list(positions)
+        frame_nos = list(range(stream.frame_no + 1, stream.frame_no + len(frames) + 1))
+        stream.frame_no += len(frames)
+        stream.emergency_stats["frames"] += len(frames)
+        with STAGE_SECONDS.labels(stage="preprocess").time():
+            images, transforms, imgsz = stream.preprocessor.prepare(frames)
+        return PreparedFrames(stream, frames, conf_threshold, images, transforms, imgsz, frame_nos, positions)
 
-        if torch.cuda.is_available():
-            self.traffic_model.to("cuda")
-            self.emergency_model.to("cuda")
+    def run_prepared(self, parts):
+        """
+        Run PreparedFrames from any number of streams through one call per model.
 
-    def process_frame(self, frame, conf_threshold):
-        # 1. Track Normal Traffic using the UI slider confidence
-        traffic_results = self.traffic_model.track(
-            frame, persist=True, conf=conf_threshold, verbose=False
-        )
+        Every stream's frames are tracked in order by its own tracker, at its own
+        confidence threshold. Returns one [(detections, is_emergency), ...] list per part.
+        """
+        frames = [f for p in parts for f in p.frames]
+        images = [im for p in parts for im in p.images]
+        transforms = [t for p in parts for t in p.transforms]
+        streams = [p.stream for p in parts for _ in p.frames]
+        confs = [p.conf for p in parts for _ in p.frames]
+        frame_nos = [n for p in parts for n in p.frame_nos]
+        positions = [n for p in parts for n in p.positions]
+        ends = list(accumulate(len(p) for p in parts))
+        imgsz = max(p.imgsz for p in parts)
+
+        # 1. Detect Normal Traffic using the UI slider confidence (tracked below, in order)
+        detected = self._detect(images, transforms, streams, confs, positions, imgsz)
 
         # 2. Detect Emergency Vehicles using a FIXED high confidence (0.75) to prevent false positives
-        emergency_results = self.emergency_model(frame, conf=0.75, verbose=False)
-
-        current_detections = []
-        is_emergency = False
-
-        # Parse Normal Traffic
-        if traffic_results and traffic_results[0].boxes.id is not None:
-            boxes = traffic_results[0].boxes.xyxy.cpu().numpy()
-            ids = traffic_results[0].boxes.id.cpu().numpy().astype(int)
-            clss = traffic_results[0].boxes.cls.cpu().numpy().astype(int)
-
-            for box, obj_id, cls in zip(boxes, ids, clss):
-                # Filter for: car(2), motorcycle(3), bus(5), truck(7)
-                if cls in [2, 3, 5, 7]:
-                    current_detections.append({"box": box, "id": obj_id, "type": "normal"})
-
-        # Parse Emergency Vehicles with strict class verification
-        if len(emergency_results[0].boxes) > 0:
-            for box in emergency_results[0].boxes:
-                # Assuming class 0 is your trained emergency vehicle class
-                if box.cls == 0:
-                    is_emergency = True
-                    current_detections.append({
-                        "box": box.xyxy.cpu().numpy()[0],
-                        "id": -1,
-                        "type": "emergency"
-                    })
-
-        return current_detections, is_emergency
\ No newline at end of file
+        if self.emergency_mode == "cascade":
+            # Sweeps wait for the emergency model instead of blocking on it
+            ready = self._emergency.ready
+            sweep = [i for i, n in enumerate(frame_nos) if ready and n % self.sweep_interval == 0]
+        else:
+            sweep = list(range(len(frames)))
+        emergency = self._run_full_frame(images, transforms, streams, sweep, positions, imgsz)
+
+        with STAGE_SECONDS.labels(stage="track").time():
+            tracked = [stream.tracker.update(d) for stream, d in zip(streams, detected)]
+        for p, end in zip(parts, ends):
+            p.stream.preprocessor.observe(len(tracked[end - 1]))
+
+        if self.emergency_mode == "cascade":
+            crop_hits = self._run_cascade(streams, frames, tracked, frame_nos, emergency)
+        else:
+            crop_hits = [[] for _ in frames]
+
+        with STAGE_SECONDS.labels(stage="parse").time():
+            outputs = [self._parse(traffic, emergency.get(i), crop_hits[i]) for i, traffic in enumerate(tracked)]
+        return [outputs[end - len(p):end] for p, end in zip(parts, ends)]
+
+    def process_video(self, video_path, conf_threshold, frame_skip=1):
+        """Offline analysis: yields (frame_index, detections, is_emergency) for every analysed frame."""
+        self.attach_cache(video_path)
+        # Frame indices are 1-based: every frame_skip-th frame, starting with the frame_skip-th.
+        # Frames in between are grabbed (or seeked over) rather than decoded, and decoding
+        # runs ahead on a prefetch thread while the models work on the previous batch.
+        source = FrameSource(video_path, start=max(1, frame_skip) - 1)
+        pending, positions = [], []
+        try:
+            for position, frame in source.frames(frame_skip, prefetch=self.batch_size):
+                pending.append(frame)
+                positions.append(position)
+                if len(pending) == self.batch_size:
+                    for position, (detections, is_emergency) in zip(
+                            positions, self.process_batch(pending, conf_threshold, positions=positions)):
+                        yield position + 1, detections, is_emergency
+                    pending, positions = [], []
+
+            for position, (detections, is_emergency) in zip(
+                    positions, self.process_batch(pending, conf_threshold, positions=positions)):
+                yield position + 1, detections, is_emergency
+        finally:
+            source.release()
+
+    def emergency_report(self, stream=None):
+        """Emergency-model compute actually spent vs. running it on every whole frame."""
+        stream = stream or self.stream
+        s = stream.emergency_stats
+        frames = max(1, s["frames"])
+        # A crop is letterboxed to crop_imgsz instead of the full 640 input
+        crop_cost = (self.crop_imgsz / 640) ** 2
+        spent = s["full_frame_runs"] + s["crops"] * crop_cost
+        per_frame = s["full_frame_seconds"] / s["full_frame_runs"] if s["full_frame_runs"] else 0.0
+        latencies = list(stream.alert_latencies)
+        return {
+            "mode": self.emergency_mode,
+            "frames": s["frames"],
+            "full_frame_runs": s["full_frame_runs"],
+            "crops_checked": s["crops"],
+            "compute_saved_pct": round(100 * (1 - spent / frames), 1),
+            "emergency_seconds": round(s["full_frame_seconds"] + s["crop_seconds"], 3),
+            "est_full_mode_seconds": round(per_frame * s["frames"], 3),
+            "alerts": len(latencies),
+            "mean_alert_latency_frames": round(float(np.mean([f for f, _ in latencies])), 2) if latencies else None,
+            "mean_alert_latency_sec": round(float(np.mean([t for _, t in latencies])), 3) if latencies else None,
+        }
+
+    def _detect(self, images, transforms, streams, confs, positions, imgsz):
+        # Untracked vehicle detections per image, in source-frame pixels. Each image
+        # keeps its own stream's threshold
+        data, _, elapsed = self._predict("traffic", images, streams, confs, positions, imgsz, VEHICLE_CLASSES)
+        if elapsed is not None:
+            MODEL_SECONDS.labels(model="traffic").observe(elapsed)
+        return [self._to_detections(d, t, stream, conf)
+                for d, t, stream, conf in zip(data, transforms, streams, confs)]
+
+    def _run_full_frame(self, images, transforms, streams, indices, positions=None, imgsz=640):
+        """{index: emergency Detections} for the images at `indices`."""
+        if not indices:
+            return {}
+        positions = [None] * len(images) if positions is None else positions
+        data, ran, elapsed = self._predict("emergency", [images[i] for i in indices], [streams[i] for i in indices],
+                                           [EMERGENCY_CONF] * len(indices), [positions[i] for i in indices],
+                                           imgsz, [0])
+        if elapsed is not None:
+            MODEL_SECONDS.labels(model="emergency").observe(elapsed)
+            for k in ran:
+                stats = streams[indices[k]].emergency_stats
+                stats["full_frame_seconds"] += elapsed / len(ran)
+                stats["full_frame_runs"] += 1
+        # Emergency Vehicles with strict class verification (class 0 is the trained emergency class)
+        return {i: self._to_detections(d, transforms[i], streams[i], EMERGENCY_CONF, emergency=True)
+                for i, d in zip(indices, data)}
+
+    def _predict(self, name, images, streams, confs, positions, imgsz, classes):
+        """
+        Raw x1, y1, x2, y2, conf, cls rows of `classes` per image, in letterboxed pixels.
+
+        Frames their stream's cache holds at their threshold are served from it; the rest
+        go through one model call at the lowest threshold needed (the cache's own when
+        the results are to be cached). Returns (rows, indices run, model seconds or None).
+        """
+        caches = [None if stream.cache is None or pos is None else stream.cache[name]
+                  for stream, pos in zip(streams, positions)]
+        data = [None if c is None else c.get(pos, imgsz, conf) for c, pos, conf in zip(caches, positions, confs)]
+        ran = [i for i, d in enumerate(data) if d is None]
+        if caches.count(None) < len(caches):
+            CACHE_LOOKUPS.labels(model=name, result="hit").inc(len(data) - len(ran))
+            CACHE_LOOKUPS.labels(model=name, result="miss").inc(sum(1 for i in ran if caches[i] is not None))
+        if not ran:
+            return data, ran, None
+
+        conf = min(confs[i] for i in ran)
+        if any(caches[i] is not None for i in ran):
+            conf = min(conf, self.cache.min_conf)
+        model = self.traffic_model if name == "traffic" else self.emergency_model
+        with self._lock:
+            t0 = time.perf_counter()
+            results = model.predict([images[i] for i in ran], conf=conf, imgsz=imgsz, verbose=False)
+            elapsed = time.perf_counter() - t0
+        for i, result in zip(ran, results):
+            rows = result.boxes.data.cpu().numpy()
+            rows = rows[np.isin(rows[:, 5].astype(int), classes)]
+            if caches[i] is not None:
+                caches[i].put(positions[i], imgsz, rows)
+            data[i] = rows
+        return data, ran, elapsed
+
+    def _run_cascade(self, streams, chunk, tracked, frame_nos, emergency):
+        hits = [[] for _ in chunk]
+        crops, owners = [], []
+        now = time.perf_counter()
+
+        for i, (stream, frame, traffic, frame_no) in enumerate(zip(streams, chunk, tracked, frame_nos)):
+            if not len(traffic):
+                continue
+            boxes, ids = traffic.boxes, traffic.ids.tolist()
+
+            for obj_id in ids:
+                stream.first_seen.setdefault(obj_id, (frame_no, now))
+                stream.last_seen[obj_id] = frame_no
+
+            # Full-frame sweep on this frame: attach its hits to the overlapping tracks
+            sweep = emergency.get(i)
+            if sweep is not None and len(sweep):
+                iou = box_iou(boxes, sweep.boxes)
+                overlap = np.flatnonzero(iou.max(axis=1) > 0.3)
+                for row, best in zip(overlap.tolist(), iou[overlap].argmax(axis=1).tolist()):
+                    stream.flag(ids[row], frame_no, now, float(sweep.confidences[best]))
+
+            if not self._emergency.ready:
+                continue  # still loading: leave the tracks unchecked so they are picked up once it is
+            candidate = np.flatnonzero(np.isin(traffic.classes, EMERGENCY_CANDIDATE_CLASSES))
+            for row in candidate.tolist():
+                box, obj_id = boxes[row], ids[row]
+                last = stream.last_checked.get(obj_id)
+                if last is not None and frame_no - last < self.recheck_interval:
+                    # Not due: confirmed emergency tracks keep their flag and follow the track
+                    if obj_id in stream.emergency_ids:
+                        hits[i].append((box, stream.emergency_ids[obj_id]))
+                    continue
+                crop = self._crop(frame, box)
+                if crop is None:
+                    continue
+                crops.append(crop)
+                owners.append((i, obj_id, frame_no, box))
+                stream.last_checked[obj_id] = frame_no
+
+        if crops:
+            with self._lock:
+                t0 = time.perf_counter()
+                results = self.emergency_model.predict(crops, imgsz=self.crop_imgsz, conf=EMERGENCY_CONF,
+                                                       verbose=False)
+                elapsed = time.perf_counter() - t0
+            MODEL_SECONDS.labels(model="emergency_crops").observe(elapsed)
+            for stream in {streams[i] for i, *_ in owners}:
+                stream.emergency_stats["crop_runs"] += 1
+
+            for (i, obj_id, frame_no, box), result in zip(owners, results):
+                stream = streams[i]
+                stream.emergency_stats["crop_seconds"] += elapsed / len(crops)
+                stream.emergency_stats["crops"] += 1
+                confs = result.boxes.conf.cpu().numpy()[result.boxes.cls.cpu().numpy() == 0]
+                if len(confs):
+                    conf = float(confs.max())
+                    stream.flag(obj_id, frame_no, now, conf)
+                    hits[i].append((box, conf))
+                else:
+                    stream.emergency_ids.pop(obj_id, None)
+
+        # Frames are in order within each stream, so the last number seen is the latest
+        for stream, frame_no in dict(zip(streams, frame_nos)).items():
+            stream.prune(frame_no)
+        return hits
+
+    def _crop(self, frame, box):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = box
+        pad_x, pad_y = (x2 - x1) * self.crop_padding, (y2 - y1) * self.crop_padding
+        x1, y1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+        x2, y2 = min(w, int(x2 + pad_x)), min(h, int(y2 + pad_y))
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return None
+        return frame[y1:y2, x1:x2]
+
+    @staticmethod
+    def _to_detections(data, transform, stream, min_conf=0.0, emergency=False):
+        # Predictions come back in letterboxed-ROI pixels; the tracker, the cascade's crops
+        # and every consumer of Detections work in source-frame pixels.
+        # Rows are x1, y1, x2, y2, conf, cls
+        data = data[data[:, 4] >= min_conf]
+        boxes = stream.preprocessor.to_frame(data[:, :4], transform)
+        return Detections(boxes, -1, data[:, 5], data[:, 4], emergency=emergency)
+
+    @staticmethod
+    def _parse(traffic, emergency=None, cascade_hits=()):
+        parts = [traffic]
+        if emergency is not None:
+            parts.append(emergency)
+
+        # Cascade hits are tracked vehicles confirmed by the emergency model on their crop
+        if cascade_hits:
+            boxes = np.array([box for box, _ in cascade_hits])
+            confs = np.array([conf for _, conf in cascade_hits])
+            parts.append(Detections(boxes, -1, 0, confs, emergency=True))
+
+        detections = Detections.concat(parts)
+        return detections, detections.is_emergency
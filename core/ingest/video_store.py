@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class VideoLease:
+    """A stored video in use: evict() skips its path until release() or the lease is garbage collected."""
+
+    __slots__ = ("store", "path", "__weakref__")
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+
+    def release(self):
+        self.store._leases.discard(self)
+
+
+class VideoStore:
+    """
+    Content-addressed on-disk store for uploaded videos.
+
+    Uploads are streamed to disk in chunks while being hashed, then stored as
+    <sha256><suffix>, so re-running the same recording reuses the same file.
+    File mtime doubles as the LRU clock (touch() on every use); the oldest files
+    are evicted once the store grows past `quota_bytes`, except those someone holds
+    a lease() on, such as a video a session is still reading.
+    """
+
+    def __init__(self, root, quota_bytes=2 * 1024 ** 3, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._leases = weakref.WeakSet()
+        os.makedirs(root, exist_ok=True)
+
+    def ingest(self, fileobj, suffix=".mp4", lease=False):
+        """
+        Stream a file-like object into the store; returns the stored path, or with
+        lease=True (path, VideoLease), leased before any other upload can evict it.
+        """
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+        hasher = hashlib.sha256()
+        # Write next to the final location so the publish step is an atomic rename
+        fd, part_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(part_path)
+            raise
+
+        path = os.path.join(self.root, hasher.hexdigest() + suffix)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(part_path)
+                os.utime(path)  # mark as recently used
+            else:
+                os.replace(part_path, path)
+            held = self._lease(path) if lease else None
+            self.evict(keep=(path,))
+        return (path, held) if lease else path
+
+    def lease(self, path):
+        """Mark `path` as used now and keep it from being evicted while the returned VideoLease lives."""
+        with self._lock:
+            held = self._lease(path)
+        self.touch(path)
+        return held
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, digest, suffix=".mp4"):
+        path = os.path.join(self.root, digest + suffix)
+        if not os.path.exists(path):
+            return None
+        self.touch(path)
+        return path
+
+    def usage(self):
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, keep=()):
+        keep = {*keep, *(held.path for held in list(self._leases))}
+        entries = sorted(self._entries(), key=lambda e: e[1])  # least recently used first
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.quota_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def _lease(self, path):
+        # Called with the lock held
+        held = VideoLease(self, path)
+        self._leases.add(held)
+        return held
+
+    def _entries(self):
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                yield entry.path, st.st_mtime, st.st_size
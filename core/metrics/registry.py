@@ -0,0 +1,236 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds: 1 ms .. 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Child:
+    __slots__ = ("_lock",)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+
+class _CounterChild(_Child):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_Child):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value  # a single store; no lock needed
+
+
+class _HistogramChild(_Child):
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        super().__init__()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def quantile(self, q):
+        """Bucket upper bound containing the q-quantile (coarse, but free to compute)."""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class _Metric:
+    kind = None
+    child_cls = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def _new_child(self):
+        return self.child_cls()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self):
+        return list(self._children.items())
+
+    def _label_str(self, key, extra=()):
+        pairs = [f'{n}="{v}"' for n, v in zip(self.labelnames, key)] + list(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+    child_cls = _CounterChild
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def expose(self):
+        return [f"{self.name}{self._label_str(k)} {c.value}" for k, c in self.children()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_cls = _GaugeChild
+
+    def set(self, value):
+        self._default.set(value)
+
+    def expose(self):
+        return [f"{self.name}{self._label_str(k)} {c.value}" for k, c in self.children()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def expose(self):
+        lines = []
+        for key, c in self.children():
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), c.counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{self._label_str(key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {c.sum}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {c.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def metrics(self):
+        return list(self._metrics.values())
+
+    def exposition(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for m in self.metrics():
+            lines.append(f"# HELP {m.name} {m.documentation}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.expose())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        # Write-then-rename so a scraper reading the file never sees half a dump
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.exposition())
+        os.replace(tmp, path)
+
+    def snapshot(self):
+        """Flat rows for display: (metric, labels, summary string)."""
+        rows = []
+        for m in self.metrics():
+            for key, c in m.children():
+                labels = ", ".join(f"{n}={v}" for n, v in zip(m.labelnames, key))
+                if isinstance(m, Histogram):
+                    mean = c.sum / c.count if c.count else 0.0
+                    summary = f"n={c.count}  mean={mean * 1000:.1f} ms  p95≤{c.quantile(0.95) * 1000:g} ms"
+                else:
+                    summary = f"{c.value:g}"
+                rows.append((m.name, labels, summary))
+        return rows
+
+
+REGISTRY = MetricsRegistry()
+
+# Hot-path instruments shared by the detector, the pipeline and the pages
+STAGE_SECONDS = REGISTRY.histogram(
+    "traffic_stage_seconds", "Time spent per pipeline stage per frame or batch", ["stage"])
+MODEL_SECONDS = REGISTRY.histogram(
+    "traffic_model_inference_seconds", "Time spent in a model call", ["model"])
+FRAMES = REGISTRY.counter(
+    "traffic_frames_total", "Frames by outcome (inferred, skipped, dropped)", ["outcome"])
+QUEUE_DEPTH = REGISTRY.gauge(
+    "traffic_queue_depth", "Items waiting in a pipeline queue", ["queue"])
+QUEUE_DROPPED = REGISTRY.counter(
+    "traffic_queue_dropped_total", "Items discarded by a queue's drop policy", ["queue"])
+BATCH_FRAMES = REGISTRY.histogram(
+    "traffic_inference_batch_frames", "Frames per cross-session model batch", buckets=(1, 2, 4, 8, 16, 32, 64))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "traffic_detection_cache_total", "Detection cache lookups by model and result (hit, miss)", ["model", "result"])
@@ -0,0 +1,57 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.metrics.registry import REGISTRY
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would flood the Streamlit log
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serve /metrics on a daemon thread; repeated calls for the same port reuse the server.
+    Returns None if the port is taken (e.g. a second dashboard process on the same box).
+    """
+    with _servers_lock:
+        if port in _servers:
+            return _servers[port]
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        try:
+            server = ThreadingHTTPServer((host, port), handler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+        _servers[port] = server
+        return server
+
+
+def start_metrics_dumper(path, interval=10.0, registry=REGISTRY):
+    """Periodically write the exposition text to `path` (for node-exporter textfile collectors)."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            registry.dump(path)
+    t = threading.Thread(target=loop, name="metrics-dump", daemon=True)
+    t.start()
+    return t
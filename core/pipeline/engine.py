@@ -0,0 +1,421 @@
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from core.detection.detections import Detections
+from core.metrics.registry import FRAMES, QUEUE_DEPTH, QUEUE_DROPPED, STAGE_SECONDS
+from core.scheduling.motion_gate import TrackInterpolator
+from core.video.frame_source import FrameSource
+
+# Drop policies for the bounded queues between stages:
+#   block       - producer waits for space (lossless, backpressure flows upstream)
+#   drop_oldest - evict the stalest queued item so the newest always gets through
+#   drop_newest - discard the incoming item when the queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+_END = object()  # end-of-stream marker, never dropped
+
+
+class FramePacket:
+    __slots__ = ("index", "frame", "shape", "detections", "is_emergency", "inferred", "display", "t_decoded",
+                 "motion")
+
+    def __init__(self, index, frame, shape=None):
+        self.index = index
+        self.frame = frame  # None for frames that were only grabbed, never decoded
+        self.shape = frame.shape if frame is not None else shape
+        self.detections = Detections.empty()
+        self.is_emergency = False
+        self.inferred = False
+        self.display = None
+        self.t_decoded = time.perf_counter()
+        self.motion = None
+
+
+class StageQueue:
+    """
+    Bounded queue between two pipeline stages with an explicit drop policy.
+
+    `on_evict(evicted, item)`, if given, is called when DROP_OLDEST evicts an item to make
+    room for `item`, and returns what is queued instead, so an evicted item can hand
+    something it carries to its successor.
+    """
+
+    def __init__(self, maxsize, policy=BLOCK, name="queue", on_evict=None):
+        if policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self._q = queue.Queue(maxsize)
+        self.policy = policy
+        self.on_evict = on_evict
+        self.dropped = 0
+        self._depth = QUEUE_DEPTH.labels(queue=name)
+        self._drops = QUEUE_DROPPED.labels(queue=name)
+
+    def _count_drop(self):
+        self.dropped += 1
+        self._drops.inc()
+
+    def put(self, item, stop_event):
+        # The end marker follows the queue's policy except that it is never discarded:
+        # blocking queues wait for room, dropping queues evict to make room for it.
+        if self.policy == BLOCK:
+            while not stop_event.is_set():
+                try:
+                    self._q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        if self.policy == DROP_NEWEST and item is not _END:
+            try:
+                self._q.put_nowait(item)
+                return True
+            except queue.Full:
+                self._count_drop()
+                return False
+
+        # DROP_OLDEST (and the end marker on any dropping queue)
+        while True:
+            try:
+                self._q.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    evicted = self._q.get_nowait()
+                    self._count_drop()
+                except queue.Empty:
+                    continue
+                if self.on_evict is not None and item is not _END and evicted is not _END:
+                    item = self.on_evict(evicted, item)
+
+    def get(self, timeout=None):
+        return self._q.get(timeout=timeout)
+
+    def get_nowait(self):
+        return self._q.get_nowait()
+
+    def qsize(self):
+        return self._q.qsize()
+
+    def report_depth(self):
+        self._depth.set(self._q.qsize())
+
+
+def _carry_display(evicted, packet):
+    # The newest results win, but never at the cost of the only preview in the queue
+    if packet.display is None:
+        packet.display = evicted.display
+    return packet
+
+
+def annotate(frame, detections, display_size=(854, 480)):
+    # Resize ONLY for UI display, then scale boxes from source resolution (stays BGR)
+    display_frame = cv2.resize(frame, display_size)
+    scale_x = display_size[0] / frame.shape[1]
+    scale_y = display_size[1] / frame.shape[0]
+
+    boxes = (detections.boxes * np.array([scale_x, scale_y, scale_x, scale_y])).astype(np.int32)
+    for (x1, y1, x2, y2), emergency in zip(boxes.tolist(), detections.emergency.tolist()):
+        color = (0, 0, 255) if emergency else (0, 255, 0)
+        cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
+    return display_frame
+
+
+def draw_detections(frame, detections, display_size=(854, 480)):
+    return cv2.cvtColor(annotate(frame, detections, display_size), cv2.COLOR_BGR2RGB)
+
+
+class FramePipeline:
+    """
+    Decode -> inference -> render, each on its own thread, joined by bounded queues.
+
+    The consumer (a Streamlit page) only calls read() and gets fully rendered packets.
+    `infer_fn(frame, conf, position=...)` must return (detections, is_emergency) like
+    VehicleDetector.process_frame. If `batch_fn(frames, conf, positions=...)` is given
+    (e.g. VehicleDetector.process_batch), frames that have queued up behind a busy
+    inference stage are analysed together in batches of up to `batch_size`. Positions
+    are the frames' 0-based indices in the file, for the detection cache.
+    With a `scheduler` (a MotionGate) frames are analysed when motion or density calls
+    for it, with `frame_skip` as the base interval, instead of every k-th frame. With
+    `interpolate`, frames that are not analysed get boxes moved along the tracks rather
+    than the stale boxes of the last analysed frame.
+    `on_inference(packet)` is called on the inference
+    thread for every analysed frame, so bookkeeping such as unique-ID counting never
+    depends on which rendered frames the consumer happens to see.
+
+    `display_fps` caps how often the render stage produces a preview (packet.display),
+    independently of the analysis rate: other analysed packets still reach read() with
+    display None so their results can be shown, and skipped, undisplayed packets are
+    not forwarded at all. With a cap, frames that will be neither analysed nor shown
+    are not even decoded (FrameSource.grab()): with a fixed frame skip all but every
+    k-th, with a scheduler all but the ones its stride() asks for.
+    """
+
+    def __init__(self, video_path, infer_fn, conf=0.35, frame_skip=1, display_size=(854, 480),
+                 queue_size=4, decode_policy=BLOCK, output_policy=DROP_OLDEST,
+                 on_inference=None, render_fn=draw_detections, idle_timeout=30.0,
+                 batch_fn=None, batch_size=1, scheduler=None, interpolate=True, display_fps=None):
+        self.video_path = video_path
+        self.infer_fn = infer_fn
+        self.batch_fn = batch_fn
+        self.batch_size = max(1, batch_size) if batch_fn is not None else 1
+        self.render_fn = render_fn
+        self.on_inference = on_inference
+        self.display_size = display_size
+        self.idle_timeout = idle_timeout
+        self.scheduler = scheduler
+        self.display_fps = display_fps
+        self._next_display = 0.0
+        self._next_pixels = 0.0
+        self._last_pixels = 0  # index of the last decoded frame
+        self.interpolator = TrackInterpolator() if interpolate else None
+        self._last_count = 0
+
+        # Tunable while running (the pages update these on every rerun)
+        self.conf = conf
+        self.frame_skip = frame_skip
+
+        # Leave room for a full batch of analysed frames to queue up behind inference
+        self.decode_q = StageQueue(max(queue_size, 2 * self.batch_size), decode_policy, "decode")
+        self.render_q = StageQueue(queue_size, BLOCK, "render")
+        # Analysed packets arrive a batch at a time, mostly without a preview; one that
+        # evicts a preview takes it over, so the live image keeps up with the display rate
+        self.output_q = StageQueue(2, output_policy, "output", on_evict=_carry_display)
+
+        self.frames_decoded = 0
+        self.frames_grabbed = 0
+        self.frames_inferred = 0
+        self.finished = False
+        self.error = None
+
+        self._stop = threading.Event()
+        self._last_read = time.monotonic()
+        self._threads = []
+
+    # ---------------- lifecycle ----------------
+    def start(self):
+        for target, name in ((self._decode_loop, "decode"),
+                             (self._inference_loop, "inference"),
+                             (self._render_loop, "render")):
+            t = threading.Thread(target=self._guard(target), name=f"pipeline-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, join_timeout=2.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=join_timeout)
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def read(self, timeout=1.0):
+        """Next rendered packet, or None on timeout / end of stream."""
+        self._last_read = time.monotonic()
+        if self.finished:
+            return None
+        try:
+            item = self.output_q.get(timeout=timeout)
+        except queue.Empty:
+            if self._stop.is_set() and not self.running:
+                self.finished = True
+            return None
+        if item is _END:
+            self.finished = True
+            return None
+        return item
+
+    def stats(self):
+        return {
+            "frames_decoded": self.frames_decoded,
+            "frames_grabbed": self.frames_grabbed,
+            "frames_inferred": self.frames_inferred,
+            "decode_queue": self.decode_q.qsize(),
+            "render_queue": self.render_q.qsize(),
+            "output_queue": self.output_q.qsize(),
+            "dropped_decode": self.decode_q.dropped,
+            "dropped_output": self.output_q.dropped,
+        }
+
+    def _guard(self, target):
+        def run():
+            try:
+                target()
+            except Exception as e:  # surface stage failures to the consumer
+                self.error = e
+                self._stop.set()
+        return run
+
+    def _idle(self):
+        # Abandoned sessions (browser closed mid-run) must not keep the cores busy
+        return time.monotonic() - self._last_read > self.idle_timeout
+
+    # ---------------- stages ----------------
+    def _decode_loop(self):
+        source = FrameSource(self.video_path)
+        try:
+            while source.opened and not self._stop.is_set():
+                if self._idle():
+                    self._stop.set()
+                    break
+                index = source.position + 1
+                if self._needs_pixels(index):
+                    frame = source.read()
+                    if frame is None:
+                        break
+                    self._last_pixels = index
+                elif source.grab():
+                    frame = None
+                    self.frames_grabbed += 1
+                else:
+                    break
+                self.frames_decoded = index
+                packet = FramePacket(index, frame, source.shape)
+                if self.scheduler is not None and frame is not None:
+                    with STAGE_SECONDS.labels(stage="motion").time():
+                        packet.motion = self.scheduler.score(frame)
+                self.decode_q.put(packet, self._stop)
+                self.decode_q.report_depth()
+        finally:
+            source.release()
+            self.decode_q.put(_END, self._stop)
+
+    def _inference_loop(self):
+        last_detections, last_emergency = Detections.empty(), False
+        ended = False
+        while not ended and not self._stop.is_set():
+            try:
+                first = self.decode_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if first is _END:
+                break
+
+            # Take whatever has already queued up (never wait for more) until the batch is full
+            window = [first]
+            flags = [self._is_due(first)]
+            while sum(flags) < self.batch_size:
+                try:
+                    packet = self.decode_q.get_nowait()
+                except queue.Empty:
+                    break
+                if packet is _END:
+                    ended = True
+                    break
+                window.append(packet)
+                flags.append(self._is_due(packet))
+
+            analysed = [p for p, due in zip(window, flags) if due]
+            results = []
+            if analysed:
+                with STAGE_SECONDS.labels(stage="inference").time():
+                    if len(analysed) > 1:
+                        results = self.batch_fn([p.frame for p in analysed], self.conf,
+                                                positions=[p.index - 1 for p in analysed])
+                    else:
+                        results = [self.infer_fn(p.frame, self.conf, position=p.index - 1) for p in analysed]
+            for packet, result in zip(analysed, results):
+                packet.detections, packet.is_emergency = result
+                packet.inferred = True
+            self.frames_inferred += len(analysed)
+            FRAMES.labels(outcome="inferred").inc(len(analysed))
+            FRAMES.labels(outcome="skipped").inc(len(window) - len(analysed))
+
+            # The next analysed frame after each position, for interpolating the gaps
+            following, nxt = [None] * len(window), None
+            for pos in range(len(window) - 1, -1, -1):
+                following[pos] = nxt
+                if window[pos].inferred:
+                    nxt = window[pos]
+
+            for pos, packet in enumerate(window):
+                if packet.inferred:
+                    last_detections, last_emergency = packet.detections, packet.is_emergency
+                    self._last_count = packet.detections.normal_count
+                    if self.interpolator is not None:
+                        self.interpolator.observe(packet.index, packet.detections, packet.shape)
+                    if self.on_inference is not None:
+                        self.on_inference(packet)
+                else:
+                    # Skipped frames re-use the most recent detections, moved along their tracks
+                    if self.interpolator is None:
+                        packet.detections = last_detections
+                    elif following[pos] is not None:
+                        later = following[pos]
+                        packet.detections = self.interpolator.between(packet.index, later.index, later.detections)
+                    else:
+                        packet.detections = self.interpolator.extrapolate(packet.index)
+                    packet.is_emergency = last_emergency
+                self.render_q.put(packet, self._stop)
+            self.decode_q.report_depth()
+            self.render_q.report_depth()
+        self.render_q.put(_END, self._stop)
+
+    def _is_due(self, packet):
+        # Called exactly once per packet, in frame order (the scheduler is stateful)
+        if self.scheduler is not None:
+            return self.scheduler.decide(packet.motion, self._last_count, self.frame_skip)
+        return packet.frame is not None and packet.index % max(1, self.frame_skip) == 0
+
+    def _needs_pixels(self, index):
+        # Decode thread: a frame that will neither be analysed nor shown is only grabbed,
+        # skipping the colour conversion and copy out of the decoder. Without a display
+        # cap every frame is shown.
+        if not self.display_fps:
+            return True
+        if self.scheduler is not None:
+            # The gate probes (and may analyse) every stride-th frame
+            if index - self._last_pixels >= self.scheduler.stride():
+                return True
+        elif index % max(1, self.frame_skip) == 0:
+            return True
+        # Pick frames for the preview at the display rate, on the decode thread's own clock
+        now = time.monotonic()
+        if now < self._next_pixels:
+            return False
+        period = 1.0 / self.display_fps
+        self._next_pixels += period
+        if self._next_pixels < now:
+            self._next_pixels = now + period
+        return True
+
+    def _display_due(self):
+        if not self.display_fps:
+            return True
+        now = time.monotonic()
+        if now < self._next_display:
+            return False
+        # Schedule from the previous slot so the rate holds on average, without bursts after a stall
+        period = 1.0 / self.display_fps
+        self._next_display += period
+        if self._next_display < now:
+            self._next_display = now + period
+        return True
+
+    def _render_loop(self):
+        while not self._stop.is_set():
+            try:
+                packet = self.render_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if packet is _END:
+                break
+
+            if packet.frame is not None and self._display_due():
+                with STAGE_SECONDS.labels(stage="render").time():
+                    packet.display = self.render_fn(packet.frame, packet.detections, self.display_size)
+            elif not packet.inferred:
+                FRAMES.labels(outcome="not_displayed").inc()
+                continue
+            packet.frame = None  # the consumer only needs the rendered image
+            self.output_q.put(packet, self._stop)
+            self.output_q.report_depth()
+        self.output_q.put(_END, self._stop)
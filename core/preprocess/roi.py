@@ -0,0 +1,152 @@
+import math
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114  # ultralytics' letterbox fill, so the predictor sees the padding it expects
+
+
+class InferencePreprocessor:
+    """
+    Crops frames to the road region and letterboxes them into preallocated buffers.
+
+    roi is None (whole frame), an (x1, y1, x2, y2) rectangle, a polygon [(x, y), ...] or
+    the path of a mask image like detection.py's mask.png (white = road). Inference runs
+    on the ROI's bounding rectangle; with a polygon or mask, pixels outside the road are
+    blanked to the pad colour so they cannot produce detections.
+
+    The inference size is picked from `sizes` (ascending) by a smoothed vehicle count:
+    sparse scenes go through the smallest size, dense scenes with many small vehicles
+    through the largest. `thresholds` holds the count boundaries between sizes.
+
+    prepare() returns the letterboxed images plus one transform per frame; to_frame()
+    maps boxes predicted on a letterboxed image back to source-frame pixels.
+    """
+
+    def __init__(self, roi=None, sizes=(640,), thresholds=(5, 15), stride=32, smoothing=0.3):
+        self.roi = roi
+        self.sizes = sorted(int(s) for s in sizes)
+        self.thresholds = list(thresholds)[:len(self.sizes) - 1]
+        self.stride = stride
+        self.smoothing = smoothing
+        self.density = 0.0
+        self._geometry = {}  # (frame shape, size) -> letterbox geometry
+        self._buffers = {}   # (frame shape, size) -> (batch, H, W, 3) uint8
+        self._mask = None
+
+    @property
+    def size(self):
+        return self.sizes[int(np.searchsorted(self.thresholds, self.density, side="right"))]
+
+    def observe(self, count):
+        """Feed the latest vehicle count; the next prepare() adapts its size to it."""
+        self.density += self.smoothing * (count - self.density)
+
+    def prepare(self, frames):
+        """Letterboxed ROI crops (views into reused buffers) and their (scale, offsets) transforms."""
+        size = self.size
+        images, transforms = [], []
+        for i, frame in enumerate(frames):
+            key = (frame.shape, size)
+            geo = self._geometry.get(key)
+            if geo is None:
+                geo = self._geometry[key] = self._build_geometry(frame.shape, size)
+            (x1, y1, x2, y2), (nw, nh), (top, left), outside, transform = geo
+
+            buf = self._buffers.get(key)
+            if buf is None or len(buf) < len(frames):
+                canvas_h, canvas_w = transform[3]
+                buf = self._buffers[key] = np.full((len(frames), canvas_h, canvas_w, 3), PAD_VALUE, dtype=np.uint8)
+            canvas = buf[i]
+            region = canvas[top:top + nh, left:left + nw]
+            out = cv2.resize(frame[y1:y2, x1:x2], (nw, nh), dst=region, interpolation=cv2.INTER_LINEAR)
+            if out is not region:
+                region[...] = out
+            if outside is not None:
+                region[outside] = PAD_VALUE
+
+            images.append(canvas)
+            transforms.append(transform)
+        # The predictor's imgsz is the longest canvas side, so it never rescales our canvas
+        return images, transforms, max((max(im.shape[:2]) for im in images), default=size)
+
+    def canvas_shapes(self, frame_shape):
+        """(height, width) of the letterboxed canvas at each size, for frames of `frame_shape`."""
+        shapes = []
+        for size in self.sizes:
+            key = (tuple(frame_shape), size)
+            geo = self._geometry.get(key)
+            if geo is None:
+                geo = self._geometry[key] = self._build_geometry(frame_shape, size)
+            shapes.append(geo[4][3])
+        return shapes
+
+    def canvas_shape(self, frame_shape):
+        """(height, width) of the canvas the next prepare() produces for frames of `frame_shape`."""
+        return self.canvas_shapes(frame_shape)[self.sizes.index(self.size)]
+
+    def to_frame(self, boxes, transform):
+        """Map (N, 4) xyxy boxes from the letterboxed image back to source-frame pixels."""
+        scale, (dx, dy), (x1, y1, x2, y2), _ = transform
+        boxes = (np.asarray(boxes, dtype=np.float32) - [dx, dy, dx, dy]) / scale + [x1, y1, x1, y1]
+        np.clip(boxes[:, 0::2], x1, x2, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], y1, y2, out=boxes[:, 1::2])
+        return boxes
+
+    def _build_geometry(self, shape, size):
+        h, w = shape[:2]
+        x1, y1, x2, y2 = self._roi_rect(h, w)
+        ch, cw = y2 - y1, x2 - x1
+
+        # Never upscale past the ROI itself; canvas sides are stride multiples like
+        # the predictor's own minimal-rectangle letterbox, so it passes through unchanged
+        size = min(size, self._ceil(max(ch, cw)))
+        r = min(size / ch, size / cw)
+        nw, nh = max(1, round(cw * r)), max(1, round(ch * r))
+        canvas_h, canvas_w = self._ceil(nh), self._ceil(nw)
+        top, left = (canvas_h - nh) // 2, (canvas_w - nw) // 2
+
+        outside = None
+        if self._needs_mask():
+            mask = self._road_mask(h, w)[y1:y2, x1:x2]
+            outside = cv2.resize(mask, (nw, nh), interpolation=cv2.INTER_NEAREST) == 0
+            if not outside.any():
+                outside = None
+
+        transform = (r, (left, top), (x1, y1, x2, y2), (canvas_h, canvas_w))
+        return (x1, y1, x2, y2), (nw, nh), (top, left), outside, transform
+
+    def _ceil(self, v):
+        return int(math.ceil(v / self.stride) * self.stride)
+
+    def _needs_mask(self):
+        return isinstance(self.roi, str) or (self.roi is not None and len(self.roi) > 0
+                                             and not np.isscalar(self.roi[0]))
+
+    def _road_mask(self, h, w):
+        if self._mask is not None and self._mask.shape == (h, w):
+            return self._mask
+        if isinstance(self.roi, str):
+            mask = cv2.imread(self.roi, cv2.IMREAD_GRAYSCALE)
+            if mask is None:
+                raise ValueError(f"Cannot read ROI mask {self.roi}")
+            if mask.shape != (h, w):
+                mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        else:
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.asarray(self.roi, dtype=np.int32).reshape(-1, 2)], 255)
+        self._mask = mask
+        return mask
+
+    def _roi_rect(self, h, w):
+        if self.roi is None or (not isinstance(self.roi, str) and len(self.roi) == 0):
+            return 0, 0, w, h
+        if not self._needs_mask():
+            x1, y1, x2, y2 = (int(v) for v in self.roi)
+        else:
+            ys, xs = np.nonzero(self._road_mask(h, w))
+            if len(xs) == 0:
+                raise ValueError("ROI does not cover any pixels of the frame")
+            x1, y1, x2, y2 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+        x1, y1 = max(0, min(x1, w - 1)), max(0, min(y1, h - 1))
+        return int(x1), int(y1), int(max(x1 + 1, min(x2, w))), int(max(y1 + 1, min(y2, h)))
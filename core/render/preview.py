@@ -0,0 +1,46 @@
+import cv2
+
+from core.pipeline.engine import annotate
+
+_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class PreviewEncoder:
+    """
+    FramePipeline render_fn that returns the annotated preview as encoded image bytes.
+
+    Encoding happens once, on the pipeline's render thread, at the preview size and
+    quality; the page then ships a few tens of KB per frame instead of a raw RGB array
+    (854x480x3 = 1.2 MB) that Streamlit would have to encode on the script thread.
+    """
+
+    def __init__(self, fmt="jpeg", quality=75):
+        if fmt not in _FORMATS:
+            raise ValueError(f"Unknown preview format: {fmt}")
+        self.fmt = fmt
+        self.quality = int(quality)
+        self._ext, flag = _FORMATS[fmt]
+        self._params = [flag, self.quality]
+
+    def __call__(self, frame, detections, display_size=(854, 480)):
+        # cv2 encodes BGR, so the annotated frame goes straight in without an RGB swap
+        ok, buf = cv2.imencode(self._ext, annotate(frame, detections, display_size), self._params)
+        if not ok:
+            raise RuntimeError(f"Preview encoding to {self.fmt} failed")
+        return buf.tobytes()
+
+
+class ChangeFilter:
+    """Remembers what was last pushed per UI slot so unchanged values are not re-sent."""
+
+    def __init__(self):
+        self._last = {}
+
+    def changed(self, key, value):
+        if key in self._last and self._last[key] == value:
+            return False
+        self._last[key] = value
+        return True
@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+
+from core.detection.detections import Detections
+
+
+class MotionGate:
+    """
+    Decides per frame whether inference is worth running.
+
+    score() is a cheap motion measure: the fraction of pixels of a small grayscale probe
+    that changed by more than `pixel_threshold` since the previous frame. decide() turns
+    it into an inference interval:
+      - strong motion or a dense scene (more than `dense_count` vehicles) -> every
+        `min_interval` frames
+      - a static or empty scene -> only every `max_interval` frames (a heartbeat, so
+        slow changes and parked queues are still picked up)
+      - otherwise the base interval (the page's Frame Skip slider)
+    The motion level rises immediately but decays over a few probes, so one quiet
+    frame in the middle of traffic does not drop the rate.
+
+    Only decoded frames can be probed or analysed. stride() tells the decoder how often
+    to decode: every `probe_interval` frames while the scene is calm, every frame the
+    gate may want to analyse once it picks up. Frames in between can be grabbed without
+    decoding; decide() never picks one of those and waits for the next probed frame.
+    """
+
+    def __init__(self, min_interval=1, max_interval=15, low_motion=0.002, high_motion=0.02,
+                 dense_count=15, pixel_threshold=25, probe_size=(160, 90), decay=0.5, probe_interval=1):
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.probe_interval = max(1, int(probe_interval))
+        self.low_motion = low_motion
+        self.high_motion = high_motion
+        self.dense_count = dense_count
+        self.pixel_threshold = pixel_threshold
+        self.probe_size = probe_size
+        self.decay = decay
+
+        self.level = 0.0
+        self.current_interval = self.min_interval  # set by decide(), read by the decode thread
+        self._since_last = None    # frames since the last analysed one
+        w, h = probe_size
+        self._small = np.empty((h, w, 3), dtype=np.uint8)
+        self._probe = np.empty((h, w), dtype=np.uint8)
+        self._prev = None
+        self._diff = np.empty((h, w), dtype=np.uint8)
+
+    def score(self, frame):
+        """Fraction of probe pixels that changed since the previous call (decode thread)."""
+        cv2.resize(frame, self.probe_size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._probe)
+        if self._prev is None:
+            self._prev = self._probe.copy()
+            return 1.0
+        cv2.absdiff(self._probe, self._prev, dst=self._diff)
+        self._prev, self._probe = self._probe, self._prev
+        return cv2.countNonZero(cv2.threshold(self._diff, self.pixel_threshold, 255,
+                                              cv2.THRESH_BINARY)[1]) / self._diff.size
+
+    def stride(self):
+        """Frames between decoded ones (decode thread): probe calm scenes, decode what may be analysed."""
+        return min(self.probe_interval, self.current_interval)
+
+    def interval(self, count, base_interval=1):
+        if self.level >= self.high_motion or count > self.dense_count:
+            return self.min_interval
+        if self.level < self.low_motion:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, int(base_interval)))
+
+    def decide(self, motion, count, base_interval=1):
+        """
+        True when this frame should be analysed (inference thread, in frame order).
+        `motion` is None for frames that were not decoded; those are never analysed.
+        """
+        if motion is not None:
+            self.level = max(motion, self.level * self.decay)
+        self.current_interval = self.interval(count, base_interval)
+        if motion is not None and (self._since_last is None or self._since_last + 1 >= self.current_interval):
+            self._since_last = 0
+            return True
+        self._since_last = (self._since_last or 0) + 1
+        return False
+
+
+class TrackInterpolator:
+    """
+    Boxes for frames that were not analysed, from the tracker's own motion.
+
+    Between two analysed frames a track's box is linearly interpolated; past the last
+    analysed frame it is extrapolated with the velocity between the last two analysed
+    frames (for at most `max_horizon` frames). Untracked rows (emergency hits) and
+    tracks seen only once are held where they were last seen.
+    """
+
+    def __init__(self, max_horizon=30, frame_shape=None):
+        self.max_horizon = max_horizon
+        self.frame_shape = frame_shape
+        self._prev = None  # (index, Detections) of the analysed frame before the last
+        self._last = None  # (index, Detections) of the last analysed frame
+
+    def observe(self, index, detections, frame_shape=None):
+        if frame_shape is not None:
+            self.frame_shape = frame_shape
+        self._prev, self._last = self._last, (index, detections)
+
+    def between(self, index, later_index, later):
+        """Detections for `index`, lying between the last analysed frame and `later`."""
+        if self._last is None:
+            return later
+        last_index, last = self._last
+        t = (index - last_index) / max(1, later_index - last_index)
+        return self._moved(last, later, t)
+
+    def extrapolate(self, index):
+        """Detections for `index`, after the last analysed frame."""
+        if self._last is None:
+            return Detections.empty()
+        last_index, last = self._last
+        if self._prev is None:
+            return last
+        prev_index, prev = self._prev
+        steps = min(index - last_index, self.max_horizon) / max(1, last_index - prev_index)
+        # Same rule as interpolation, with t > 1 measured from prev to last
+        return self._moved(prev, last, 1.0 + steps, anchor=last)
+
+    def _moved(self, a, b, t, anchor=None):
+        """Rows of `anchor` (default a) with tracks matched in a and b moved to a + t*(b - a)."""
+        anchor = a if anchor is None else anchor
+        if not len(anchor) or not len(a) or not len(b):
+            return anchor
+        tracked_a = (a.ids >= 0) & ~a.emergency
+        tracked_b = (b.ids >= 0) & ~b.emergency
+        common, ia, ib = np.intersect1d(a.ids[tracked_a], b.ids[tracked_b], return_indices=True)
+        if not len(common):
+            return anchor
+
+        start = a.boxes[np.flatnonzero(tracked_a)[ia]]
+        end = b.boxes[np.flatnonzero(tracked_b)[ib]]
+        moved = start + (end - start) * np.float32(t)
+
+        boxes = anchor.boxes.copy()
+        tracked = (anchor.ids >= 0) & ~anchor.emergency
+        rows = np.flatnonzero(tracked)
+        pos = np.searchsorted(common, anchor.ids[rows])
+        pos = np.minimum(pos, len(common) - 1)
+        hit = common[pos] == anchor.ids[rows]
+        boxes[rows[hit]] = moved[pos[hit]]
+        if self.frame_shape is not None:
+            h, w = self.frame_shape[:2]
+            np.clip(boxes[:, 0::2], 0, w, out=boxes[:, 0::2])
+            np.clip(boxes[:, 1::2], 0, h, out=boxes[:, 1::2])
+        return Detections(boxes, anchor.ids, anchor.classes, anchor.confidences, anchor.emergency)
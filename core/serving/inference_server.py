@@ -0,0 +1,293 @@
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from core.metrics.registry import BATCH_FRAMES, QUEUE_DEPTH, STAGE_SECONDS
+
+
+class _Request:
+    __slots__ = ("frames", "conf", "positions", "future", "enqueued")
+
+    def __init__(self, frames, conf, positions):
+        self.frames = frames
+        self.conf = conf
+        self.positions = positions
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class InferenceClient:
+    """
+    One caller's handle on an InferenceServer, with VehicleDetector's process_frame /
+    process_batch / emergency_report / reset_tracker interface so it can stand in for the
+    detector in a FramePipeline. Owns its DetectionStream; close() when the caller is done.
+    """
+
+    def __init__(self, server, name, video_path=None):
+        self.server = server
+        self.name = name
+        self.stream = server.detector.new_stream(video_path)
+        self.last_submit = 0.0
+        self.last_used = time.perf_counter()  # created, last submitted or last answered, for pruning
+        self.running = 0  # requests taken off the queue and not answered yet
+        self._queue = deque()
+
+    def submit(self, frames, conf_threshold, positions=None, timeout=None):
+        """Queue up to max_batch frames; the Future resolves to [(detections, is_emergency), ...]."""
+        return self.server.submit(self, frames, conf_threshold, positions, timeout)
+
+    def process_batch(self, frames, conf_threshold, positions=None):
+        outputs = []
+        for start in range(0, len(frames), self.server.max_batch):
+            chunk = slice(start, start + self.server.max_batch)
+            future = self.submit(frames[chunk], conf_threshold, None if positions is None else positions[chunk])
+            outputs.extend(self.server.wait(future))
+        return outputs
+
+    def process_frame(self, frame, conf_threshold, position=None):
+        return self.process_batch([frame], conf_threshold, None if position is None else [position])[0]
+
+    def emergency_report(self):
+        return self.server.detector.emergency_report(self.stream)
+
+    def reset_tracker(self):
+        self.stream.reset()
+
+    def close(self):
+        self.server.remove(self)
+
+
+class InferenceServer:
+    """
+    Dynamic micro-batching in front of one shared VehicleDetector.
+
+    Every session or stream gets a client(); their frame requests are queued here and a
+    single worker thread runs them as micro-batches: one traffic-model call (and one
+    emergency call) for frames from several clients, with each client's frames tracked by
+    its own stream. N operators watching N feeds then cost about one batched model call
+    per round instead of N serialised ones.
+
+    A batch is dispatched as soon as it holds `max_batch` frames, every recently active
+    client has a request in it, or its oldest request has waited `max_wait` seconds.
+    Fairness: clients are served round-robin, with at most one request per client per
+    batch (a stream's letterbox buffers are reused, so it cannot have two requests in
+    one batch anyway), and the clients just served go to the back of the line. A batch
+    only mixes requests whose letterboxed canvases have the same shape, so no frame is
+    rescaled; the others go first in the next round.
+
+    Queue limits: a client may have `max_pending` requests queued. submit() waits up
+    to `timeout` seconds for room and raises queue.Full past it, so one runaway caller
+    cannot grow the queue or starve the rest.
+
+    Clients whose callers vanish without close() (a browser tab closed mid-run) are
+    closed once they have had nothing queued or running for `close_idle_after` seconds,
+    releasing their stream state; the check runs whenever a client is created or a batch formed.
+    If the worker thread dies, every queued request fails rather than leaving callers waiting.
+    """
+
+    def __init__(self, detector, max_batch=None, max_wait=0.01, max_pending=2, idle_after=1.0,
+                 close_idle_after=None):
+        self.detector = detector
+        self.max_batch = max(1, int(max_batch or detector.batch_size))
+        self.max_wait = max_wait
+        self.max_pending = max(1, int(max_pending))
+        self.idle_after = idle_after  # seconds without a request before a client stops holding up batches
+        self.close_idle_after = close_idle_after
+        self.batches = 0
+        self.frames = 0
+        self._clients = OrderedDict()  # rotation order
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._depth = QUEUE_DEPTH.labels(queue="inference")
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="inference-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def client(self, name=None, video_path=None):
+        """A new client with its own tracker and cascade state, reading `video_path` through the cache if given."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Inference server stopped")
+            self._prune()
+            client = InferenceClient(self, name or f"client-{next(self._ids)}", video_path)
+            self._clients[id(client)] = client
+        return client
+
+    def remove(self, client):
+        with self._cond:
+            if self._clients.pop(id(client), None) is not None:
+                self._fail(client, RuntimeError(f"{client.name} closed"))
+            self._cond.notify_all()
+
+    def submit(self, client, frames, conf_threshold, positions=None, timeout=None):
+        frames = list(frames)
+        if not 0 < len(frames) <= self.max_batch:
+            raise ValueError(f"A request holds 1 to {self.max_batch} frames, got {len(frames)}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Inference server stopped")
+                if id(client) not in self._clients:
+                    raise RuntimeError(f"{client.name} closed")
+                if len(client._queue) < self.max_pending:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Full(f"{client.name} already has {self.max_pending} requests queued")
+                self._cond.wait(remaining)
+            request = _Request(frames, conf_threshold, positions)
+            client._queue.append(request)
+            client.last_submit = client.last_used = request.enqueued
+            self._report_depth()
+            self._cond.notify_all()
+        return request.future
+
+    def wait(self, future, poll=1.0):
+        """future.result(), raising RuntimeError instead of waiting forever if the worker thread is gone."""
+        while True:
+            try:
+                return future.result(timeout=poll)
+            except FutureTimeout:
+                if self._thread is None or not self._thread.is_alive():
+                    if future.done():
+                        return future.result()
+                    raise RuntimeError("Inference server stopped") from None
+
+    def stop(self, join_timeout=5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(join_timeout)
+        with self._cond:
+            for client in self._clients.values():
+                self._fail(client, RuntimeError("Inference server stopped"))
+
+    def _serve(self):
+        try:
+            while True:
+                with self._cond:
+                    batch = self._next_batch()
+                    self._report_depth()
+                    self._cond.notify_all()  # room in the served clients' queues
+                if batch is None:
+                    return
+                self._run(batch)
+        finally:
+            # However the thread ends, nobody is left waiting on a request it will never run
+            with self._cond:
+                self._closed = True
+                for client in self._clients.values():
+                    self._fail(client, RuntimeError("Inference server stopped"))
+                self._cond.notify_all()
+
+    def _next_batch(self):
+        # Called with the condition held; blocks until a batch is due, None once stopped
+        while not self._closed:
+            self._prune()
+            waiting = [c for c in self._clients.values() if c._queue]
+            if not waiting:
+                self._cond.wait()
+                continue
+
+            keys = {}
+            for client in waiting:
+                request = client._queue[0]
+                try:
+                    keys[id(client)] = client.stream.preprocessor.canvas_shape(request.frames[0].shape)
+                except Exception as e:
+                    # A frame this client's geometry cannot handle (e.g. an ROI outside it)
+                    # fails that request only
+                    client._queue.popleft()
+                    if request.future.set_running_or_notify_cancel():
+                        request.future.set_exception(e)
+            if len(keys) < len(waiting):
+                continue
+
+            shape = None
+            picked, frames = [], 0
+            for client in waiting:
+                request = client._queue[0]
+                key = keys[id(client)]
+                if shape is None:
+                    shape = key
+                if key != shape or (picked and frames + len(request.frames) > self.max_batch):
+                    continue
+                picked.append(client)
+                frames += len(request.frames)
+
+            now = time.perf_counter()
+            due = min(c._queue[0].enqueued for c in waiting) + self.max_wait
+            active = sum(1 for c in self._clients.values() if c._queue or now - c.last_submit < self.idle_after)
+            if frames >= self.max_batch or len(picked) >= active or now >= due:
+                requests = []
+                for client in picked:
+                    request = client._queue.popleft()
+                    self._clients.move_to_end(id(client))
+                    # Skip requests whose caller gave up while they were queued
+                    if request.future.set_running_or_notify_cancel():
+                        client.running += 1
+                        requests.append((client, request))
+                if requests:
+                    return requests
+                continue
+            self._cond.wait(due - now)
+        return None
+
+    def _run(self, requests):
+        try:
+            self._run_batch(requests)
+        finally:
+            with self._cond:
+                done = time.perf_counter()
+                for client, _ in requests:
+                    client.running -= 1
+                    client.last_used = done
+
+    def _run_batch(self, requests):
+        now = time.perf_counter()
+        wait = STAGE_SECONDS.labels(stage="queue_wait")
+        for _, request in requests:
+            wait.observe(now - request.enqueued)
+        try:
+            # Letterboxing happens here rather than in submit(): the images are views
+            # into the stream's reused buffers and must not be overwritten while queued
+            parts = [self.detector.prepare(r.frames, r.conf, c.stream, r.positions) for c, r in requests]
+            outputs = self.detector.run_prepared(parts)
+        except Exception as e:
+            for _, request in requests:
+                request.future.set_exception(e)
+            return
+        frames = sum(len(p) for p in parts)
+        BATCH_FRAMES.observe(frames)
+        self.batches += 1
+        self.frames += frames
+        for (_, request), output in zip(requests, outputs):
+            request.future.set_result(output)
+
+    def _prune(self):
+        # Called with the condition held
+        if self.close_idle_after is None:
+            return
+        cutoff = time.perf_counter() - self.close_idle_after
+        for key, client in list(self._clients.items()):
+            if not client._queue and not client.running and client.last_used < cutoff:
+                del self._clients[key]
+
+    def _fail(self, client, error):
+        while client._queue:
+            request = client._queue.popleft()
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(error)
+        self._report_depth()
+
+    def _report_depth(self):
+        self._depth.set(sum(len(c._queue) for c in self._clients.values()))
@@ -0,0 +1,181 @@
+import itertools
+
+import numpy as np
+
+POLICIES = ("linear", "webster", "max_pressure")
+
+# Parameters each policy reads (all are (P,) arrays, one entry per simulated parameter set)
+POLICY_PARAMS = {
+    "linear": ("min_green", "max_green", "unit_time"),
+    "webster": ("min_green", "max_green"),
+    "max_pressure": ("min_green", "max_green"),
+}
+
+GREEN, LOST = 0, 1
+
+
+def simulate(arrivals, policy, params, dt=2.0, saturation_flow=0.5, lost_time=4.0, flow_alpha=0.01):
+    """
+    Replay per-approach arrivals through P signal controllers at once.
+
+    arrivals: (T, A) vehicles arriving per approach in each dt-second step.
+    params:   dict of equal-length arrays, see POLICY_PARAMS.
+    One approach is green at a time; a green approach discharges up to
+    `saturation_flow` vehicles/second, and every phase change costs `lost_time`
+    seconds of all-red. All P controllers advance together as array operations.
+
+    Returns a dict of (P,) arrays: mean_queue, max_queue, total_delay (veh-s),
+    avg_delay (s/veh), cycles and served.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    T, A = arrivals.shape
+    p = {k: np.asarray(params[k], dtype=np.float64) for k in POLICY_PARAMS[policy]}
+    P = len(p["min_green"])
+    rows = np.arange(P)
+
+    queue = np.zeros((P, A))
+    flat_queue = queue.reshape(-1)             # view: queue of the green approach via rows * A + phase
+    phase = np.zeros(P, dtype=np.int64)
+    stage = np.full(P, LOST, dtype=np.int64)   # start with an all-red interval
+    timer = np.full(P, lost_time)
+    green_elapsed = np.zeros(P)
+    # Arrival-rate estimate (veh/s) is the same for every controller, so it stays (A,)
+    flow = arrivals[:min(T, 60)].mean(axis=0) / dt
+
+    queue_sum = np.zeros(P)
+    max_queue = np.zeros(P)
+    served = np.zeros(P)
+    cycles = np.zeros(P)
+    capacity = saturation_flow * dt
+
+    track_elapsed = policy == "max_pressure"
+
+    total = np.zeros(P)          # queue.sum(axis=1), kept incrementally
+    arrived_step = arrivals.sum(axis=1)
+
+    for t in range(T):
+        queue += arrivals[t]
+        flow += flow_alpha * (arrivals[t] / dt - flow)
+
+        # Discharge the green approach
+        green = stage == GREEN
+        slot = rows * A + phase
+        out = np.minimum(flat_queue[slot], capacity) * green
+        flat_queue[slot] -= out
+        served += out
+        total += arrived_step[t]
+        total -= out
+        queue_sum += total
+        np.maximum(max_queue, total, out=max_queue)
+
+        timer -= dt
+        if track_elapsed:
+            green_elapsed += dt * green
+        expired = timer <= 0
+        if not expired.any():
+            continue
+
+        # All-red over -> start the next green; its length depends on the policy
+        start = expired & (stage == LOST)
+        if start.any():
+            idx = rows[start]
+            stage[idx] = GREEN
+            green_elapsed[idx] = 0.0
+            timer[idx] = _green_time(policy, p, idx, phase[idx], queue[idx], flow,
+                                     saturation_flow, lost_time, A)
+
+        # Green over -> pick the next phase and go all-red
+        end = expired & (stage == GREEN) & ~start
+        if end.any():
+            idx = rows[end]
+            if policy == "max_pressure":
+                # Serve whichever approach has the largest queue (downstream assumed free);
+                # keep the current green while it is still the winner and max_green allows.
+                best = queue[idx].argmax(axis=1)
+                stay = (best == phase[idx]) & (green_elapsed[idx] + p["min_green"][idx] <= p["max_green"][idx])
+                timer[idx[stay]] = p["min_green"][idx[stay]]
+                idx, best = idx[~stay], best[~stay]
+                cycles[idx] += 1.0 / A
+                phase[idx] = best
+            else:
+                phase[idx] = (phase[idx] + 1) % A
+                cycles[idx] += (phase[idx] == 0)
+            stage[idx] = LOST
+            timer[idx] = lost_time
+
+    arrived = arrivals.sum()
+    total_delay = queue_sum * dt
+    return {
+        "mean_queue": queue_sum / T,
+        "max_queue": max_queue,
+        "total_delay": total_delay,
+        "avg_delay": total_delay / max(arrived, 1.0),
+        "cycles": cycles,
+        "served": served,
+    }
+
+
+def _green_time(policy, p, idx, phase, queue, flow, saturation_flow, lost_time, A):
+    lo, hi = p["min_green"][idx], p["max_green"][idx]
+    n = np.arange(len(idx))
+
+    if policy == "linear":
+        # SignalController.get_adaptive_timing with the queue as the density
+        return np.clip(lo + queue[n, phase] * p["unit_time"][idx], lo, hi)
+
+    if policy == "webster":
+        # Webster optimum cycle C0 = (1.5 L + 5) / (1 - Y), green split by flow ratio
+        y = np.clip(flow / saturation_flow, 1e-6, None)
+        Y = min(y.sum(), 0.95)
+        L = lost_time * A
+        cycle = (1.5 * L + 5) / (1 - Y)
+        share = y[phase] / y.sum()
+        return np.clip((cycle - L) * share, lo, hi)
+
+    # max_pressure: hold for one decision interval, re-evaluated when it expires
+    return lo
+
+
+def sweep(arrivals, grid, policies=POLICIES, **kwargs):
+    """
+    Evaluate the cartesian product of `grid` ({param: [values]}) for each policy.
+
+    Returns {policy: {"params": {name: (P,) array}, **simulate(...) metrics}}.
+    """
+    results = {}
+    for policy in policies:
+        names = [k for k in POLICY_PARAMS[policy] if k in grid]
+        combos = np.array(list(itertools.product(*(grid[k] for k in names))), dtype=np.float64)
+        params = {k: combos[:, i] for i, k in enumerate(names)}
+        # Invalid ranges are simulated anyway but flagged so they can be filtered out
+        valid = params["max_green"] >= params["min_green"]
+        metrics = simulate(arrivals, policy, params, **kwargs)
+        results[policy] = {"params": params, "valid": valid, **metrics}
+    return results
+
+
+def best(result, metric="avg_delay"):
+    """Index and parameter dict of the best valid parameter set in one sweep() entry."""
+    score = np.where(result["valid"], result[metric], np.inf)
+    i = int(score.argmin())
+    return i, {k: float(v[i]) for k, v in result["params"].items()}
+
+
+def synthetic_arrivals(hours=24, approaches=4, dt=2.0, base_rate=0.02, peak_rate=0.12, seed=0):
+    """Poisson arrivals with morning and evening peaks; (T, A) vehicles per dt step."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, hours * 3600, dt) / 3600.0
+    profile = np.exp(-((t % 24 - 8.5) ** 2) / 2) + np.exp(-((t % 24 - 17.5) ** 2) / 3)
+    # Unbalanced approaches: the first ones are the main road
+    weights = np.linspace(1.0, 0.5, approaches)
+    rate = (base_rate + (peak_rate - base_rate) * profile)[:, None] * weights[None, :]
+    return rng.poisson(rate * dt).astype(np.float64)
+
+
+def arrivals_from_counts(counts, interval_s, dt=2.0):
+    """Spread recorded per-interval counts ((K, A) vehicles per interval) evenly over dt steps."""
+    counts = np.asarray(counts, dtype=np.float64)
+    steps = max(1, int(round(interval_s / dt)))
+    return np.repeat(counts / steps, steps, axis=0)
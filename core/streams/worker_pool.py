@@ -0,0 +1,220 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import cv2
+
+from core.video.frame_ring import BLOCK, FrameRing
+from core.video.frame_source import FrameSource
+
+
+def _decode_worker(approach, source, ring, frame_skip, loop, results, stop_event):
+    # Decodes every frame_skip-th frame straight into the ring's shared memory
+    cv2.setNumThreads(1)
+    try:
+        while not stop_event.is_set():
+            with FrameSource(source, start=max(1, frame_skip) - 1) as frames:
+                while not stop_event.is_set():
+                    slot = ring.acquire_write(timeout=0.5)
+                    if slot is None:
+                        if ring.closed:
+                            return
+                        continue
+                    position = frames.position
+                    frame = frames.read(out=slot.frame)
+                    if frame is None:
+                        ring.abandon(slot)
+                        break
+                    if frame is not slot.frame:
+                        ring.abandon(slot)
+                        raise ValueError(f"{source}: frame size changed to {frame.shape}, ring slots are {ring.shape}")
+                    ring.publish(slot, position)
+                    if not frames.skip(frame_skip - 1):
+                        break
+            if not loop:
+                break
+    except Exception as e:
+        results.put((approach, None, None, None, repr(e)))
+    finally:
+        ring.close()
+
+
+def _ring_batches(ring, batch_size, stop_event):
+    # Up to batch_size frames at a time, split where the decoder looped back to the start
+    while not stop_event.is_set():
+        slot = ring.acquire_read(timeout=0.5)
+        if slot is None:
+            if ring.closed:
+                return
+            continue
+        slots = [slot]
+        while len(slots) < batch_size:
+            slot = ring.acquire_read(timeout=0)
+            if slot is None:
+                break
+            if slot.index <= slots[-1].index:
+                yield slots
+                slots = []
+            slots.append(slot)
+        yield slots
+
+
+def _detect_from_ring(approach, source, detector, ring, conf, results, stop_event):
+    # Frames come from a decoder process and are read in place; the slots go back to
+    # the decoder as soon as the batch is through the models
+    detector.attach_cache(source)
+    last = -1
+    try:
+        for slots in _ring_batches(ring, detector.batch_size, stop_event):
+            if slots[0].index <= last:
+                detector.reset_tracker()  # the decoder looped back to the start
+            try:
+                outputs = detector.process_batch([s.frame for s in slots], conf, positions=[s.index for s in slots])
+            finally:
+                for slot in slots:
+                    ring.release(slot)
+            last = slots[-1].index
+            for slot, (detections, is_emergency) in zip(slots, outputs):
+                results.put((approach, slot.index + 1, detections.normal_count, is_emergency, time.time()))
+    finally:
+        ring.close()  # a decoder blocked on a full ring must not outlive us
+
+
+def _stream_worker(approach, source, conf, frame_skip, threads, loop, detector_kwargs, results, stop_event,
+                   ring=None):
+    # Pin the thread pools before anything parallel runs so N workers share the cores
+    # instead of each spawning one thread per core.
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already initialised in this process
+    cv2.setNumThreads(1)
+
+    from core.detection.vehicle_detector import VehicleDetector
+
+    try:
+        detector = VehicleDetector(**detector_kwargs)  # own models + own tracker state
+        if ring is not None:
+            _detect_from_ring(approach, source, detector, ring, conf, results, stop_event)
+        else:
+            while not stop_event.is_set():
+                for frame_index, detections, is_emergency in detector.process_video(source, conf, frame_skip):
+                    if stop_event.is_set():
+                        break
+                    results.put((approach, frame_index, detections.normal_count, is_emergency, time.time()))
+                if not loop:
+                    break
+                # File-backed stand-in for a camera feed: start over with fresh track IDs
+                detector.reset_tracker()
+    except Exception as e:
+        results.put((approach, None, None, None, repr(e)))
+        return
+    results.put((approach, None, None, None, None))
+
+
+class StreamPool:
+    """
+    One worker process per video source (approach -> file), each with its own detector
+    and tracker. Workers report (approach, frame_index, vehicle_count, is_emergency, ts)
+    on a shared queue; a finished worker reports frame_index None.
+
+    With `decode_process`, each source also gets a decoder process that decodes into a
+    shared-memory FrameRing of `ring_slots` frames, and the detector reads them in
+    place, so decoding and inference overlap without frames being pickled across.
+    `ring_policy` (BLOCK or OVERWRITE) decides whether a decoder that gets ahead waits
+    for the detector or replaces the oldest frame it has not started on.
+    """
+
+    def __init__(self, sources, conf=0.35, frame_skip=1, threads_per_worker=None, loop=False,
+                 detector_kwargs=None, queue_size=1024, decode_process=False, ring_slots=None, ring_policy=BLOCK):
+        self.sources = dict(sources)
+        self.conf = conf
+        self.frame_skip = frame_skip
+        self.loop = loop
+        self.detector_kwargs = detector_kwargs or {}
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // max(1, len(self.sources)))
+        self.threads_per_worker = threads_per_worker
+        self.decode_process = decode_process
+        self.ring_policy = ring_policy
+        # Room for the batch the detector holds, the one it takes next and a frame being decoded
+        self.ring_slots = ring_slots or 2 * int(self.detector_kwargs.get("batch_size", 8)) + 1
+
+        # spawn: forking a process that already initialised torch/OpenMP is unsafe
+        self._ctx = mp.get_context("spawn")
+        self.results = self._ctx.Queue(queue_size)
+        self._stop = self._ctx.Event()
+        self._procs = {}
+        self._decoders = {}
+        self._rings = {}
+        self.finished = set()
+        self.errors = {}
+
+    def start(self):
+        for approach, source in self.sources.items():
+            ring = None
+            if self.decode_process:
+                with FrameSource(source) as probe:
+                    if not probe.opened:
+                        raise ValueError(f"Cannot open video source '{source}'")
+                    shape = probe.shape
+                ring = self._rings[approach] = FrameRing(self.ring_slots, shape, policy=self.ring_policy,
+                                                         ctx=self._ctx)
+                d = self._ctx.Process(
+                    target=_decode_worker,
+                    args=(approach, source, ring, self.frame_skip, self.loop, self.results, self._stop),
+                    name=f"decode-{approach}",
+                    daemon=True,
+                )
+                d.start()
+                self._decoders[approach] = d
+            p = self._ctx.Process(
+                target=_stream_worker,
+                args=(approach, source, self.conf, self.frame_skip, self.threads_per_worker,
+                      self.loop, self.detector_kwargs, self.results, self._stop, ring),
+                name=f"stream-{approach}",
+                daemon=True,
+            )
+            p.start()
+            self._procs[approach] = p
+        return self
+
+    def poll(self, timeout=0.5):
+        """Next (approach, frame_index, count, is_emergency) update, or None."""
+        try:
+            approach, frame_index, count, is_emergency, extra = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if frame_index is None:
+            self.finished.add(approach)
+            if extra is not None:
+                self.errors[approach] = extra
+            return None
+        return approach, frame_index, count, is_emergency
+
+    @property
+    def done(self):
+        return len(self.finished) == len(self._procs)
+
+    def stop(self, join_timeout=5.0):
+        self._stop.set()
+        for ring in self._rings.values():
+            ring.close()  # wakes decoders and detectors waiting on a slot
+        procs = [*self._procs.values(), *self._decoders.values()]
+        # Drain so workers blocked on a full queue can see the stop flag and exit
+        deadline = time.monotonic() + join_timeout
+        while any(p.is_alive() for p in procs) and time.monotonic() < deadline:
+            try:
+                self.results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            p.join(timeout=1.0)
+        for ring in self._rings.values():
+            ring.unlink()
+        self._rings.clear()
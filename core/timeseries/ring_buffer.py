@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+
+# Per-frame live metrics recorded by the pages
+FRAME_FIELDS = ("vehicles", "car", "motorcycle", "bus", "truck", "occupancy", "emergency", "signal")
+# COCO class ids behind the per-class columns
+CLASS_COLUMNS = {"car": 2, "motorcycle": 3, "bus": 5, "truck": 7}
+# Encoding of the "signal" column
+SIGNAL_STATES = {"green": 0, "yellow": 1, "red": 2, "emergency": 3}
+
+
+class TimeSeriesRing:
+    """
+    Fixed-capacity, multi-resolution ring buffer of numeric samples.
+
+    Level 0 keeps the last `capacity` raw samples. Every `factor` samples written to a
+    level are averaged into one sample of the next level, so level k covers factor**k
+    times as much history at the same capacity: with the defaults 2048 raw frames,
+    ~9 min and ~2.5 h at 30 FPS. Memory is levels * capacity rows, whatever the run length.
+    Averaging makes 0/1 columns such as "emergency" read as the fraction of frames.
+
+    series() picks the finest level that still reaches back far enough and downsamples
+    it with LTTB, so a chart costs the same after a minute as after a week.
+    """
+
+    def __init__(self, fields=FRAME_FIELDS, capacity=2048, factor=16, levels=3):
+        self.fields = tuple(fields)
+        self.capacity = int(capacity)
+        self.factor = int(factor)
+        self.levels = int(levels)
+        width = 1 + len(self.fields)  # column 0 is the timestamp
+        self._data = np.zeros((self.levels, self.capacity, width))
+        self._written = np.zeros(self.levels, dtype=np.int64)
+        self._acc = np.zeros((self.levels, width))
+        self._acc_n = np.zeros(self.levels, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return int(min(self._written[0], self.capacity))
+
+    def append(self, ts, values):
+        """Add one sample; `values` is a mapping or a sequence aligned with `fields`."""
+        row = np.empty(1 + len(self.fields))
+        row[0] = ts
+        if isinstance(values, dict):
+            row[1:] = [values.get(f, 0.0) for f in self.fields]
+        else:
+            row[1:] = values
+        with self._lock:
+            self._push(0, row)
+
+    def _push(self, level, row):
+        self._data[level, self._written[level] % self.capacity] = row
+        self._written[level] += 1
+        if level + 1 < self.levels:
+            self._acc[level] += row
+            self._acc_n[level] += 1
+            if self._acc_n[level] == self.factor:
+                self._push(level + 1, self._acc[level] / self.factor)
+                self._acc[level] = 0.0
+                self._acc_n[level] = 0
+
+    def last(self):
+        """The most recent raw sample as a dict (None when empty)."""
+        with self._lock:
+            if not self._written[0]:
+                return None
+            row = self._data[0, (self._written[0] - 1) % self.capacity]
+            return dict(zip(("ts",) + self.fields, row.tolist()))
+
+    def window(self, level=0):
+        """Samples of one level, oldest first: (N, 1 + len(fields)), column 0 the timestamp."""
+        with self._lock:
+            n = self._written[level]
+            if n <= self.capacity:
+                return self._data[level, :n].copy()
+            split = n % self.capacity
+            return np.concatenate((self._data[level, split:], self._data[level, :split]))
+
+    def series(self, fields=None, since=None, max_points=300):
+        """
+        (timestamps, {field: values}) covering `since` onwards (default: everything kept),
+        from the finest level that reaches back that far, LTTB-downsampled to max_points.
+        LTTB picks points by the first field; the others are read at the same timestamps.
+        """
+        fields = self.fields if fields is None else tuple(fields)
+        data = self._covering(since)
+        if since is not None:
+            data = data[data[:, 0] >= since]
+        if not len(data):
+            return np.empty(0), {f: np.empty(0) for f in fields}
+
+        cols = [1 + self.fields.index(f) for f in fields]
+        idx = lttb_indices(data[:, 0], data[:, cols[0]], max_points)
+        return data[idx, 0], {f: data[idx, c] for f, c in zip(fields, cols)}
+
+    def _covering(self, since):
+        data = None
+        for level in range(self.levels):
+            data = self.window(level)
+            complete = self._written[level] <= self.capacity  # still holds everything since the start
+            if complete or not len(data) or (since is not None and data[0, 0] <= since):
+                break
+        if level and len(data):
+            # Raw samples not yet averaged into this level keep the newest edge live
+            raw = self.window(0)
+            data = np.concatenate((data, raw[raw[:, 0] > data[-1, 0]]))
+        return data
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the visual
+    shape of (x, y). First and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        nhi = max(nhi, nlo + 1)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        # Point in this bucket forming the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def frame_row(detections, occupancy=0.0, signal="green"):
+    """FRAME_FIELDS values for one analysed frame."""
+    normal = detections.normal()
+    counts = np.bincount(np.clip(normal.classes, 0, None), minlength=8)
+    row = {"vehicles": len(normal), "occupancy": occupancy,
+           "emergency": float(detections.is_emergency), "signal": SIGNAL_STATES[signal]}
+    row.update({name: int(counts[cls]) for name, cls in CLASS_COLUMNS.items()})
+    return row
@@ -0,0 +1,125 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from core.detection.detections import Detections
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class IoUTracker:
+    """
+    SORT / ByteTrack-style multi-object tracker on NumPy arrays.
+
+    All state lives in this object as parallel arrays, one row per track, so every
+    stream owns an independent tracker and nothing is shared through a model.
+    update() takes one frame's untracked Detections, in frame order:
+      1. each track's box is moved by its smoothed per-frame velocity (constant
+         velocity instead of a Kalman filter per track);
+      2. confident detections (>= high_thresh) are assigned to all tracks by IoU;
+      3. low-confidence detections (>= low_thresh) are assigned to the tracks still
+         unmatched that were seen on the previous frame - ByteTrack's way of keeping
+         partly occluded vehicles;
+      4. leftover detections >= new_track_thresh start tentative tracks, confirmed
+         (and given an id) on their `min_hits`-th match, or at once on the first frame.
+         Tentative tracks die on their first miss, confirmed ones after `track_buffer`
+         missed frames.
+    Assignment is optimal on the IoU matrix (linear_sum_assignment). The result holds
+    the confirmed tracks matched on this frame, with their detection's box. Defaults
+    follow ultralytics' bytetrack.yaml.
+    """
+
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, new_track_thresh=0.6, track_buffer=30,
+                 match_iou=0.2, low_match_iou=0.5, min_hits=2, smoothing=0.5):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.new_track_thresh = new_track_thresh
+        self.track_buffer = track_buffer
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.min_hits = max(1, int(min_hits))
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self._boxes = np.empty((0, 4), dtype=np.float32)   # last matched box
+        self._velocity = np.empty((0, 4), dtype=np.float32)  # per frame
+        self._ids = np.empty(0, dtype=np.int64)              # -1 while tentative
+        self._classes = np.empty(0, dtype=np.int64)
+        self._hits = np.empty(0, dtype=np.int64)
+        self._misses = np.empty(0, dtype=np.int64)           # frames since the last match
+        self._next_id = 1
+        self._frame = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def update(self, detections):
+        self._frame += 1
+        boxes, conf = detections.boxes, detections.confidences
+
+        # 1. Constant-velocity prediction from the last match
+        predicted = self._boxes + self._velocity * (self._misses + 1)[:, None]
+
+        # 2. + 3. Two-stage assignment
+        match = np.full(len(self), -1, dtype=np.int64)  # detection row per track
+        high = np.flatnonzero(conf >= self.high_thresh)
+        low = np.flatnonzero((conf >= self.low_thresh) & (conf < self.high_thresh))
+        rows, cols = self._assign(predicted, boxes[high], self.match_iou)
+        match[rows] = high[cols]
+        recent = np.flatnonzero((match < 0) & (self._misses == 0))
+        rows, cols = self._assign(predicted[recent], boxes[low], self.low_match_iou)
+        match[recent[rows]] = low[cols]
+
+        matched = np.flatnonzero(match >= 0)
+        det = match[matched]
+        step = (boxes[det] - self._boxes[matched]) / (self._misses[matched] + 1)[:, None]
+        first = (self._hits[matched] == 1)[:, None]
+        self._velocity[matched] = np.where(first, step, self.smoothing * step
+                                           + (1 - self.smoothing) * self._velocity[matched])
+        self._boxes[matched] = boxes[det]
+        self._classes[matched] = detections.classes[det]
+        self._hits[matched] += 1
+        self._misses += 1
+        self._misses[matched] = 0
+
+        # 4. Drop dead tracks, start new ones, hand out ids to newly confirmed tracks
+        confirmed = self._ids >= 0
+        keep = (self._misses == 0) | (confirmed & (self._misses <= self.track_buffer))
+        used = np.zeros(len(boxes), dtype=bool)
+        used[det] = True
+        new = np.flatnonzero(~used & (conf >= self.new_track_thresh))
+        rows = np.concatenate((match[keep], new))  # detection row per surviving track, -1 if missed
+        self._append(keep, boxes[new], detections.classes[new])
+
+        promote = (self._ids < 0) & (rows >= 0) & ((self._hits >= self.min_hits) | (self._frame == 1))
+        self._ids[promote] = np.arange(self._next_id, self._next_id + int(promote.sum()))
+        self._next_id += int(promote.sum())
+
+        out = np.flatnonzero((self._ids >= 0) & (rows >= 0))
+        return Detections(self._boxes[out], self._ids[out], self._classes[out], conf[rows[out]])
+
+    def _append(self, keep, boxes, classes):
+        n = len(boxes)
+        self._boxes = np.concatenate((self._boxes[keep], boxes))
+        self._velocity = np.concatenate((self._velocity[keep], np.zeros((n, 4), dtype=np.float32)))
+        self._ids = np.concatenate((self._ids[keep], np.full(n, -1, dtype=np.int64)))
+        self._classes = np.concatenate((self._classes[keep], classes))
+        self._hits = np.concatenate((self._hits[keep], np.ones(n, dtype=np.int64)))
+        self._misses = np.concatenate((self._misses[keep], np.zeros(n, dtype=np.int64)))
+
+    @staticmethod
+    def _assign(track_boxes, det_boxes, min_iou):
+        if not len(track_boxes) or not len(det_boxes):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        iou = box_iou(track_boxes, det_boxes)
+        rows, cols = linear_sum_assignment(iou, maximize=True)
+        ok = iou[rows, cols] >= min_iou
+        return rows[ok], cols[ok]
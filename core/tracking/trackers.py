@@ -0,0 +1,67 @@
+import functools
+from types import SimpleNamespace
+
+from core.detection.detections import Detections
+from core.tracking.iou_tracker import IoUTracker
+
+
+class ByteTrackTracker:
+    """
+    ultralytics' BYTETracker (a Kalman filter per track) behind the same interface as
+    IoUTracker, kept for comparison. BYTETracker numbers tracks from a counter shared by
+    every instance in the process and zeroes it whenever one is created or reset, which
+    would reissue ids under every other live stream. Here the counter is never zeroed and
+    each instance maps the ids it sees to its own 1, 2, 3, ..., like IoUTracker.
+    """
+
+    def __init__(self, cfg="bytetrack.yaml", frame_rate=30):
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        args = IterableSimpleNamespace(**yaml_load(check_yaml(cfg)))
+        self._args = args
+        self._frame_rate = frame_rate
+        self._tracker = _tracker_class(args.tracker_type)(args=args, frame_rate=frame_rate)
+        self._ids = {}  # process-wide id -> this tracker's id
+
+    def reset(self):
+        self._tracker = _tracker_class(self._args.tracker_type)(args=self._args, frame_rate=self._frame_rate)
+        self._ids.clear()
+
+    def update(self, detections):
+        if not len(detections):
+            return Detections.empty()
+        # BYTETracker reads .conf / .xyxy / .cls; rows come back as x1, y1, x2, y2, id, conf, cls, idx
+        tracks = self._tracker.update(SimpleNamespace(conf=detections.confidences, xyxy=detections.boxes,
+                                                      cls=detections.classes))
+        if not len(tracks):
+            return Detections.empty()
+        ids = [self._ids.setdefault(int(i), len(self._ids) + 1) for i in tracks[:, 4]]
+        return Detections(tracks[:, :4], ids, tracks[:, 6], tracks[:, 5])
+
+
+@functools.lru_cache(maxsize=None)
+def _tracker_class(tracker_type):
+    from ultralytics.trackers.track import TRACKER_MAP
+
+    class Tracker(TRACKER_MAP[tracker_type]):
+        def reset_id(self):
+            pass  # keep the process-wide counter running under the other live trackers
+
+    return Tracker
+
+
+# "iou"       - IoUTracker, vectorised NumPy association (default)
+# "bytetrack" - ultralytics' BYTETracker
+TRACKERS = {"iou": IoUTracker, "bytetrack": ByteTrackTracker}
+
+
+def create_tracker(kind="iou", **kwargs):
+    """
+    A new, independent tracker. Every tracker has update(detections) -> Detections,
+    taking one frame's untracked detections in frame order and returning the tracked
+    rows with ids >= 1, and reset().
+    """
+    if kind not in TRACKERS:
+        raise ValueError(f"Unknown tracker: {kind}")
+    return TRACKERS[kind](**kwargs)
@@ -0,0 +1,250 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.metrics.registry import QUEUE_DROPPED
+
+# What a writer does when every slot holds a frame some reader still needs:
+#   block     - wait for a reader to release one (lossless, backpressure reaches the decoder)
+#   overwrite - reuse the oldest published frame no reader is looking at (live feeds: newest wins)
+BLOCK = "block"
+OVERWRITE = "overwrite"
+
+FREE, WRITING, READY = 0, 1, 2
+
+SLOT_DTYPE = np.dtype([("state", "<i8"), ("seq", "<i8"), ("index", "<i8"), ("pending", "<i8"),
+                       ("timestamp", "<f8")])
+
+_ALIGN = 64  # cache line: no two slots share one
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+class FrameSlot:
+    """A frame in the ring: `frame` is a view into shared memory, valid until the slot is released."""
+
+    __slots__ = ("ring", "slot", "frame", "seq", "index", "timestamp", "reader")
+
+    def __init__(self, ring, slot, reader=None):
+        row = ring._table[slot]
+        self.ring = ring
+        self.slot = slot
+        self.frame = ring._frames[slot]
+        self.reader = reader  # None while held by the writer
+        self.seq = int(row["seq"])
+        self.index = int(row["index"])
+        self.timestamp = float(row["timestamp"])
+
+
+class FrameRing:
+    """
+    Fixed-shape frame slots in one shared-memory block, for handing frames between
+    processes without pickling them.
+
+    A writer (decoder) claims a free slot with acquire_write(), decodes straight into
+    `slot.frame` (FrameSource.read(out=...)) and publishes it; each of `readers`
+    readers gets every published frame, oldest first, from acquire_read() as a NumPy
+    view of the same memory, and release()s it when done. A slot is free again once
+    all readers have released it. So the only copy of a frame is the decoder writing it.
+
+    Slot bookkeeping (state, frame index, which readers still need it) lives in a small
+    table at the front of the block. Updates take one short cross-process lock, with no
+    pixels copied while it is held; waiting writers and readers sleep on its condition
+    instead of spinning. `policy` decides what a writer does when no slot is free (BLOCK
+    or OVERWRITE, see above); overwritten frames are counted in `dropped`.
+
+    Create the ring in the parent and pass it to child processes as a Process argument
+    (its lock can only be shared that way); the creator unlink()s it at the end.
+    close() marks the end of the stream: writers stop, readers drain what is left
+    and then get None.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, readers=1, policy=BLOCK, ctx=None):
+        if policy not in (BLOCK, OVERWRITE):
+            raise ValueError(f"Unknown frame ring policy '{policy}'")
+        if not 1 <= readers <= 62:
+            raise ValueError(f"A frame ring has 1 to 62 readers, got {readers}")
+        self.slots = max(2, int(slots))
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.readers = readers
+        self.policy = policy
+        size = self._layout()
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._owner = True
+        self._cond = (ctx or mp.get_context("spawn")).Condition()
+        self._map()
+        self._header[:] = 0
+        self._table[:] = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def closed(self):
+        return bool(self._header[2])
+
+    @property
+    def dropped(self):
+        return int(self._header[1])
+
+    def depth(self, reader=0):
+        """Published frames `reader` has not taken yet."""
+        with self._cond:
+            return int(np.count_nonzero((self._table["state"] == READY) & (self._table["seq"] > self._cursors[reader])))
+
+    # ---------------- writer ----------------
+    def acquire_write(self, timeout=None):
+        """A slot to fill, or None if the ring is closed or (BLOCK) none freed up within `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self.closed:
+                state = self._table["state"]
+                free = np.flatnonzero(state == FREE)
+                if len(free):
+                    slot = int(free[0])
+                elif self.policy == OVERWRITE:
+                    slot = self._stalest_unread()
+                    if slot is not None:
+                        self._header[1] += 1
+                        QUEUE_DROPPED.labels(queue="frame_ring").inc()
+                else:
+                    slot = None
+                if slot is not None:
+                    state[slot] = WRITING
+                    return FrameSlot(self, slot)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def publish(self, slot, index):
+        """Hand a filled slot to the readers as frame `index`."""
+        with self._cond:
+            row = self._table[slot.slot]
+            self._header[0] += 1
+            row["seq"] = self._header[0]
+            row["index"] = index
+            row["timestamp"] = time.time()
+            row["pending"] = (1 << self.readers) - 1
+            row["state"] = READY
+            self._cond.notify_all()
+
+    def abandon(self, slot):
+        """Give back a slot acquired for writing without publishing it."""
+        with self._cond:
+            self._table["state"][slot.slot] = FREE
+            self._cond.notify_all()
+
+    def write(self, frame, index, timeout=None):
+        """Copy `frame` into the ring (for frames that were not decoded in place); False if not written."""
+        slot = self.acquire_write(timeout)
+        if slot is None:
+            return False
+        slot.frame[...] = frame
+        self.publish(slot, index)
+        return True
+
+    # ---------------- readers ----------------
+    def acquire_read(self, reader=0, timeout=None):
+        """The oldest frame `reader` has not seen, or None on timeout / once closed and drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                table = self._table
+                ready = np.flatnonzero((table["state"] == READY) & (table["seq"] > self._cursors[reader]))
+                if len(ready):
+                    slot = int(ready[np.argmin(table["seq"][ready])])
+                    self._cursors[reader] = table["seq"][slot]
+                    return FrameSlot(self, slot, reader)
+                if self.closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def release(self, slot):
+        """Done with a frame from acquire_read(); its view must not be used afterwards."""
+        with self._cond:
+            row = self._table[slot.slot]
+            bit = 1 << slot.reader
+            if row["state"] != READY or row["seq"] != slot.seq or not row["pending"] & bit:
+                return  # already released
+            row["pending"] &= ~bit
+            if row["pending"] == 0:
+                row["state"] = FREE
+                self._cond.notify_all()
+
+    # ---------------- lifecycle ----------------
+    def close(self):
+        """End of stream: wakes everyone; readers still get the frames already published."""
+        with self._cond:
+            self._header[2] = 1
+            self._cond.notify_all()
+
+    def detach(self):
+        """Unmap this process's view of the ring (frame views taken from it become invalid)."""
+        self._frames = self._table = self._header = self._cursors = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # a caller still holds a frame view; the mapping goes away with the process
+
+    def unlink(self):
+        self.detach()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __getstate__(self):
+        return {"slots": self.slots, "shape": self.shape, "dtype": self.dtype.str, "readers": self.readers,
+                "policy": self.policy, "name": self.name, "cond": self._cond}
+
+    def __setstate__(self, state):
+        self.slots = state["slots"]
+        self.shape = state["shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.readers = state["readers"]
+        self.policy = state["policy"]
+        self._layout()
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner = False
+        self._cond = state["cond"]
+        self._map()
+
+    # ---------------- internals ----------------
+    def _layout(self):
+        # header: published count, dropped count, closed flag, one cursor (last seq taken) per reader
+        self._header_bytes = _aligned((3 + self.readers) * 8)
+        self._slot_bytes = _aligned(int(np.prod(self.shape)) * self.dtype.itemsize)
+        self._table_bytes = _aligned(self.slots * SLOT_DTYPE.itemsize)
+        return self._header_bytes + self._table_bytes + self.slots * self._slot_bytes
+
+    def _map(self):
+        buf = self._shm.buf
+        ints = np.ndarray((3 + self.readers,), np.int64, buf)
+        self._header = ints[:3]
+        self._cursors = ints[3:]
+        self._table = np.ndarray((self.slots,), SLOT_DTYPE, buf, offset=self._header_bytes)
+        frames_at = self._header_bytes + self._table_bytes
+        self._frames = [np.ndarray(self.shape, self.dtype, buf, offset=frames_at + i * self._slot_bytes)
+                        for i in range(self.slots)]
+
+    def _stalest_unread(self):
+        # Oldest published frame no reader is holding: every reader that took it has released it
+        table = self._table
+        candidates = [int(s) for s in np.flatnonzero(table["state"] == READY)
+                      if not any(table["seq"][s] <= self._cursors[r] and table["pending"][s] >> r & 1
+                                 for r in range(self.readers))]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda s: table["seq"][s])
@@ -0,0 +1,174 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from core.metrics.registry import STAGE_SECONDS
+
+# Strides at least this long seek instead of grabbing through the frames in between.
+# A seek lands on the previous keyframe and decodes forward from there, so it only pays
+# off once the stride is longer than a typical GOP (1-2 s of video).
+SEEK_THRESHOLD = 48
+
+_END = object()
+
+
+class FrameSource:
+    """
+    Sequential video reader that only fully decodes the frames someone will look at.
+
+    read() decodes and converts the next frame; grab() advances past it without the
+    colour conversion and copy out of the decoder; skip(n) grabs through short strides
+    and seeks over long ones. `position` is always the 0-based index of the next frame.
+    Time spent in each (stages "decode", "grab" and "seek") goes to STAGE_SECONDS and to
+    `stats`, so decode cost shows up separately from inference.
+
+    frames(stride) iterates (position, frame) over every stride-th frame, optionally
+    prefetched by a background thread; release() stops that thread before closing the
+    capture.
+    """
+
+    def __init__(self, path, start=0, seek_threshold=SEEK_THRESHOLD):
+        self.path = path
+        self.seek_threshold = max(2, int(seek_threshold))
+        self.cap = cv2.VideoCapture(path)
+        self.position = 0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.shape = (int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        self.stats = {"decoded": 0, "grabbed": 0, "seeks": 0,
+                      "decode_seconds": 0.0, "grab_seconds": 0.0, "seek_seconds": 0.0}
+        self._timers = {stage: STAGE_SECONDS.labels(stage=stage) for stage in ("decode", "grab", "seek")}
+        self._prefetch = None  # (stop event, thread) while frames() prefetches
+        if start:
+            self.skip(start)
+
+    @property
+    def opened(self):
+        return self.cap.isOpened()
+
+    def read(self, out=None):
+        """The next frame, decoded to BGR (into `out` if it has the frame's shape); None at the end of the video."""
+        t0 = time.perf_counter()
+        ok, frame = self.cap.read(out)
+        self._count("decode", "decoded", time.perf_counter() - t0, ok)
+        if not ok:
+            return None
+        self.position += 1
+        return frame
+
+    def grab(self):
+        """Advance one frame without converting it; False at the end of the video."""
+        t0 = time.perf_counter()
+        ok = self.cap.grab()
+        self._count("grab", "grabbed", time.perf_counter() - t0, ok)
+        if ok:
+            self.position += 1
+        return ok
+
+    def skip(self, n):
+        """Advance `n` frames without converting any; False if the video ends first."""
+        if n <= 0:
+            return True
+        if n >= self.seek_threshold and self.seek(self.position + n):
+            return True
+        for _ in range(n):
+            if not self.grab():
+                return False
+        return True
+
+    def seek(self, position):
+        """Jump to `position`; False (position unchanged) past the end or on unseekable input."""
+        if self.frame_count > 0 and position >= self.frame_count:
+            return False
+        t0 = time.perf_counter()
+        ok = self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        self._count("seek", "seeks", time.perf_counter() - t0, ok)
+        if ok:
+            self.position = position
+        return ok
+
+    def frames(self, stride=1, end=None, prefetch=0):
+        """
+        (position, frame) for every `stride`-th frame from the current position up to
+        `end` (exclusive). With `prefetch` > 0 a background thread decodes up to that
+        many frames ahead; the source belongs to that thread until the iterator is
+        exhausted, closed or the source released.
+        """
+        stride = max(1, int(stride))
+
+        def produce():
+            while end is None or self.position < end:
+                position = self.position
+                frame = self.read()
+                if frame is None:
+                    return
+                yield position, frame
+                if not self.skip(min(stride - 1, end - self.position) if end is not None else stride - 1):
+                    return
+
+        if prefetch <= 0:
+            return produce()
+        return self._prefetched(produce(), prefetch)
+
+    def release(self):
+        if self._prefetch is not None:
+            stop, thread = self._prefetch
+            stop.set()
+            thread.join()
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _prefetched(self, items, depth):
+        q = queue.Queue(depth)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def work():
+            try:
+                for item in items:
+                    if not put(item):
+                        return
+                put(_END)
+            except Exception as e:  # handed to the consumer
+                put(e)
+
+        thread = threading.Thread(target=work, name="frame-prefetch", daemon=True)
+        self._prefetch = (stop, thread)
+        thread.start()
+        try:
+            while True:
+                try:
+                    item = q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set() and not thread.is_alive():
+                        return  # release() stopped the thread under us
+                    continue
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+            self._prefetch = None
+
+    def _count(self, stage, counter, seconds, ok):
+        self._timers[stage].observe(seconds)
+        self.stats[counter] += int(bool(ok))
+        self.stats[f"{stage}_seconds"] += seconds
@@ -0,0 +1,68 @@
+from core.batch.archive import interval_rows, merge_segments, plan_segments, stitch_tracks
+
+
+def rows(*tracks):
+    return [[obj_id, *box] for obj_id, box in tracks]
+
+
+def moving(x, frame_no):
+    # A 40x40 box drifting right by 2 px per frame
+    return [x + 2 * frame_no, 100, x + 40 + 2 * frame_no, 140]
+
+
+def test_plan_segments_splits_with_overlap():
+    segments = plan_segments(frame_count=100, fps=10, segment_s=4, overlap=5)
+    assert [(s["start"], s["end"], s["head_start"]) for s in segments] == [(0, 40, 0), (40, 80, 35), (80, None, 75)]
+    assert [s["index"] for s in segments] == [0, 1, 2]
+
+
+def test_plan_segments_always_has_one_segment():
+    assert plan_segments(frame_count=0, fps=30) == [{"index": 0, "start": 0, "end": None, "head_start": 0}]
+
+
+def test_stitch_tracks_links_matching_boxes():
+    frames = range(35, 40)
+    tail = [[no, rows((7, moving(0, no)), (8, moving(300, no)))] for no in frames]
+    head = [[no, rows((1, moving(300, no)), (2, moving(0, no)))] for no in frames]
+    assert stitch_tracks(tail, head) == {2: 7, 1: 8}
+
+
+def test_stitch_tracks_ignores_briefly_colocated_tracks():
+    frames = list(range(30, 40))
+    # Earlier track 7 is only near later track 1 on the last frame of the overlap
+    tail = [[no, rows((7, moving(0, no) if no == 39 else moving(500, no)))] for no in frames]
+    head = [[no, rows((1, moving(0, no)))] for no in frames]
+    assert stitch_tracks(tail, head) == {}
+
+
+def test_stitch_tracks_without_shared_frames():
+    assert stitch_tracks([[10, rows((1, moving(0, 10)))]], [[20, rows((1, moving(0, 20)))]]) == {}
+
+
+def segment_results():
+    frames = range(35, 40)
+    first = {"index": 0, "start": 0, "end": 40,
+             "tracks": {"7": [3, 39, 2], "8": [10, 20, 3]},
+             "head": [], "tail": [[no, rows((7, moving(0, no)))] for no in frames], "buckets": {"0": [40, 80, 3, 0]}}
+    second = {"index": 1, "start": 40, "end": 80,
+              "tracks": {"1": [35, 60, 2],   # vehicle 7 continued
+                         "2": [36, 38, 5],   # seen only in the head overlap: the previous segment's
+                         "3": [37, 70, 7]},  # new vehicle already in view during the overlap
+              "head": [[no, rows((1, moving(0, no)), (2, moving(300, no)), (3, moving(600, no)))] for no in frames],
+              "tail": [], "buckets": {"1": [40, 120, 4, 1]}}
+    return [first, second]
+
+
+def test_merge_segments_counts_each_vehicle_once():
+    vehicles, linked = merge_segments(segment_results())
+    assert linked == 1
+    assert sorted(vehicles.values()) == [(3, 2), (10, 3), (40, 7)]
+
+
+def test_merge_segments_dates_new_vehicles_from_their_segment():
+    vehicles, _ = merge_segments(segment_results())
+    # First seen at frame 37 (head overlap) but counted by segment 1, which starts at 40
+    assert (40, 7) in vehicles.values()
+    rows_ = interval_rows(segment_results(), vehicles, fps=10, interval_s=4, bucket_frames=40)
+    assert [r["vehicles"] for r in rows_] == [2, 1]
+    assert rows_[1]["truck"] == 1
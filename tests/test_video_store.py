@@ -0,0 +1,65 @@
+import gc
+import io
+import os
+
+from core.ingest.video_store import VideoStore
+
+
+def upload(store, payload, **kwargs):
+    return store.ingest(io.BytesIO(payload), **kwargs)
+
+
+def age(path, seconds):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def test_ingest_is_content_addressed(tmp_path):
+    store = VideoStore(str(tmp_path))
+    assert upload(store, b"a" * 10) == upload(store, b"a" * 10)
+    assert store.usage() == 10
+
+
+def test_evicts_least_recently_used_past_quota(tmp_path):
+    store = VideoStore(str(tmp_path), quota_bytes=25)
+    old = upload(store, b"a" * 10)
+    recent = upload(store, b"b" * 10)
+    age(old, 100)
+    age(recent, 50)
+    new = upload(store, b"c" * 10)
+    assert not os.path.exists(old)
+    assert os.path.exists(recent) and os.path.exists(new)
+
+
+def test_touch_refreshes_lru_clock(tmp_path):
+    store = VideoStore(str(tmp_path), quota_bytes=25)
+    reused = upload(store, b"a" * 10)
+    other = upload(store, b"b" * 10)
+    age(reused, 100)
+    age(other, 50)
+    store.touch(reused)
+    upload(store, b"c" * 10)
+    assert os.path.exists(reused)
+    assert not os.path.exists(other)
+
+
+def test_leased_videos_are_not_evicted(tmp_path):
+    store = VideoStore(str(tmp_path), quota_bytes=15)
+    path, lease = upload(store, b"a" * 10, lease=True)
+    age(path, 100)
+    upload(store, b"b" * 10)
+    assert os.path.exists(path)
+
+    lease.release()
+    upload(store, b"c" * 10)
+    assert not os.path.exists(path)
+
+
+def test_dropped_lease_no_longer_protects(tmp_path):
+    store = VideoStore(str(tmp_path), quota_bytes=15)
+    path, lease = upload(store, b"a" * 10, lease=True)
+    age(path, 100)
+    del lease
+    gc.collect()
+    upload(store, b"b" * 10)
+    assert not os.path.exists(path)